@@ -0,0 +1 @@
+"""Benchmarks y datos sintéticos para medir el parser e importaciones (no son tests)"""
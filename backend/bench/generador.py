@@ -0,0 +1,188 @@
+"""
+Generador de boletines sintéticos estilo ODEPA para benchmarks (sin red).
+
+Cada versión de formato (ver generar_urls_boletin) usa un layout distinto que
+ejercita un camino del parser:
+- v1: una hoja por categoría y mercado ("Frutas_Lo Valledor"), números como número
+- v2: una hoja por mercado con filas de sección Frutas/Hortalizas, números como texto chileno
+- v3: como v2, con hoja "Resumen", encabezado más abajo y columnas en otro orden
+- v4: hoja única con columna Mercado (camino _parsear_hoja_unica)
+
+    python -m bench.generador /tmp/boletines --version v4 --desde 2024-03-01 --dias 20
+"""
+import argparse
+import io
+import os
+import random
+from datetime import date, timedelta
+
+import openpyxl
+
+VERSIONES = ("v1", "v2", "v3", "v4")
+
+MERCADOS = [
+    "Lo Valledor", "Vega Central Mapocho", "Femacal", "Macroferia Talca",
+    "Vega Monumental Concepción", "Terminal La Palmera",
+]
+FRUTAS = [
+    "Manzana", "Palta", "Naranja", "Limón", "Uva", "Pera", "Kiwi", "Durazno",
+    "Ciruela", "Frutilla", "Mandarina", "Plátano", "Cereza", "Arándano", "Nectarín",
+]
+HORTALIZAS = [
+    "Tomate", "Lechuga", "Papa", "Cebolla", "Zanahoria", "Zapallo Italiano", "Pimentón",
+    "Choclo", "Poroto Verde", "Ajo", "Acelga", "Repollo", "Brócoli", "Coliflor", "Pepino Ensalada",
+]
+VARIEDADES = [None, "Hass", "Fuerte", "Royal Gala", "Fuji", "Granny Smith", "Larga Vida", "Cal Ace"]
+CALIDADES = [None, "Primera", "Segunda", "Tercera", "Extra"]
+UNIDADES = ["$/kilo", "$/caja 18 kilos", "$/bandeja 5 kilos", "$/saco 25 kilos", "$/unidad", "$/paquete"]
+
+_PRODUCTOS_POR_CATEGORIA = {"Frutas": FRUTAS, "Hortalizas": HORTALIZAS}
+
+# Nombre de archivo por versión (mismos patrones que PATRONES_BOLETIN)
+NOMBRES_ARCHIVO = {
+    "v1": "Boletin_Diario_de_Frutas_y_Hortalizas_{yyyymmdd}.xlsx",
+    "v2": "BoletinDiarioFrutas_y_Hortalizas_{ddmmyyyy}.xlsx",
+    "v3": "BoletinDiarioFrutas-y-Hortalizas_{ddmmyyyy}.xlsx",
+    "v4": "BoletinDiarioFrutasHortalizas_{ddmmyyyy}.xlsx",
+}
+
+
+def nombre_archivo(version: str, fecha: date) -> str:
+    return NOMBRES_ARCHIVO[version].format(ddmmyyyy=fecha.strftime("%d%m%Y"), yyyymmdd=fecha.strftime("%Y%m%d"))
+
+
+def _numero_chileno(valor: float) -> str:
+    """1234.5 → '1.234,5'"""
+    entero, _, decimal = f"{valor:,.1f}".partition(".")
+    texto = entero.replace(",", ".")
+    return texto if decimal == "0" else f"{texto},{decimal}"
+
+
+def _fila_datos(rng: random.Random, categoria: str, como_texto: bool) -> list:
+    """Producto, variedad, calidad, unidad, volumen, mínimo, máximo, promedio"""
+    base = rng.uniform(300, 30000)
+    minimo, maximo = round(base * rng.uniform(0.7, 0.95)), round(base * rng.uniform(1.05, 1.4))
+    promedio = round(rng.uniform(minimo, maximo), 1)
+    volumen = rng.choice([0, rng.randint(1, 5000), None])
+    precios = [minimo, maximo, promedio]
+    # Algunas filas sin mínimo/máximo, como en los boletines reales
+    if rng.random() < 0.1:
+        precios[0] = precios[1] = None
+    if como_texto:
+        precios = [_numero_chileno(p) if p is not None else None for p in precios]
+        volumen = _numero_chileno(volumen) if volumen else volumen
+    return [
+        rng.choice(_PRODUCTOS_POR_CATEGORIA[categoria]), rng.choice(VARIEDADES),
+        rng.choice(CALIDADES), rng.choice(UNIDADES), volumen, *precios,
+    ]
+
+
+def _titulo(ws, fecha: date, mercado: str = None, categoria: str = None):
+    ws.append([f"Boletín diario de precios y volúmenes de {categoria.lower() if categoria else 'frutas y hortalizas'}"])
+    ws.append(["Precios con IVA, en pesos chilenos por unidad de comercialización"])
+    if mercado:
+        ws.append([f"Mercado: {mercado}"])
+    ws.append([f"Día: {fecha.strftime('%d/%m/%Y')}"])
+    ws.append([])
+
+
+ENCABEZADO = ["Producto", "Variedad", "Calidad", "Unidad de comercialización",
+              "Volumen", "Precio mínimo", "Precio máximo", "Precio promedio"]
+
+
+def _hojas_v1(wb, rng, fecha, mercados, filas_por_hoja):
+    for categoria in ("Frutas", "Hortalizas"):
+        for mercado in mercados:
+            ws = wb.create_sheet(f"{categoria}_{mercado}"[:31])
+            _titulo(ws, fecha, mercado, categoria)
+            ws.append(ENCABEZADO)
+            for i in range(filas_por_hoja):
+                ws.append(_fila_datos(rng, categoria, como_texto=False))
+            ws.append(["Total", None, None, None, rng.randint(1, 10 ** 5)])
+            ws.append(["Fuente: ODEPA con información de los mercados mayoristas"])
+
+
+def _hojas_v2(wb, rng, fecha, mercados, filas_por_hoja, reordenar: bool = False):
+    encabezado = ["Especie", "Variedad", "Calidad", "Unidad", "Volumen", "Precio mín", "Precio máx", "Promedio ponderado"]
+    # v3: volumen al final y calidad antes que variedad
+    orden = [0, 2, 1, 3, 5, 6, 7, 4] if reordenar else list(range(8))
+    if reordenar:
+        resumen = wb.create_sheet("Resumen")
+        resumen.append(["Resumen del día"])
+        resumen.append(["Mercados informados", len(mercados)])
+    for mercado in mercados:
+        ws = wb.create_sheet(mercado[:31])
+        _titulo(ws, fecha, mercado)
+        if reordenar:
+            for _ in range(3):
+                ws.append([])
+        ws.append([encabezado[i] for i in orden])
+        for categoria in ("Frutas", "Hortalizas"):
+            ws.append([categoria])
+            for _ in range(filas_por_hoja // 2):
+                fila = _fila_datos(rng, categoria, como_texto=True)
+                ws.append([fila[i] for i in orden])
+        ws.append(["Fuente: ODEPA"])
+
+
+def _hoja_unica_v4(wb, rng, fecha, mercados, filas_por_hoja):
+    ws = wb.create_sheet("Hoja1")
+    ws.append([f"Boletín diario de precios {fecha.strftime('%d/%m/%Y')}"])
+    ws.append([])
+    ws.append(["Mercado"] + ENCABEZADO)
+    for categoria in ("Frutas", "Hortalizas"):
+        ws.append([categoria])
+        for _ in range(filas_por_hoja * len(mercados) // 2):
+            ws.append([rng.choice(mercados)] + _fila_datos(rng, categoria, como_texto=False))
+
+
+def generar_boletin(version: str = "v1", fecha: date = date(2024, 3, 4), filas_por_hoja: int = 200,
+                    mercados: int = 4, semilla: int = 0) -> bytes:
+    """Boletín Excel sintético. `filas_por_hoja` son filas de datos por mercado
+    (por categoría en v1); el total crece con `mercados`."""
+    if version not in VERSIONES:
+        raise ValueError(f"Versión desconocida {version!r}, opciones: {VERSIONES}")
+    rng = random.Random(semilla)
+    nombres = MERCADOS[:max(1, min(mercados, len(MERCADOS)))]
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    if version == "v1":
+        _hojas_v1(wb, rng, fecha, nombres, filas_por_hoja)
+    elif version == "v2":
+        _hojas_v2(wb, rng, fecha, nombres, filas_por_hoja)
+    elif version == "v3":
+        _hojas_v2(wb, rng, fecha, nombres, filas_por_hoja, reordenar=True)
+    else:
+        _hoja_unica_v4(wb, rng, fecha, nombres, filas_por_hoja)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.generador",
+                                     description="Generar boletines ODEPA sintéticos en un directorio")
+    parser.add_argument("destino")
+    parser.add_argument("--version", choices=VERSIONES, default="v4")
+    parser.add_argument("--desde", type=date.fromisoformat, default=date(2024, 3, 4))
+    parser.add_argument("--dias", type=int, default=5, help="días hábiles (lunes a viernes) a generar")
+    parser.add_argument("--filas", type=int, default=200, help="filas por hoja")
+    parser.add_argument("--mercados", type=int, default=4)
+    args = parser.parse_args()
+
+    os.makedirs(args.destino, exist_ok=True)
+    fecha, generados = args.desde, 0
+    while generados < args.dias:
+        if fecha.weekday() < 5:
+            contenido = generar_boletin(args.version, fecha, args.filas, args.mercados, semilla=fecha.toordinal())
+            with open(os.path.join(args.destino, nombre_archivo(args.version, fecha)), "wb") as f:
+                f.write(contenido)
+            generados += 1
+        fecha += timedelta(days=1)
+    print(f"{generados} boletines {args.version} en {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
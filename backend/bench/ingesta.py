@@ -0,0 +1,105 @@
+"""
+Benchmark de ingesta sin red: corre el pipeline de importación (descarga → parseo →
+carga en Postgres) contra cassettes grabados con HTTP_TRANSPORT_MODE=record, o contra
+cassettes sintéticos generados aquí, con latencia y errores de red simulados.
+
+    python -m bench.ingesta 2024-03-01 2024-03-31 --sinteticos v4 --latencia-ms 150 --tasa-error 0.05
+    HTTP_CASSETTE_DIR=data/cassettes python -m bench.ingesta 2026-02-02 2026-02-27 --descargas 16
+
+Requiere DATABASE_URL. Importa con forzar y olvida antes el hash de contenido de las
+fechas, así que puede repetirse sobre las mismas fechas y cada corrida vuelve a cargarlas.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+from bench.generador import VERSIONES, generar_boletin, nombre_archivo
+
+
+def _generar_cassettes(fechas: list[date], version: str, filas: int, mercados: int):
+    """Cassettes con un boletín sintético por fecha en la URL del patrón de `version`"""
+    import httpx
+    from src.config import HTTP_CASSETTE_DIR, ODEPA_BASE_URL
+    from src.transporte import guardar_cassette
+
+    for fecha in fechas:
+        url = f"{ODEPA_BASE_URL}/{fecha:%Y}/{fecha:%m}/{nombre_archivo(version, fecha)}"
+        contenido = generar_boletin(version, fecha, filas, mercados, semilla=fecha.toordinal())
+        headers = [
+            ("content-type", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+            ("content-length", str(len(contenido))),
+            ("etag", f'"{fecha:%Y%m%d}-{len(contenido)}"'),
+        ]
+        guardar_cassette(HTTP_CASSETTE_DIR, httpx.Request("GET", url), 200, headers, contenido)
+
+
+async def _correr(fechas: list[date], descargas: int) -> tuple[list[dict], float]:
+    from src.database import init_db, close_db, olvidar_content_hash
+    from src.scraper import crear_pipeline_importacion, importar_fechas, cerrar_pool_parseo, cerrar_http_client
+
+    await init_db()
+    try:
+        # Sin esto, desde la segunda corrida todo terminaría en sin_cambios sin cargar nada
+        await olvidar_content_hash(fechas)
+        inicio = time.monotonic()
+        resultados = await importar_fechas(fechas, forzar=True, pipeline=crear_pipeline_importacion(descargas=descargas))
+        return resultados, time.monotonic() - inicio
+    finally:
+        cerrar_pool_parseo()
+        await cerrar_http_client()
+        await close_db()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.ingesta", description="Benchmark del pipeline de importación en replay")
+    parser.add_argument("desde", type=date.fromisoformat)
+    parser.add_argument("hasta", type=date.fromisoformat)
+    parser.add_argument("--descargas", type=int, default=None, help="descargas simultáneas (por defecto IMPORT_DESCARGAS)")
+    parser.add_argument("--sinteticos", choices=VERSIONES, help="generar antes cassettes sintéticos con este formato")
+    parser.add_argument("--filas", type=int, default=200)
+    parser.add_argument("--mercados", type=int, default=6)
+    parser.add_argument("--latencia-ms", type=float)
+    parser.add_argument("--jitter-ms", type=float)
+    parser.add_argument("--bytes-seg", type=float)
+    parser.add_argument("--tasa-error", type=float)
+    parser.add_argument("--tasa-5xx", type=float)
+    args = parser.parse_args(argv)
+
+    # La configuración se lee al importar src.config: fijarla antes de importar
+    os.environ["HTTP_TRANSPORT_MODE"] = "replay"
+    os.environ["RAW_STORE_DIR"] = ""  # que cada boletín pase por el transporte, no por el almacén
+    for opcion, variable in (("latencia_ms", "HTTP_REPLAY_LATENCIA_MS"), ("jitter_ms", "HTTP_REPLAY_JITTER_MS"),
+                             ("bytes_seg", "HTTP_REPLAY_BYTES_SEG"), ("tasa_error", "HTTP_REPLAY_TASA_ERROR"),
+                             ("tasa_5xx", "HTTP_REPLAY_TASA_5XX")):
+        if getattr(args, opcion) is not None:
+            os.environ[variable] = str(getattr(args, opcion))
+
+    from src.calendario import dias_habiles
+    from src.config import IMPORT_DESCARGAS
+    from src.transporte import estadisticas
+
+    fechas = dias_habiles(args.desde, args.hasta)
+    if args.sinteticos:
+        _generar_cassettes(fechas, args.sinteticos, args.filas, args.mercados)
+    descargas = args.descargas or IMPORT_DESCARGAS
+
+    resultados, segundos = asyncio.run(_correr(fechas, descargas))
+    por_estado: dict[str, int] = {}
+    for r in resultados:
+        por_estado[r["estado"]] = por_estado.get(r["estado"], 0) + 1
+    registros = sum(r["registros"] for r in resultados)
+    print(f"{len(fechas)} boletines en {segundos:.2f}s con {descargas} descargas simultáneas: "
+          f"{len(fechas) / segundos:.2f} boletines/s, {registros / segundos:,.0f} registros/s")
+    print(f"Estados: {por_estado}")
+    print(f"Transporte: {estadisticas}")
+    if registros == 0:
+        print("Error: no se cargó ningún registro, el benchmark no midió la carga", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
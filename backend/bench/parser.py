@@ -0,0 +1,205 @@
+"""
+Micro-benchmark del parser de boletines sobre libros sintéticos (bench.generador).
+
+Por cada camino del parser reporta throughput (filas/s u operaciones/s, mejor de N
+repeticiones), pico de memoria asignada y bloques vivos del resultado (tracemalloc, en una
+corrida aparte para no distorsionar los tiempos) y pico de RSS del proceso. Cada
+caso corre en un proceso nuevo para que el RSS de uno no contamine al siguiente.
+
+    python -m bench.parser                      # correr y comparar con baseline_parser.json
+    python -m bench.parser --guardar            # correr y reescribir la baseline
+    python -m bench.parser --casos parsear_lote --repeticiones 10
+
+Con baseline, termina con código 1 si algún caso pierde más de --tolerancia de
+throughput o sube su pico de memoria en más de esa fracción. Los tiempos dependen
+de la máquina: la baseline sirve para comparar en el mismo equipo.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from multiprocessing import get_context
+
+from bench.generador import VERSIONES, generar_boletin
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline_parser.json")
+FECHA = date(2024, 3, 4)
+
+# Valores de celda representativos para _limpiar_numero
+VALORES_NUMERO = [
+    12500, 3490.5, 0, None, "12.500", "1.234,5", " 980 ", "$ 4.200", "-", "s/i", "0", "25.000,75",
+]
+
+
+def _libros(filas: int, mercados: int) -> dict[str, bytes]:
+    return {v: generar_boletin(v, FECHA, filas, mercados) for v in VERSIONES}
+
+
+def _caso_parsear_lote(contenido: bytes) -> tuple[int, str, object]:
+    from src.scraper import parsear_lote
+    lote = parsear_lote(contenido, FECHA)
+    return len(lote), "filas", lote
+
+
+def _caso_parsear_excel(contenido: bytes) -> tuple[int, str, object]:
+    from src.scraper import parsear_excel
+    registros = parsear_excel(contenido, FECHA)
+    return len(registros), "filas", registros
+
+
+def _cabeceras(libros: dict[str, bytes]) -> list[list[tuple]]:
+    """Primeras filas de cada hoja de datos de cada libro, como las ve _detectar_columnas"""
+    import io
+    import openpyxl
+    from src.scraper import FILAS_CABECERA
+
+    bloques = []
+    for contenido in libros.values():
+        wb = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
+        for ws in wb.worksheets:
+            bloques.append(list(ws.iter_rows(max_row=FILAS_CABECERA, values_only=True)))
+        wb.close()
+    return bloques
+
+
+def _caso_detectar_columnas(bloques: list[list[tuple]], vueltas: int = 200) -> tuple[int, str, object]:
+    from src.scraper import _detectar_columnas
+    for _ in range(vueltas):
+        for filas in bloques:
+            _detectar_columnas(filas)
+    return vueltas * len(bloques), "hojas", None
+
+
+def _caso_limpiar_numero(_=None, vueltas: int = 20000) -> tuple[int, str, object]:
+    from src.scraper import _limpiar_numero
+    for _ in range(vueltas):
+        for valor in VALORES_NUMERO:
+            _limpiar_numero(valor)
+    return vueltas * len(VALORES_NUMERO), "valores", None
+
+
+# Casos: nombre → función; cada función devuelve (cantidad procesada, unidad, resultado)
+CASOS = {
+    **{f"parsear_lote/{v}": _caso_parsear_lote for v in VERSIONES},
+    **{f"parsear_excel/{v}": _caso_parsear_excel for v in VERSIONES},
+    "_detectar_columnas": _caso_detectar_columnas,
+    "_limpiar_numero": _caso_limpiar_numero,
+}
+
+
+def _argumento(nombre: str, filas: int, mercados: int):
+    """Entrada del caso, preparada fuera de la medición"""
+    if nombre.startswith("parsear_"):
+        return generar_boletin(nombre.split("/")[1], FECHA, filas, mercados)
+    if nombre == "_detectar_columnas":
+        return _cabeceras(_libros(filas, mercados))
+    return None
+
+
+def _medir(nombre: str, repeticiones: int, filas: int, mercados: int) -> dict:
+    """Corre en un proceso hijo: tiempos, luego una corrida con tracemalloc, luego RSS"""
+    funcion, argumento = CASOS[nombre], _argumento(nombre, filas, mercados)
+
+    funcion(argumento)  # calentar imports y cachés
+    mejor, cantidad, unidad = float("inf"), 0, ""
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cantidad, unidad, _ = funcion(argumento)
+        mejor = min(mejor, time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    resultado = funcion(argumento)
+    _, pico = tracemalloc.get_traced_memory()
+    # Con el resultado todavía vivo: cuántos objetos deja el parser para la carga
+    bloques = sum(s.count for s in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del resultado
+
+    return {
+        "unidad": unidad,
+        "cantidad": cantidad,
+        "seg": round(mejor, 5),
+        "por_seg": round(cantidad / mejor, 1),
+        "pico_kib": round(pico / 1024, 1),
+        "bloques_vivos": bloques,
+        # ru_maxrss está en KiB en Linux y en bytes en macOS
+        "rss_pico_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+    }
+
+
+def correr(casos: list[str], repeticiones: int, filas: int, mercados: int) -> dict:
+    resultados = {}
+    ctx = get_context("spawn")
+    for nombre in casos:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            resultados[nombre] = pool.submit(_medir, nombre, repeticiones, filas, mercados).result()
+        r = resultados[nombre]
+        print(f"{nombre:<24} {r['por_seg']:>12,.0f} {r['unidad']}/s  "
+              f"pico {r['pico_kib']:>9,.1f} KiB  bloques {r['bloques_vivos']:>7,}  "
+              f"RSS {r['rss_pico_kib'] / 1024:>6.1f} MiB")
+    return resultados
+
+
+def comparar(resultados: dict, baseline: dict, tolerancia: float) -> list[str]:
+    """Regresiones respecto de la baseline (throughput o pico de memoria fuera de tolerancia)"""
+    regresiones = []
+    for nombre, r in resultados.items():
+        base = baseline.get("casos", {}).get(nombre)
+        if base is None:
+            continue
+        if r["por_seg"] < base["por_seg"] * (1 - tolerancia):
+            regresiones.append(f"{nombre}: throughput {r['por_seg']:,.0f} < baseline {base['por_seg']:,.0f} {r['unidad']}/s")
+        if r["pico_kib"] > base["pico_kib"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: pico {r['pico_kib']:,.1f} > baseline {base['pico_kib']:,.1f} KiB")
+    return regresiones
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench.parser", description="Benchmark del parser de boletines")
+    parser.add_argument("--casos", default="", help="correr sólo los casos que contienen este texto")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--filas", type=int, default=250, help="filas por hoja del libro sintético")
+    parser.add_argument("--mercados", type=int, default=6)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--guardar", action="store_true", help="escribir los resultados como nueva baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    casos = [c for c in CASOS if args.casos in c]
+    resultados = correr(casos, args.repeticiones, args.filas, args.mercados)
+
+    if args.guardar:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "maquina": platform.machine(),
+                         "filas": args.filas, "mercados": args.mercados, "repeticiones": args.repeticiones},
+                "casos": resultados,
+            }, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Baseline guardada en {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Sin baseline: correr con --guardar para crearla")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    meta = baseline.get("meta", {})
+    if (meta.get("filas"), meta.get("mercados")) != (args.filas, args.mercados):
+        print(f"Aviso: la baseline se midió con filas={meta.get('filas')} mercados={meta.get('mercados')}")
+    regresiones = comparar(resultados, baseline, args.tolerancia)
+    for r in regresiones:
+        print(f"REGRESIÓN {r}")
+    if not regresiones:
+        print(f"Sin regresiones respecto de la baseline (tolerancia {args.tolerancia:.0%})")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Backfill offline: cargar en Postgres un directorio o archivo .zip de boletines Excel
+sin levantar la API ni el scheduler, y sin depender de ODEPA.
+
+    python -m src.backfill /ruta/boletines [--workers N] [--forzar]
+    python -m src.backfill boletines.zip
+
+La fecha de cada boletín se toma del nombre del archivo (DDMMYYYY o YYYYMMDD) o, en
+el almacén local (data/boletines/YYYY/MM/YYYY-MM-DD/<sha256>.xlsx), del directorio.
+Los archivos se parsean en paralelo en todos los núcleos con las reglas de parsear_excel.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import zipfile
+from datetime import date
+from typing import Callable, Optional
+
+logger = logging.getLogger("agroprice.backfill")
+
+
+def _fecha_de_ruta(ruta: str) -> Optional[date]:
+    """Fecha del boletín: del directorio YYYY-MM-DD (almacén local) o del nombre del archivo"""
+    from src.scraper import fecha_de_archivo
+
+    directorio = os.path.basename(os.path.dirname(ruta))
+    try:
+        return date.fromisoformat(directorio)
+    except ValueError:
+        return fecha_de_archivo(ruta)
+
+
+def _lector_archivo(ruta: str) -> Callable[[], bytes]:
+    def leer() -> bytes:
+        with open(ruta, "rb") as f:
+            return f.read()
+    return leer
+
+
+def _lector_zip(ruta_zip: str, miembro: str) -> Callable[[], bytes]:
+    def leer() -> bytes:
+        # Un ZipFile por lectura: las lecturas corren en threads en paralelo
+        with zipfile.ZipFile(ruta_zip) as z:
+            return z.read(miembro)
+    return leer
+
+
+def buscar_boletines(origen: str) -> dict[date, Callable[[], bytes]]:
+    """Boletines (.xlsx) de un directorio (recursivo) o de un .zip, por fecha.
+    Si hay varios archivos para una fecha, gana el último por nombre."""
+    if zipfile.is_zipfile(origen):
+        with zipfile.ZipFile(origen) as z:
+            candidatos = [(m, _lector_zip(origen, m)) for m in z.namelist() if m.lower().endswith(".xlsx")]
+    elif os.path.isdir(origen):
+        candidatos = [
+            (os.path.join(raiz, nombre), _lector_archivo(os.path.join(raiz, nombre)))
+            for raiz, _, nombres in os.walk(origen)
+            for nombre in nombres if nombre.lower().endswith(".xlsx")
+        ]
+    else:
+        raise ValueError(f"{origen} no es un directorio ni un archivo .zip")
+
+    boletines: dict[date, Callable[[], bytes]] = {}
+    for ruta, leer in sorted(candidatos, key=lambda c: c[0]):
+        fecha = _fecha_de_ruta(ruta)
+        if fecha is None:
+            logger.warning(f"Sin fecha reconocible en el nombre, se omite: {ruta}")
+            continue
+        if fecha in boletines:
+            logger.warning(f"Más de un archivo para {fecha}, se usa {ruta}")
+        boletines[fecha] = leer
+    return boletines
+
+
+async def backfill(origen: str, forzar: bool = False, lectores: int = 4) -> list[dict]:
+    from src.database import init_db, close_db
+    from src.scraper import crear_pipeline_importacion, importar_archivos, cerrar_pool_parseo
+
+    boletines = buscar_boletines(origen)
+    if not boletines:
+        logger.warning(f"No se encontraron boletines en {origen}")
+        return []
+    fechas = sorted(boletines)
+    logger.info(f"Backfill: {len(boletines)} boletines ({fechas[0]} → {fechas[-1]}) desde {origen}")
+
+    await init_db()
+    try:
+        pipeline = crear_pipeline_importacion(descargas=lectores)
+        return await importar_archivos(boletines, forzar=forzar, pipeline=pipeline)
+    finally:
+        cerrar_pool_parseo()
+        await close_db()
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.backfill",
+        description="Cargar boletines Excel de ODEPA desde un directorio o .zip, sin la API",
+    )
+    parser.add_argument("origen", help="directorio (se recorre recursivamente) o archivo .zip con boletines .xlsx")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="procesos de parseo (por defecto, todos los núcleos)")
+    parser.add_argument("--lectores", type=int, default=4, help="archivos leídos en paralelo")
+    parser.add_argument("--forzar", action="store_true",
+                        help="re-cargar fechas ya importadas (las idénticas se saltan por hash)")
+    args = parser.parse_args(argv)
+
+    # La configuración se lee al importar src.config: fijar el pool antes de importar
+    os.environ["PARSE_WORKERS"] = str(max(1, args.workers))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    inicio = time.monotonic()
+    resultados = asyncio.run(backfill(args.origen, forzar=args.forzar, lectores=args.lectores))
+
+    por_estado: dict[str, int] = {}
+    for r in resultados:
+        por_estado[r["estado"]] = por_estado.get(r["estado"], 0) + 1
+    registros = sum(r["registros"] for r in resultados if r["estado"] == "ok")
+    logger.info(f"Backfill completado en {time.monotonic() - inicio:.1f}s: {por_estado}, {registros} registros")
+    return 1 if por_estado.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
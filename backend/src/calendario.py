@@ -0,0 +1,106 @@
+"""
+Calendario de días hábiles de Chile: fines de semana y feriados legales nacionales.
+ODEPA no publica boletín en feriados, así que las importaciones masivas no los intentan.
+Feriados no previsibles (elecciones, feriados decretados) quedan cubiertos por el
+caché negativo de boletines no disponibles en `importaciones`.
+"""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+ZONA_CHILE = ZoneInfo("America/Santiago")
+
+# Solsticio de invierno (Día de los Pueblos Indígenas, desde 2021), hora de Chile
+_SOLSTICIO_JUNIO = {
+    2021: 21, 2022: 21, 2023: 21, 2024: 20, 2025: 20, 2026: 21,
+    2027: 21, 2028: 20, 2029: 20, 2030: 21,
+}
+
+
+def _domingo_pascua(anio: int) -> date:
+    """Domingo de Pascua (algoritmo de Butcher, calendario gregoriano)"""
+    a = anio % 19
+    b, c = divmod(anio, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(anio, mes, dia + 1)
+
+
+def _trasladar_a_lunes(fecha: date) -> date:
+    """Ley 19.668: si cae martes, miércoles o jueves se corre al lunes anterior;
+    si cae viernes, al lunes siguiente"""
+    dia = fecha.weekday()
+    if dia in (1, 2, 3):
+        return fecha - timedelta(days=dia)
+    if dia == 4:
+        return fecha + timedelta(days=3)
+    return fecha
+
+
+@lru_cache(maxsize=None)
+def feriados(anio: int) -> dict[date, str]:
+    """Feriados nacionales de un año: {fecha: nombre}"""
+    pascua = _domingo_pascua(anio)
+    dias = {
+        date(anio, 1, 1): "Año Nuevo",
+        pascua - timedelta(days=2): "Viernes Santo",
+        pascua - timedelta(days=1): "Sábado Santo",
+        date(anio, 5, 1): "Día del Trabajo",
+        date(anio, 5, 21): "Día de las Glorias Navales",
+        _trasladar_a_lunes(date(anio, 6, 29)): "San Pedro y San Pablo",
+        date(anio, 8, 15): "Asunción de la Virgen",
+        date(anio, 9, 18): "Independencia Nacional",
+        date(anio, 9, 19): "Día de las Glorias del Ejército",
+        _trasladar_a_lunes(date(anio, 10, 12)): "Encuentro de Dos Mundos",
+        date(anio, 11, 1): "Día de Todos los Santos",
+        date(anio, 12, 8): "Inmaculada Concepción",
+        date(anio, 12, 25): "Navidad",
+    }
+    if anio >= 2021:
+        dias[date(anio, 6, _SOLSTICIO_JUNIO.get(anio, 21))] = "Día de los Pueblos Indígenas"
+    if anio >= 2007:
+        dias[date(anio, 7, 16)] = "Virgen del Carmen"
+        # Puentes de Fiestas Patrias
+        if date(anio, 9, 17).weekday() == 0:
+            dias[date(anio, 9, 17)] = "Fiestas Patrias"
+        if date(anio, 9, 20).weekday() == 4:
+            dias[date(anio, 9, 20)] = "Fiestas Patrias"
+    if anio >= 2008:
+        # Ley 20.299: martes → viernes anterior, miércoles → viernes siguiente
+        evangelicas = date(anio, 10, 31)
+        if evangelicas.weekday() == 1:
+            evangelicas = date(anio, 10, 27)
+        elif evangelicas.weekday() == 2:
+            evangelicas = date(anio, 11, 2)
+        dias[evangelicas] = "Día de las Iglesias Evangélicas"
+    return dias
+
+
+def ahora_chile() -> datetime:
+    return datetime.now(ZONA_CHILE)
+
+
+def es_feriado(fecha: date) -> bool:
+    return fecha in feriados(fecha.year)
+
+
+def es_dia_habil(fecha: date) -> bool:
+    """Lunes a viernes que no sea feriado"""
+    return fecha.weekday() < 5 and not es_feriado(fecha)
+
+
+def dias_habiles(fecha_inicio: date, fecha_fin: date) -> list[date]:
+    """Días hábiles del rango, ambos extremos incluidos"""
+    fechas = []
+    f = fecha_inicio
+    while f <= fecha_fin:
+        if es_dia_habil(f):
+            fechas.append(f)
+        f += timedelta(days=1)
+    return fechas
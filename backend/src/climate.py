@@ -5,6 +5,10 @@ Datos climáticos se obtienen automáticamente de Open-Meteo (gratis, sin API ke
 import httpx
 import logging
 from datetime import date, timedelta
+from typing import Optional
+
+from src.database import promedio_agregado
+from src.transporte import crear_transporte
 
 logger = logging.getLogger("agroprice.climate")
 
@@ -16,6 +20,28 @@ def _get_pool():
         raise RuntimeError("Pool de base de datos no inicializado. Esperar a que init_db() termine.")
     return pool
 
+
+# ============== CLIENTE HTTP ==============
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido para Open-Meteo (un solo transporte: en replay, la
+    latencia y los errores simulados siguen una única secuencia en vez de repetirse)"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=30, transport=crear_transporte())
+    return _http_client
+
+
+async def cerrar_http_client():
+    """Cerrar el cliente HTTP compartido"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 # ============== ZONAS DE PRODUCCIÓN ==============
 
 ZONAS = [
@@ -158,10 +184,9 @@ async def fetch_clima_openmeteo(zona_id: int, lat: float, lon: float,
         "timezone": "America/Santiago"
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(OPEN_METEO_URL, params=params)
-        resp.raise_for_status()
-        data = resp.json()
+    resp = await get_http_client().get(OPEN_METEO_URL, params=params)
+    resp.raise_for_status()
+    data = resp.json()
 
     daily = data.get("daily", {})
     fechas = daily.get("time", [])
@@ -233,7 +258,7 @@ async def importar_clima_historico(fecha_inicio: date = None, fecha_fin: date =
         zonas = await conn.fetch("SELECT id, nombre, latitud, longitud FROM zonas_produccion")
 
         if fecha_inicio is None:
-            row = await conn.fetchrow("SELECT MIN(fecha) as min_fecha FROM precios")
+            row = await conn.fetchrow("SELECT MIN(fecha) as min_fecha FROM fechas_precios")
             if row and row["min_fecha"]:
                 fecha_inicio = row["min_fecha"]
             else:
@@ -405,16 +430,17 @@ async def get_clima_precio_serie(producto: str, mercado: str = None,
                 params.append(mercado)
 
             precios = await conn.fetch(f"""
-                SELECT p.fecha, ROUND(AVG(p.precio_promedio)::numeric, 0) as precio
-                FROM precios p
-                JOIN productos pr ON p.producto_id = pr.id
-                JOIN mercados m ON p.mercado_id = m.id
+                SELECT a.periodo as fecha,
+                       {promedio_agregado("promedio")} as precio
+                FROM precios_diarios a
+                JOIN productos pr ON a.producto_id = pr.id
+                JOIN mercados m ON a.mercado_id = m.id
                 WHERE pr.nombre = $1
-                AND p.fecha >= $2
-                AND p.precio_promedio IS NOT NULL
+                AND a.periodo >= $2
                 {mercado_filter}
-                GROUP BY p.fecha
-                ORDER BY p.fecha
+                GROUP BY a.periodo
+                HAVING SUM(a.n_promedio) > 0
+                ORDER BY a.periodo
             """, *params)
         except Exception as e:
             logger.error(f"Error consultando precios de {producto}: {e}")
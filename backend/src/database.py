@@ -1,9 +1,12 @@
 import asyncpg
+import json
 import logging
-from datetime import date, datetime
+import time
+from datetime import date, datetime, timedelta
 from typing import Optional
 
 from src.config import DATABASE_URL
+from src.lote import LoteRegistros
 
 logger = logging.getLogger("agroprice.database")
 
@@ -33,20 +36,96 @@ async def init_db():
                 UNIQUE(nombre, categoria)
             );
 
-            CREATE TABLE IF NOT EXISTS precios (
+            -- Serie de precios: un producto en un mercado con un formato (variedad, calidad,
+            -- unidad). precios la referencia con serie_id en vez de la clave compuesta.
+            CREATE TABLE IF NOT EXISTS series (
                 id SERIAL PRIMARY KEY,
-                fecha DATE NOT NULL,
-                mercado_id INTEGER REFERENCES mercados(id),
                 producto_id INTEGER REFERENCES productos(id),
+                mercado_id INTEGER REFERENCES mercados(id),
                 variedad TEXT,
                 calidad TEXT,
                 unidad TEXT,
+                CONSTRAINT uq_serie UNIQUE NULLS NOT DISTINCT (producto_id, mercado_id, variedad, calidad, unidad)
+            );
+
+            -- Catálogo de series, mantenido en cada carga (ver insertar_precios)
+            ALTER TABLE series ADD COLUMN IF NOT EXISTS primera_fecha DATE;
+            ALTER TABLE series ADD COLUMN IF NOT EXISTS ultima_fecha DATE;
+            ALTER TABLE series ADD COLUMN IF NOT EXISTS observaciones INTEGER NOT NULL DEFAULT 0;
+            ALTER TABLE series ADD COLUMN IF NOT EXISTS ultimo_precio REAL;
+
+            -- Calendario de fechas con precios y cuántos registros tiene cada una
+            CREATE TABLE IF NOT EXISTS fechas_precios (
+                fecha DATE PRIMARY KEY,
+                registros INTEGER NOT NULL DEFAULT 0
+            );
+
+            -- Agregados de precios (ver _recalcular_agregados): sumas y conteos no nulos
+            -- por período, para promediar sin leer precios
+            CREATE TABLE IF NOT EXISTS precios_diarios (
+                producto_id INTEGER NOT NULL REFERENCES productos(id),
+                mercado_id INTEGER NOT NULL REFERENCES mercados(id),
+                periodo DATE NOT NULL,
+                registros INTEGER NOT NULL,
+                suma_promedio DOUBLE PRECISION, n_promedio INTEGER NOT NULL,
+                suma_min DOUBLE PRECISION, n_min INTEGER NOT NULL,
+                suma_max DOUBLE PRECISION, n_max INTEGER NOT NULL,
+                suma_volumen DOUBLE PRECISION, n_volumen INTEGER NOT NULL,
+                PRIMARY KEY (producto_id, mercado_id, periodo)
+            );
+            CREATE TABLE IF NOT EXISTS precios_semanales (
+                serie_id INTEGER NOT NULL REFERENCES series(id),
+                periodo DATE NOT NULL,
+                registros INTEGER NOT NULL,
+                suma_promedio DOUBLE PRECISION, n_promedio INTEGER NOT NULL,
+                suma_min DOUBLE PRECISION, n_min INTEGER NOT NULL,
+                suma_max DOUBLE PRECISION, n_max INTEGER NOT NULL,
+                suma_volumen DOUBLE PRECISION, n_volumen INTEGER NOT NULL,
+                PRIMARY KEY (serie_id, periodo)
+            );
+            CREATE TABLE IF NOT EXISTS precios_mensuales (
+                serie_id INTEGER NOT NULL REFERENCES series(id),
+                periodo DATE NOT NULL,
+                registros INTEGER NOT NULL,
+                suma_promedio DOUBLE PRECISION, n_promedio INTEGER NOT NULL,
+                suma_min DOUBLE PRECISION, n_min INTEGER NOT NULL,
+                suma_max DOUBLE PRECISION, n_max INTEGER NOT NULL,
+                suma_volumen DOUBLE PRECISION, n_volumen INTEGER NOT NULL,
+                PRIMARY KEY (serie_id, periodo)
+            );
+            -- Mín, máx y volumen sólo de filas con precio promedio (ver MEDIDAS_AGREGADAS)
+            ALTER TABLE precios_diarios
+                ADD COLUMN IF NOT EXISTS suma_min_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_min_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_max_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_max_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_volumen_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_volumen_valido INTEGER;
+            ALTER TABLE precios_semanales
+                ADD COLUMN IF NOT EXISTS suma_min_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_min_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_max_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_max_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_volumen_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_volumen_valido INTEGER;
+            ALTER TABLE precios_mensuales
+                ADD COLUMN IF NOT EXISTS suma_min_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_min_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_max_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_max_valido INTEGER,
+                ADD COLUMN IF NOT EXISTS suma_volumen_valido DOUBLE PRECISION, ADD COLUMN IF NOT EXISTS n_volumen_valido INTEGER;
+            CREATE INDEX IF NOT EXISTS idx_precios_diarios_periodo ON precios_diarios(periodo);
+            CREATE INDEX IF NOT EXISTS idx_precios_semanales_periodo ON precios_semanales(periodo);
+            CREATE INDEX IF NOT EXISTS idx_precios_mensuales_periodo ON precios_mensuales(periodo);
+
+            -- Última observación de cada serie (la fila de precios en series.ultima_fecha)
+            CREATE TABLE IF NOT EXISTS precios_ultimos (
+                serie_id INTEGER PRIMARY KEY REFERENCES series(id),
+                producto_id INTEGER NOT NULL REFERENCES productos(id),
+                mercado_id INTEGER NOT NULL REFERENCES mercados(id),
+                fecha DATE NOT NULL,
                 precio_min REAL,
                 precio_max REAL,
                 precio_promedio REAL,
                 volumen REAL
             );
+            CREATE INDEX IF NOT EXISTS idx_precios_ultimos_fecha ON precios_ultimos(fecha);
 
+        """)
+        await conn.execute(SQL_TABLA_PRECIOS)
+        await conn.execute("""
             -- Migración: agregar calidad si no existe
             DO $$ BEGIN
                 ALTER TABLE precios ADD COLUMN IF NOT EXISTS calidad TEXT;
@@ -56,7 +135,7 @@ async def init_db():
             -- Crear unique constraint si no existe
             DO $$ BEGIN
                 IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'uq_precio_completo'
+                    SELECT 1 FROM pg_constraint WHERE conname IN ('uq_precio_completo', 'uq_precio_serie')
                 ) THEN
                     -- Eliminar constraint vieja si existe
                     BEGIN
@@ -64,7 +143,29 @@ async def init_db():
                     EXCEPTION WHEN undefined_object THEN NULL;
                     END;
                     ALTER TABLE precios ADD CONSTRAINT uq_precio_completo
-                        UNIQUE(fecha, mercado_id, producto_id, variedad, calidad, unidad);
+                        UNIQUE NULLS NOT DISTINCT (fecha, mercado_id, producto_id, variedad, calidad, unidad);
+                END IF;
+            END $$;
+
+            -- Migración: la clave única debe tratar NULL como igual (variedad/calidad/unidad
+            -- vacías). Antes esas filas nunca chocaban y se duplicaban en cada re-importación.
+            DO $$ BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_constraint c JOIN pg_index i ON i.indexrelid = c.conindid
+                    WHERE c.conname = 'uq_precio_completo' AND NOT i.indnullsnotdistinct
+                ) THEN
+                    DELETE FROM precios WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (
+                                PARTITION BY fecha, mercado_id, producto_id, variedad, calidad, unidad
+                                ORDER BY id DESC
+                            ) AS rn
+                            FROM precios
+                        ) t WHERE rn > 1
+                    );
+                    ALTER TABLE precios DROP CONSTRAINT uq_precio_completo;
+                    ALTER TABLE precios ADD CONSTRAINT uq_precio_completo
+                        UNIQUE NULLS NOT DISTINCT (fecha, mercado_id, producto_id, variedad, calidad, unidad);
                 END IF;
             END $$;
 
@@ -77,12 +178,50 @@ async def init_db():
                 detalle TEXT
             );
 
-            CREATE INDEX IF NOT EXISTS idx_precios_fecha ON precios(fecha);
-            CREATE INDEX IF NOT EXISTS idx_precios_mercado ON precios(mercado_id);
-            CREATE INDEX IF NOT EXISTS idx_precios_producto ON precios(producto_id);
-            CREATE INDEX IF NOT EXISTS idx_precios_fecha_mercado ON precios(fecha, mercado_id);
-            CREATE INDEX IF NOT EXISTS idx_precios_fecha_producto ON precios(fecha, producto_id);
-            CREATE INDEX IF NOT EXISTS idx_precios_producto_formato ON precios(producto_id, variedad, calidad, unidad);
+            -- Detección de cambios en re-importaciones
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS content_hash TEXT;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS insertados INTEGER;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS actualizados INTEGER;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS sin_cambios INTEGER;
+
+            -- Métricas por etapa (segundos, bytes, filas) para diagnosticar importaciones lentas
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS patron_url TEXT;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS bytes INTEGER;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS t_descarga REAL;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS t_parseo REAL;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS filas_parseadas INTEGER;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS t_dimensiones REAL;
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS t_insercion REAL;
+
+            -- Caché negativo: cuándo re-intentar un boletín no disponible reciente
+            ALTER TABLE importaciones ADD COLUMN IF NOT EXISTS reintentar_despues TIMESTAMP;
+
+            -- Cola durable de importaciones masivas: un job por rango, un ítem por fecha
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                id SERIAL PRIMARY KEY,
+                fecha_inicio DATE NOT NULL,
+                fecha_fin DATE NOT NULL,
+                forzar BOOLEAN NOT NULL DEFAULT FALSE,
+                reparsear BOOLEAN NOT NULL DEFAULT FALSE,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                creado TIMESTAMP DEFAULT NOW(),
+                terminado TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS import_job_items (
+                job_id INTEGER NOT NULL REFERENCES import_jobs(id) ON DELETE CASCADE,
+                fecha DATE NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                registros INTEGER DEFAULT 0,
+                intentos INTEGER DEFAULT 0,
+                worker TEXT,
+                tomado TIMESTAMP,
+                terminado TIMESTAMP,
+                PRIMARY KEY (job_id, fecha)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_import_job_items_activos
+                ON import_job_items(job_id, fecha) WHERE estado IN ('pendiente', 'en_curso');
 
             -- Tablas de clima
             CREATE TABLE IF NOT EXISTS zonas_produccion (
@@ -119,9 +258,354 @@ async def init_db():
 
             CREATE INDEX IF NOT EXISTS idx_clima_zona_fecha ON clima_diario(zona_id, fecha);
         """)
+
+        await _migrar_precios_series(conn)
+        await _migrar_precios_particionado(conn)
+        await conn.execute(SQL_INDICES_PRECIOS)
+        await _inicializar_catalogo(conn)
+        await _inicializar_agregados(conn)
+        hoy = date.today()
+        await asegurar_particiones(conn, hoy, _sumar_meses(hoy, PARTICIONES_MESES_ADELANTE))
     logger.info("Base de datos inicializada correctamente")
 
 
+# ============== PARTICIONES DE PRECIOS ==============
+# precios está particionada por mes (precios_YYYY_MM): las consultas acotadas por fecha
+# sólo leen las particiones del rango y los índices de cada partición no crecen con
+# la historia. La clave primaria y la única incluyen fecha (requisito de Postgres).
+
+SQL_TABLA_PRECIOS = """
+    CREATE SEQUENCE IF NOT EXISTS precios_id_seq;
+
+    CREATE TABLE IF NOT EXISTS precios (
+        id INTEGER NOT NULL DEFAULT nextval('precios_id_seq'),
+        fecha DATE NOT NULL,
+        mercado_id INTEGER REFERENCES mercados(id),
+        producto_id INTEGER REFERENCES productos(id),
+        variedad TEXT,
+        calidad TEXT,
+        unidad TEXT,
+        precio_min REAL,
+        precio_max REAL,
+        precio_promedio REAL,
+        volumen REAL,
+        serie_id INTEGER NOT NULL REFERENCES series(id),
+        PRIMARY KEY (fecha, id),
+        CONSTRAINT uq_precio_serie UNIQUE (serie_id, fecha)
+    ) PARTITION BY RANGE (fecha);
+
+    ALTER SEQUENCE precios_id_seq OWNED BY precios.id;
+"""
+
+# Índices por partición. uq_precio_serie cubre las búsquedas por serie y fecha;
+# BRIN sobre fecha es mínimo porque los boletines se cargan en orden de fecha.
+SQL_INDICES_PRECIOS = """
+    CREATE INDEX IF NOT EXISTS idx_precios_fecha_brin ON precios USING brin (fecha);
+    CREATE INDEX IF NOT EXISTS idx_precios_producto_fecha ON precios(producto_id, fecha);
+    CREATE INDEX IF NOT EXISTS idx_precios_mercado_fecha ON precios(mercado_id, fecha);
+"""
+
+# Índices de la tabla sin particionar que reemplaza SQL_INDICES_PRECIOS
+_INDICES_PRECIOS_ANTIGUOS = [
+    "idx_precios_fecha", "idx_precios_mercado", "idx_precios_producto",
+    "idx_precios_fecha_mercado", "idx_precios_fecha_producto", "idx_precios_producto_formato",
+]
+
+# Meses hacia adelante con partición ya creada al iniciar
+PARTICIONES_MESES_ADELANTE = 2
+
+# Particiones que ya existen (primer día del mes), para no repetir DDL en cada carga
+_particiones: set[date] = set()
+
+
+def _sumar_meses(fecha: date, meses: int) -> date:
+    """Primer día del mes `meses` después del de `fecha`"""
+    total = fecha.year * 12 + fecha.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+async def asegurar_particiones(conn, desde: date, hasta: date):
+    """Crear las particiones mensuales de precios que falten entre ambas fechas (inclusive)"""
+    meses = []
+    mes = _sumar_meses(desde, 0)
+    while mes <= hasta:
+        if mes not in _particiones:
+            meses.append(mes)
+        mes = _sumar_meses(mes, 1)
+    if not meses:
+        return
+
+    # Lock para que dos cargas concurrentes no creen la misma partición a la vez
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('precios_particiones'))")
+        for mes in meses:
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS precios_{mes:%Y_%m} PARTITION OF precios
+                FOR VALUES FROM ('{mes}') TO ('{_sumar_meses(mes, 1)}')
+            """)
+    _particiones.update(meses)
+
+
+async def _migrar_precios_series(conn):
+    """Migración: asignar serie_id a los precios existentes y reemplazar la clave única
+    compuesta (uq_precio_completo) por (serie_id, fecha)"""
+    if await conn.fetchval("SELECT 1 FROM pg_constraint WHERE conname = 'uq_precio_serie'"):
+        return
+
+    logger.warning("Migrando precios a series (serie_id)...")
+    t0 = time.monotonic()
+    async with conn.transaction():
+        await conn.execute("""
+            ALTER TABLE precios ADD COLUMN IF NOT EXISTS serie_id INTEGER REFERENCES series(id);
+
+            INSERT INTO series (producto_id, mercado_id, variedad, calidad, unidad)
+            SELECT DISTINCT producto_id, mercado_id, variedad, calidad, unidad FROM precios
+            ON CONFLICT DO NOTHING;
+
+            UPDATE precios p SET serie_id = s.id
+            FROM series s
+            WHERE p.serie_id IS NULL
+              AND s.producto_id = p.producto_id AND s.mercado_id = p.mercado_id
+              AND s.variedad IS NOT DISTINCT FROM p.variedad
+              AND s.calidad IS NOT DISTINCT FROM p.calidad
+              AND s.unidad IS NOT DISTINCT FROM p.unidad;
+
+            ALTER TABLE precios ALTER COLUMN serie_id SET NOT NULL;
+            ALTER TABLE precios ADD CONSTRAINT uq_precio_serie UNIQUE (serie_id, fecha);
+            ALTER TABLE precios DROP CONSTRAINT IF EXISTS uq_precio_completo;
+        """)
+    series = await conn.fetchval("SELECT COUNT(*) FROM series")
+    logger.warning(f"Migración a series completada: {series} series en {time.monotonic() - t0:.1f}s")
+
+
+async def _migrar_precios_particionado(conn):
+    """Migración: convertir precios (tabla simple) en tabla particionada por mes.
+    Se copia todo en una transacción conservando ids y la secuencia."""
+    relkind = await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('precios')")
+    if relkind != "r":
+        return
+
+    logger.warning("Migrando precios a tabla particionada por mes...")
+    t0 = time.monotonic()
+    async with conn.transaction():
+        await conn.execute(f"""
+            ALTER TABLE precios RENAME TO precios_sin_particionar;
+            -- Sus índices se borran: sólo se lee una vez y sus nombres quedan libres
+            ALTER TABLE precios_sin_particionar
+                DROP CONSTRAINT precios_pkey,
+                DROP CONSTRAINT IF EXISTS uq_precio_completo,
+                DROP CONSTRAINT IF EXISTS uq_precio_serie;
+            ALTER SEQUENCE precios_id_seq OWNED BY NONE;
+            DROP INDEX IF EXISTS {", ".join(_INDICES_PRECIOS_ANTIGUOS)};
+        """)
+        await conn.execute(SQL_TABLA_PRECIOS)
+        rango = await conn.fetchrow("SELECT MIN(fecha) AS desde, MAX(fecha) AS hasta FROM precios_sin_particionar")
+        if rango["desde"] is not None:
+            await asegurar_particiones(conn, rango["desde"], rango["hasta"])
+        filas = await conn.execute("""
+            INSERT INTO precios (id, fecha, mercado_id, producto_id, variedad, calidad, unidad,
+                                 precio_min, precio_max, precio_promedio, volumen, serie_id)
+            SELECT id, fecha, mercado_id, producto_id, variedad, calidad, unidad,
+                   precio_min, precio_max, precio_promedio, volumen, serie_id
+            FROM precios_sin_particionar
+            ORDER BY fecha
+        """)
+        await conn.execute("DROP TABLE precios_sin_particionar")
+    logger.warning(f"Migración de precios a particiones completada: {filas.split()[-1]} filas "
+                   f"en {time.monotonic() - t0:.1f}s")
+
+
+# ============== CATÁLOGO DE SERIES ==============
+# series lleva primera/última fecha, observaciones y último precio; fechas_precios es el
+# calendario de fechas cargadas y su máximo es la fecha actual del dashboard;
+# precios_ultimos guarda la última fila de cada serie. insertar_precios los mantiene
+# en la misma transacción que el merge.
+
+# Fecha más reciente con precios (sin recorrer precios)
+SQL_FECHA_ACTUAL = "(SELECT MAX(fecha) FROM fechas_precios)"
+
+
+async def _recalcular_catalogo(conn, serie_ids: list[int] = None):
+    """Recalcular desde precios el catálogo de las series indicadas (o de todas)"""
+    await conn.execute("""
+        UPDATE series s SET
+            primera_fecha = c.primera, ultima_fecha = c.ultima,
+            observaciones = COALESCE(c.n, 0), ultimo_precio = c.ultimo_precio
+        FROM series s2
+        LEFT JOIN LATERAL (
+            SELECT MIN(fecha) AS primera, MAX(fecha) AS ultima, COUNT(*) AS n,
+                   (ARRAY_AGG(precio_promedio ORDER BY fecha DESC))[1] AS ultimo_precio
+            FROM precios p WHERE p.serie_id = s2.id
+        ) c ON TRUE
+        WHERE s.id = s2.id AND ($1::int[] IS NULL OR s2.id = ANY($1::int[]))
+    """, serie_ids)
+
+
+async def _recalcular_ultimos(conn, serie_ids: list[int] = None):
+    """Recalcular precios_ultimos de las series indicadas (o de todas) a partir de
+    series.ultima_fecha, que ya debe estar al día"""
+    await conn.execute("""
+        WITH afectadas AS (
+            SELECT id, ultima_fecha FROM series
+            WHERE $1::int[] IS NULL OR id = ANY($1::int[])
+        ),
+        borradas AS (
+            DELETE FROM precios_ultimos u
+            USING afectadas a
+            WHERE u.serie_id = a.id AND a.ultima_fecha IS NULL
+        )
+        INSERT INTO precios_ultimos (serie_id, producto_id, mercado_id, fecha,
+                                     precio_min, precio_max, precio_promedio, volumen)
+        SELECT p.serie_id, p.producto_id, p.mercado_id, p.fecha,
+               p.precio_min, p.precio_max, p.precio_promedio, p.volumen
+        FROM afectadas a
+        JOIN precios p ON p.serie_id = a.id AND p.fecha = a.ultima_fecha
+        ON CONFLICT (serie_id) DO UPDATE SET
+            fecha = EXCLUDED.fecha,
+            precio_min = EXCLUDED.precio_min,
+            precio_max = EXCLUDED.precio_max,
+            precio_promedio = EXCLUDED.precio_promedio,
+            volumen = EXCLUDED.volumen
+        WHERE (precios_ultimos.fecha, precios_ultimos.precio_min, precios_ultimos.precio_max,
+               precios_ultimos.precio_promedio, precios_ultimos.volumen)
+              IS DISTINCT FROM
+              (EXCLUDED.fecha, EXCLUDED.precio_min, EXCLUDED.precio_max,
+               EXCLUDED.precio_promedio, EXCLUDED.volumen)
+          -- No retroceder sobre una fecha más nueva de otra carga concurrente, salvo que
+          -- esa fila ya no exista (re-parseo que la borró)
+          AND (EXCLUDED.fecha >= precios_ultimos.fecha OR NOT EXISTS (
+              SELECT 1 FROM precios p2
+              WHERE p2.serie_id = precios_ultimos.serie_id AND p2.fecha = precios_ultimos.fecha
+          ))
+    """, serie_ids)
+
+
+async def _inicializar_catalogo(conn):
+    """Migración: poblar el catálogo de series, el calendario de fechas y precios_ultimos
+    a partir de precios si aún no lo están (bases anteriores al catálogo)"""
+    pendientes = [r["id"] for r in await conn.fetch(
+        "SELECT id FROM series WHERE ultima_fecha IS NULL"
+    )]
+    if pendientes:
+        logger.info(f"Catálogo de series: calculando {len(pendientes)} series")
+        await _recalcular_catalogo(conn, pendientes)
+    await conn.execute("""
+        INSERT INTO fechas_precios (fecha, registros)
+        SELECT fecha, COUNT(*) FROM precios
+        WHERE NOT EXISTS (SELECT 1 FROM fechas_precios)
+        GROUP BY fecha
+    """)
+    if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM precios_ultimos)"):
+        await _recalcular_ultimos(conn)
+
+
+# ============== AGREGADOS DE PRECIOS ==============
+# Sumas y conteos no nulos de cada medida por período: el promedio de cualquier
+# combinación de filas es SUM(suma_x) / SUM(n_x), igual que AVG sobre precios.
+# Diario por producto y mercado (todos los formatos juntos); semanal y mensual por serie.
+# insertar_precios recalcula sólo los períodos que contienen la fecha cargada, con un
+# advisory lock por período para que cargas concurrentes no se pisen.
+
+# agregacion: (tabla, columnas clave, período de p.fecha, duración del período)
+AGREGADOS = {
+    "diario": ("precios_diarios", ("producto_id", "mercado_id"), "p.fecha", "1 day"),
+    "semanal": ("precios_semanales", ("serie_id",), "DATE_TRUNC('week', p.fecha)::date", "1 week"),
+    "mensual": ("precios_mensuales", ("serie_id",), "DATE_TRUNC('month', p.fecha)::date", "1 month"),
+}
+# sufijo de la columna agregada: expresión sobre precios. Las "_valido" cuentan sólo filas
+# con precio promedio, como los datos históricos del pronóstico (forecast._obtener_datos)
+MEDIDAS_AGREGADAS = {
+    "promedio": "p.precio_promedio", "min": "p.precio_min", "max": "p.precio_max", "volumen": "p.volumen",
+    "min_valido": "CASE WHEN p.precio_promedio > 0 THEN p.precio_min END",
+    "max_valido": "CASE WHEN p.precio_promedio > 0 THEN p.precio_max END",
+    "volumen_valido": "CASE WHEN p.precio_promedio > 0 THEN p.volumen END",
+}
+
+
+def promedio_agregado(medida: str, decimales: int = 0, alias: str = "a") -> str:
+    """Expresión SQL del promedio de una medida sobre filas de un agregado (con GROUP BY)"""
+    return (f"ROUND((SUM({alias}.suma_{medida}) / NULLIF(SUM({alias}.n_{medida}), 0))::numeric, {decimales})")
+
+
+def _rango_periodos(agregacion: str, desde: date, hasta: date) -> tuple[date, date]:
+    """[inicio, fin) que cubre los períodos completos de `agregacion` entre desde y hasta"""
+    if agregacion == "semanal":
+        return desde - timedelta(days=desde.weekday()), hasta - timedelta(days=hasta.weekday()) + timedelta(days=7)
+    if agregacion == "mensual":
+        return desde.replace(day=1), _sumar_meses(hasta, 1)
+    return desde, hasta + timedelta(days=1)
+
+
+async def _recalcular_agregados(conn, desde: date, hasta: date, serie_ids: list[int] = None):
+    """Recalcular desde precios los períodos de cada agregado que tocan [desde, hasta].
+    Con `serie_ids`, los agregados por serie sólo recalculan esas series.
+    Sólo se escriben las filas que cambiaron; se borran las de claves que ya no tienen precios.
+    Debe correr dentro de una transacción: los locks por período se liberan al terminarla."""
+    columnas = ["registros"] + [f"{p}_{m}" for m in MEDIDAS_AGREGADAS for p in ("suma", "n")]
+    sumas = ",\n                   ".join(
+        f"SUM(({c})::float8) AS suma_{m}, COUNT({c}) AS n_{m}" for m, c in MEDIDAS_AGREGADAS.items()
+    )
+    for agregacion, (tabla, claves, periodo, duracion) in AGREGADOS.items():
+        inicio, fin = _rango_periodos(agregacion, desde, hasta)
+        # Serializar por período con otras cargas; en una sentencia aparte para que el
+        # snapshot del recálculo ya vea lo que commiteó quien tenía el lock
+        await conn.execute(f"""
+            SELECT pg_advisory_xact_lock(hashtext('{tabla}'), d::date - DATE '2000-01-01')
+            FROM generate_series($1::date, $2::date - 1, INTERVAL '{duracion}') d
+            ORDER BY d
+        """, inicio, fin)
+        clave = ", ".join(claves)
+        params, filtro_p, filtro_t = [inicio, fin], "", ""
+        if serie_ids is not None and claves == ("serie_id",):
+            params.append(serie_ids)
+            filtro_p, filtro_t = " AND p.serie_id = ANY($3::int[])", " AND t.serie_id = ANY($3::int[])"
+        await conn.execute(f"""
+            WITH nuevos AS (
+                SELECT {", ".join(f"p.{c}" for c in claves)}, {periodo} AS periodo, COUNT(*) AS registros,
+                       {sumas}
+                FROM precios p
+                WHERE p.fecha >= $1 AND p.fecha < $2{filtro_p}
+                GROUP BY {clave}, periodo
+            ),
+            borrados AS (
+                DELETE FROM {tabla} t
+                WHERE t.periodo >= $1 AND t.periodo < $2{filtro_t}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM nuevos n
+                      WHERE ({", ".join(f"n.{c}" for c in claves)}, n.periodo) = ({", ".join(f"t.{c}" for c in claves)}, t.periodo)
+                  )
+            )
+            INSERT INTO {tabla} ({clave}, periodo, {", ".join(columnas)})
+            SELECT * FROM nuevos
+            ON CONFLICT ({clave}, periodo) DO UPDATE SET
+                {", ".join(f"{c} = EXCLUDED.{c}" for c in columnas)}
+            WHERE ({", ".join(f"{tabla}.{c}" for c in columnas)})
+                  IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in columnas)})
+        """, *params)
+
+
+async def _inicializar_agregados(conn):
+    """Migración: calcular los agregados de todo el histórico si faltan (o si les faltan
+    las columnas agregadas después, que quedan en NULL al crearlas).
+    Va del mes más nuevo al más viejo, un mes por transacción (acota los advisory locks
+    tomados a la vez): si el mes más viejo ya está completo, el cálculo terminó."""
+    rango = await conn.fetchrow("SELECT MIN(fecha) AS desde, MAX(fecha) AS hasta FROM fechas_precios")
+    if rango["desde"] is None:
+        return
+    if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM precios_mensuales WHERE periodo = $1 AND n_min_valido IS NOT NULL)",
+                           rango["desde"].replace(day=1)):
+        return
+    logger.info(f"Agregados de precios: calculando {rango['desde']} a {rango['hasta']}")
+    t0 = time.monotonic()
+    mes = rango["hasta"].replace(day=1)
+    while mes >= rango["desde"].replace(day=1):
+        async with conn.transaction():
+            await _recalcular_agregados(conn, max(mes, rango["desde"]),
+                                        min(_sumar_meses(mes, 1) - timedelta(days=1), rango["hasta"]))
+        mes = _sumar_meses(mes, -1)
+    logger.info(f"Agregados de precios calculados en {time.monotonic() - t0:.1f}s")
+
+
 async def close_db():
     """Cerrar pool de conexiones"""
     global pool
@@ -129,115 +613,306 @@ async def close_db():
         await pool.close()
 
 
-async def get_or_create_mercado(conn, nombre: str) -> int:
-    """Obtener o crear mercado, retorna id (con cache)"""
-    if nombre in _cache_mercados:
-        return _cache_mercados[nombre]
-    row = await conn.fetchrow(
-        "INSERT INTO mercados (nombre) VALUES ($1) ON CONFLICT (nombre) DO UPDATE SET nombre = $1 RETURNING id",
-        nombre
-    )
-    _cache_mercados[nombre] = row["id"]
-    return row["id"]
-
-
-async def get_or_create_producto(conn, nombre: str, categoria: str) -> int:
-    """Obtener o crear producto, retorna id (con cache)"""
-    key = (nombre, categoria)
-    if key in _cache_productos:
-        return _cache_productos[key]
-    row = await conn.fetchrow(
-        "INSERT INTO productos (nombre, categoria) VALUES ($1, $2) "
-        "ON CONFLICT (nombre, categoria) DO UPDATE SET nombre = $1 RETURNING id",
-        nombre, categoria
-    )
-    _cache_productos[key] = row["id"]
-    return row["id"]
-
-
-async def insertar_precios(registros: list[dict]) -> int:
-    """Insertar registros de precios en batch optimizado"""
-    if not registros:
-        return 0
+async def resolver_dimensiones(conn, lote: LoteRegistros) -> tuple[list[int], list[int]]:
+    """Resolver ids de mercados y productos de un lote en un solo round trip.
+    Las claves que no están en cache se upsertean juntas con unnest. Retorna los ids
+    en el orden de los diccionarios del lote (código → id)."""
+    # Orden estable de claves: imports concurrentes toman los locks en el mismo orden
+    mercados = sorted(set(lote.mercados.valores) - _cache_mercados.keys())
+    productos = sorted(set(lote.productos.valores) - _cache_productos.keys())
+    if mercados or productos:
+        await _upsert_dimensiones(conn, mercados, productos)
+    return ([_cache_mercados[m] for m in lote.mercados.valores],
+            [_cache_productos[p] for p in lote.productos.valores])
+
+
+async def _upsert_dimensiones(conn, mercados: list[str], productos: list[tuple[str, str]]):
+    rows = await conn.fetch("""
+        WITH m AS (
+            INSERT INTO mercados (nombre)
+            SELECT unnest($1::text[])
+            ON CONFLICT (nombre) DO UPDATE SET nombre = EXCLUDED.nombre
+            RETURNING id, nombre
+        ),
+        p AS (
+            INSERT INTO productos (nombre, categoria)
+            SELECT * FROM unnest($2::text[], $3::text[])
+            ON CONFLICT (nombre, categoria) DO UPDATE SET nombre = EXCLUDED.nombre
+            RETURNING id, nombre, categoria
+        )
+        SELECT 'mercado' AS dimension, id, nombre, NULL AS categoria FROM m
+        UNION ALL
+        SELECT 'producto' AS dimension, id, nombre, categoria FROM p
+    """, mercados, [p[0] for p in productos], [p[1] for p in productos])
+
+    for r in rows:
+        if r["dimension"] == "mercado":
+            _cache_mercados[r["nombre"]] = r["id"]
+        else:
+            _cache_productos[(r["nombre"], r["categoria"])] = r["id"]
+
+
+# Columnas de precios que se cargan desde un boletín (orden de COPY)
+COLUMNAS_PRECIOS = [
+    "fecha", "mercado_id", "producto_id", "variedad", "calidad", "unidad",
+    "precio_min", "precio_max", "precio_promedio", "volumen",
+]
+
+
+async def insertar_precios(lote: LoteRegistros, reemplazar: bool = False) -> dict:
+    """Cargar un lote de precios: COPY a una tabla staging temporal y un único merge
+    sobre precios. Sólo se reescriben las filas cuyos valores cambiaron; el resto
+    no genera tuplas muertas ni WAL.
+    Cada fila se asigna a su serie (producto, mercado, variedad, calidad, unidad), creando
+    las nuevas. Las filas repetidas dentro del boletín (misma serie) se reportan como
+    rechazadas; gana la última, igual que con inserts secuenciales.
+    Con reemplazar=True se borran además los precios de esas fechas que ya no vienen
+    en el boletín (re-parseo).
+    Retorna conteos (registros, insertados, actualizados, sin_cambios, rechazados) y
+    segundos por fase (t_dimensiones, t_insercion)."""
+    if len(lote) == 0:
+        return {"registros": 0, "insertados": 0, "actualizados": 0, "sin_cambios": 0, "rechazados": 0,
+                "t_dimensiones": 0.0, "t_insercion": 0.0}
 
     async with pool.acquire() as conn:
-        # Fase 1: Pre-resolver todos los IDs (con cache, muy rápido)
-        rows_data = []
+        # Fase 1: Resolver mercados/productos del lote (un round trip); el resto es por código
+        t0 = time.monotonic()
+        ids_mercado, ids_producto = await resolver_dimensiones(conn, lote)
+        await asegurar_particiones(conn, lote.fecha, lote.fecha)
+        t_dimensiones = time.monotonic() - t0
+
+        # Fase 2: COPY a staging + merge set-based en una sola transacción
+        t0 = time.monotonic()
         async with conn.transaction():
-            for r in registros:
-                mercado_id = await get_or_create_mercado(conn, r["mercado"])
-                producto_id = await get_or_create_producto(conn, r["producto"], r["categoria"])
-                rows_data.append((
-                    r["fecha"], mercado_id, producto_id,
-                    r.get("variedad"), r.get("calidad"), r.get("unidad"),
-                    r.get("precio_min"), r.get("precio_max"),
-                    r.get("precio_promedio"), r.get("volumen")
-                ))
-
-        # Fase 2: Batch insert con executemany (mucho más rápido que individual)
-        count = 0
-        BATCH_SIZE = 200
-        for i in range(0, len(rows_data), BATCH_SIZE):
-            batch = rows_data[i:i + BATCH_SIZE]
-            try:
-                async with conn.transaction():
-                    await conn.executemany("""
-                        INSERT INTO precios (fecha, mercado_id, producto_id, variedad, calidad, unidad,
-                                           precio_min, precio_max, precio_promedio, volumen)
-                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                        ON CONFLICT ON CONSTRAINT uq_precio_completo
-                        DO UPDATE SET
-                            precio_min = EXCLUDED.precio_min,
-                            precio_max = EXCLUDED.precio_max,
-                            precio_promedio = EXCLUDED.precio_promedio,
-                            volumen = EXCLUDED.volumen
-                    """, batch)
-                    count += len(batch)
-            except Exception as e:
-                logger.error(f"Error en batch insert ({len(batch)} rows): {e}")
-                # Fallback: insertar uno por uno para no perder datos
-                async with conn.transaction():
-                    for row in batch:
-                        try:
-                            await conn.execute("""
-                                INSERT INTO precios (fecha, mercado_id, producto_id, variedad, calidad, unidad,
-                                                   precio_min, precio_max, precio_promedio, volumen)
-                                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
-                                ON CONFLICT ON CONSTRAINT uq_precio_completo
-                                DO UPDATE SET
-                                    precio_min = EXCLUDED.precio_min,
-                                    precio_max = EXCLUDED.precio_max,
-                                    precio_promedio = EXCLUDED.precio_promedio,
-                                    volumen = EXCLUDED.volumen
-                            """, *row)
-                            count += 1
-                        except Exception as e2:
-                            logger.error(f"Error insertando registro individual: {e2}")
-
-        return count
-
-
-async def registrar_importacion(fecha_boletin: date, registros: int, estado: str, detalle: str = None):
-    """Registrar log de importación"""
+            await conn.execute("""
+                CREATE TEMP TABLE precios_staging (
+                    orden INTEGER,
+                    fecha DATE,
+                    mercado_id INTEGER,
+                    producto_id INTEGER,
+                    variedad TEXT,
+                    calidad TEXT,
+                    unidad TEXT,
+                    precio_min REAL,
+                    precio_max REAL,
+                    precio_promedio REAL,
+                    volumen REAL,
+                    serie_id INTEGER
+                ) ON COMMIT DROP
+            """)
+            await conn.copy_records_to_table(
+                "precios_staging", records=lote.filas(ids_mercado, ids_producto),
+                columns=["orden"] + COLUMNAS_PRECIOS,
+            )
+            # Series nuevas del boletín y serie_id de cada fila: el resto del merge va por clave entera
+            await conn.execute("""
+                INSERT INTO series (producto_id, mercado_id, variedad, calidad, unidad)
+                SELECT DISTINCT st.producto_id, st.mercado_id, st.variedad, st.calidad, st.unidad
+                FROM precios_staging st
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM series s
+                    WHERE s.producto_id = st.producto_id AND s.mercado_id = st.mercado_id
+                      AND s.variedad IS NOT DISTINCT FROM st.variedad
+                      AND s.calidad IS NOT DISTINCT FROM st.calidad
+                      AND s.unidad IS NOT DISTINCT FROM st.unidad
+                )
+                ORDER BY 1, 2, 3, 4, 5
+                ON CONFLICT DO NOTHING;
+
+                UPDATE precios_staging st SET serie_id = s.id
+                FROM series s
+                WHERE s.producto_id = st.producto_id AND s.mercado_id = st.mercado_id
+                  AND s.variedad IS NOT DISTINCT FROM st.variedad
+                  AND s.calidad IS NOT DISTINCT FROM st.calidad
+                  AND s.unidad IS NOT DISTINCT FROM st.unidad;
+            """)
+            borradas = []
+            if reemplazar:
+                borradas = [r["serie_id"] for r in await conn.fetch("""
+                    DELETE FROM precios p
+                    WHERE p.fecha IN (SELECT DISTINCT fecha FROM precios_staging)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM precios_staging s
+                          WHERE s.fecha = p.fecha AND s.serie_id = p.serie_id
+                      )
+                    RETURNING p.serie_id
+                """)]
+            row = await conn.fetchrow("""
+                WITH dedup AS (
+                    SELECT DISTINCT ON (serie_id, fecha)
+                           fecha, mercado_id, producto_id, variedad, calidad, unidad,
+                           precio_min, precio_max, precio_promedio, volumen, serie_id
+                    FROM precios_staging
+                    ORDER BY serie_id, fecha, orden DESC
+                ),
+                -- Filas nuevas vs. ya existentes (xmax no está disponible en tablas particionadas)
+                marcado AS (
+                    SELECT d.serie_id, d.fecha, d.precio_promedio,
+                           NOT EXISTS (
+                               SELECT 1 FROM precios p WHERE p.serie_id = d.serie_id AND p.fecha = d.fecha
+                           ) AS nueva
+                    FROM dedup d
+                ),
+                merge AS (
+                    INSERT INTO precios (fecha, mercado_id, producto_id, variedad, calidad, unidad,
+                                         precio_min, precio_max, precio_promedio, volumen, serie_id)
+                    SELECT * FROM dedup
+                    ON CONFLICT ON CONSTRAINT uq_precio_serie
+                    DO UPDATE SET
+                        precio_min = EXCLUDED.precio_min,
+                        precio_max = EXCLUDED.precio_max,
+                        precio_promedio = EXCLUDED.precio_promedio,
+                        volumen = EXCLUDED.volumen
+                    -- Sólo reescribir si algún valor cambió
+                    WHERE (precios.precio_min, precios.precio_max, precios.precio_promedio, precios.volumen)
+                          IS DISTINCT FROM
+                          (EXCLUDED.precio_min, EXCLUDED.precio_max, EXCLUDED.precio_promedio, EXCLUDED.volumen)
+                    RETURNING 1
+                ),
+                -- Última observación: la fila cargada si es de la fecha más reciente de su serie
+                -- (series todavía con los valores previos a este statement)
+                ultimos AS (
+                    INSERT INTO precios_ultimos (serie_id, producto_id, mercado_id, fecha,
+                                                 precio_min, precio_max, precio_promedio, volumen)
+                    SELECT DISTINCT ON (d.serie_id)
+                           d.serie_id, d.producto_id, d.mercado_id, d.fecha,
+                           d.precio_min, d.precio_max, d.precio_promedio, d.volumen
+                    FROM dedup d
+                    JOIN series s ON s.id = d.serie_id
+                    WHERE s.ultima_fecha IS NULL OR d.fecha >= s.ultima_fecha
+                    ORDER BY d.serie_id, d.fecha DESC
+                    ON CONFLICT (serie_id) DO UPDATE SET
+                        fecha = EXCLUDED.fecha,
+                        precio_min = EXCLUDED.precio_min,
+                        precio_max = EXCLUDED.precio_max,
+                        precio_promedio = EXCLUDED.precio_promedio,
+                        volumen = EXCLUDED.volumen
+                    WHERE (precios_ultimos.fecha, precios_ultimos.precio_min, precios_ultimos.precio_max,
+                           precios_ultimos.precio_promedio, precios_ultimos.volumen)
+                          IS DISTINCT FROM
+                          (EXCLUDED.fecha, EXCLUDED.precio_min, EXCLUDED.precio_max,
+                           EXCLUDED.precio_promedio, EXCLUDED.volumen)
+                      -- Una carga concurrente de una fecha más nueva ya ganó: no pisarla
+                      AND EXCLUDED.fecha >= precios_ultimos.fecha
+                ),
+                -- Catálogo de series: rango de fechas, observaciones y último precio
+                catalogo AS (
+                    UPDATE series s SET
+                        primera_fecha = LEAST(s.primera_fecha, c.primera),
+                        ultima_fecha = GREATEST(s.ultima_fecha, c.ultima),
+                        observaciones = s.observaciones + c.nuevas,
+                        ultimo_precio = CASE WHEN s.ultima_fecha IS NULL OR c.ultima >= s.ultima_fecha
+                                             THEN c.ultimo_precio ELSE s.ultimo_precio END
+                    FROM (
+                        SELECT serie_id, MIN(fecha) AS primera, MAX(fecha) AS ultima,
+                               COUNT(*) FILTER (WHERE nueva) AS nuevas,
+                               (ARRAY_AGG(precio_promedio ORDER BY fecha DESC))[1] AS ultimo_precio
+                        FROM marcado
+                        GROUP BY serie_id
+                    ) c
+                    WHERE s.id = c.serie_id
+                      AND (c.nuevas > 0 OR (c.ultima = s.ultima_fecha AND c.ultimo_precio IS DISTINCT FROM s.ultimo_precio))
+                )
+                SELECT (SELECT COUNT(*) FROM dedup) AS registros,
+                       (SELECT COUNT(*) FROM marcado WHERE nueva) AS insertados,
+                       (SELECT COUNT(*) FROM merge) - (SELECT COUNT(*) FROM marcado WHERE nueva) AS actualizados
+            """)
+            if borradas:
+                await _recalcular_catalogo(conn, borradas)
+                await _recalcular_ultimos(conn, borradas)
+            await conn.execute("""
+                INSERT INTO fechas_precios (fecha, registros)
+                SELECT fecha, COUNT(*) FROM precios
+                WHERE fecha IN (SELECT DISTINCT fecha FROM precios_staging)
+                GROUP BY fecha
+                ON CONFLICT (fecha) DO UPDATE SET registros = EXCLUDED.registros
+            """)
+            if row["insertados"] or row["actualizados"] or borradas:
+                serie_ids = [r["serie_id"] for r in await conn.fetch(
+                    "SELECT DISTINCT serie_id FROM precios_staging"
+                )]
+                await _recalcular_agregados(conn, lote.fecha, lote.fecha, serie_ids + borradas)
+
+        resultado = {
+            "registros": row["registros"],
+            "insertados": row["insertados"],
+            "actualizados": row["actualizados"],
+            "sin_cambios": row["registros"] - row["insertados"] - row["actualizados"],
+            "rechazados": len(lote) - row["registros"],
+            "t_dimensiones": t_dimensiones,
+            "t_insercion": time.monotonic() - t0,
+        }
+        if resultado["rechazados"]:
+            logger.warning(f"Carga de precios: {resultado['rechazados']} filas rechazadas (duplicadas en el boletín), "
+                           f"{resultado['registros']} cargadas")
+
+        return resultado
+
+
+# Columnas opcionales de métricas en importaciones (ver registrar_importacion)
+COLUMNAS_METRICAS_IMPORTACION = [
+    "content_hash", "insertados", "actualizados", "sin_cambios",
+    "patron_url", "bytes", "t_descarga", "t_parseo", "filas_parseadas", "t_dimensiones", "t_insercion",
+]
+
+
+async def registrar_importacion(fecha_boletin: date, registros: int, estado: str, detalle: str = None,
+                                metricas: dict = None, reintentar_en_min: int = None):
+    """Registrar log de importación.
+    `metricas` puede traer cualquiera de COLUMNAS_METRICAS_IMPORTACION; las ausentes quedan en NULL.
+    `reintentar_en_min` fija reintentar_despues (caché negativo de boletines no disponibles)."""
+    metricas = metricas or {}
+    columnas = COLUMNAS_METRICAS_IMPORTACION
+    valores = [metricas.get(c) for c in columnas]
+    placeholders = ", ".join(f"${i}" for i in range(6, 6 + len(columnas)))
+    updates = ",\n                ".join(f"{c} = EXCLUDED.{c}" for c in columnas)
+
     async with pool.acquire() as conn:
-        await conn.execute("""
-            INSERT INTO importaciones (fecha_boletin, registros, estado, detalle)
-            VALUES ($1, $2, $3, $4)
+        await conn.execute(f"""
+            INSERT INTO importaciones (fecha_boletin, registros, estado, detalle, reintentar_despues,
+                                       {", ".join(columnas)})
+            VALUES ($1, $2, $3, $4, NOW() + make_interval(mins => $5::int), {placeholders})
             ON CONFLICT (fecha_boletin) DO UPDATE SET
                 registros = EXCLUDED.registros,
                 estado = EXCLUDED.estado,
                 detalle = EXCLUDED.detalle,
+                reintentar_despues = EXCLUDED.reintentar_despues,
+                {updates},
                 fecha_importacion = NOW()
-        """, fecha_boletin, registros, estado, detalle)
+        """, fecha_boletin, registros, estado, detalle, reintentar_en_min, *valores)
 
 
-async def boletin_ya_importado(fecha: date) -> bool:
-    """Verificar si un boletín ya fue importado"""
+async def get_content_hash(fecha: date) -> Optional[str]:
+    """Hash del archivo con que se importó OK un boletín (None si no hay importación OK)"""
     async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT id FROM importaciones WHERE fecha_boletin = $1 AND estado = 'ok'", fecha
+        return await conn.fetchval(
+            "SELECT content_hash FROM importaciones WHERE fecha_boletin = $1 AND estado = 'ok'", fecha
+        )
+
+
+async def olvidar_content_hash(fechas: list[date]):
+    """Borrar el hash guardado de estos boletines, para que un re-import con forzar los
+    vuelva a cargar en vez de terminar como sin_cambios"""
+    async with pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE importaciones SET content_hash = NULL WHERE fecha_boletin = ANY($1::date[])", fechas
         )
-        return row is not None
+
+
+async def get_estado_importacion(fecha: date, dias_recientes: int) -> Optional[str]:
+    """Estado de la importación de un boletín que hace innecesario volver a bajarlo:
+    'ok', 'no_disponible' (caché negativo vigente) o None si hay que intentarlo.
+    Un no_disponible se re-intenta sólo si la fecha es de los últimos `dias_recientes`
+    días y ya pasó su reintentar_despues."""
+    async with pool.acquire() as conn:
+        return await conn.fetchval("""
+            SELECT estado FROM importaciones
+            WHERE fecha_boletin = $1
+              AND (estado = 'ok'
+                   OR (estado = 'no_disponible'
+                       AND (fecha_boletin < CURRENT_DATE - $2::int
+                            OR reintentar_despues > NOW())))
+        """, fecha, dias_recientes)
 
 
 async def get_ultima_fecha_importada() -> Optional[date]:
@@ -249,6 +924,166 @@ async def get_ultima_fecha_importada() -> Optional[date]:
         return row["ultima"] if row and row["ultima"] else None
 
 
+# ============== COLA DE IMPORTACIONES ==============
+# Ítems: 'pendiente' → 'en_curso' (tomado por un worker) → estado final del boletín
+# ('ok', 'no_disponible', 'error', ...). Un ítem en_curso cuyo worker murió se
+# vuelve a tomar cuando vence su lease.
+
+ESTADOS_ITEM_ERROR = ("error", "sin_datos")
+
+# Marcar terminados los jobs sin ítems pendientes ni en curso
+_SQL_CERRAR_JOBS = """
+    UPDATE import_jobs j SET estado = 'terminado', terminado = NOW()
+    WHERE j.estado <> 'terminado'
+      AND NOT EXISTS (
+          SELECT 1 FROM import_job_items i
+          WHERE i.job_id = j.id AND i.estado IN ('pendiente', 'en_curso')
+      )
+"""
+
+
+async def crear_import_job(fecha_inicio: date, fecha_fin: date, fechas: list[date],
+                           forzar: bool = False, reparsear: bool = False) -> int:
+    """Encolar un job de importación con un ítem por fecha. Retorna el id del job."""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            job_id = await conn.fetchval("""
+                INSERT INTO import_jobs (fecha_inicio, fecha_fin, forzar, reparsear, estado)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+            """, fecha_inicio, fecha_fin, forzar, reparsear, "pendiente" if fechas else "terminado")
+            await conn.execute("""
+                INSERT INTO import_job_items (job_id, fecha)
+                SELECT $1, f FROM unnest($2::date[]) AS f
+            """, job_id, fechas)
+            return job_id
+
+
+async def tomar_items_import_job(worker: str, limite: int, lease_seg: int,
+                                 max_intentos: int) -> Optional[dict]:
+    """Reclamar hasta `limite` fechas de un mismo job (el más antiguo con trabajo).
+    FOR UPDATE SKIP LOCKED permite que varios workers drenen la cola en paralelo
+    sin tomar el mismo ítem. Retorna {job_id, forzar, reparsear, fechas} o None."""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Ítems que agotaron sus intentos (el worker murió con ellos varias veces)
+            await conn.execute("""
+                UPDATE import_job_items SET estado = 'error', terminado = NOW()
+                WHERE estado = 'en_curso' AND intentos >= $1
+                  AND tomado < NOW() - make_interval(secs => $2::int)
+            """, max_intentos, lease_seg)
+            await conn.execute(_SQL_CERRAR_JOBS)
+            rows = await conn.fetch("""
+                WITH job AS (
+                    SELECT job_id FROM import_job_items
+                    WHERE estado = 'pendiente'
+                       OR (estado = 'en_curso' AND tomado < NOW() - make_interval(secs => $3::int))
+                    ORDER BY job_id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ),
+                tomados AS (
+                    SELECT i.job_id, i.fecha FROM import_job_items i
+                    WHERE i.job_id = (SELECT job_id FROM job)
+                      AND (i.estado = 'pendiente'
+                           OR (i.estado = 'en_curso' AND i.tomado < NOW() - make_interval(secs => $3::int)))
+                    ORDER BY i.fecha
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE import_job_items i
+                SET estado = 'en_curso', worker = $1, tomado = NOW(), intentos = i.intentos + 1
+                FROM tomados t
+                WHERE i.job_id = t.job_id AND i.fecha = t.fecha
+                RETURNING i.job_id, i.fecha
+            """, worker, limite, lease_seg)
+            if not rows:
+                return None
+            job_id = rows[0]["job_id"]
+            job = await conn.fetchrow("""
+                UPDATE import_jobs SET estado = 'en_curso'
+                WHERE id = $1
+                RETURNING forzar, reparsear
+            """, job_id)
+            return {
+                "job_id": job_id,
+                "forzar": job["forzar"],
+                "reparsear": job["reparsear"],
+                "fechas": sorted(r["fecha"] for r in rows),
+            }
+
+
+async def completar_item_import_job(job_id: int, fecha: date, estado: str, registros: int):
+    """Registrar el resultado de una fecha y cerrar el job si era la última pendiente"""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("""
+                UPDATE import_job_items
+                SET estado = $3, registros = $4, terminado = NOW()
+                WHERE job_id = $1 AND fecha = $2
+            """, job_id, fecha, estado, registros)
+            await conn.execute(_SQL_CERRAR_JOBS + " AND id = $1", job_id)
+
+
+async def liberar_items_import_job(worker: str) -> int:
+    """Devolver a la cola los ítems en curso de un worker que se detiene ordenadamente"""
+    async with pool.acquire() as conn:
+        res = await conn.execute("""
+            UPDATE import_job_items
+            SET estado = 'pendiente', worker = NULL, tomado = NULL, intentos = GREATEST(intentos - 1, 0)
+            WHERE worker = $1 AND estado = 'en_curso'
+        """, worker)
+        return int(res.split()[-1])
+
+
+async def get_import_job_status(job_id: int = None) -> Optional[dict]:
+    """Progreso de un job (por defecto el último creado), calculado desde sus ítems"""
+    async with pool.acquire() as conn:
+        job = await conn.fetchrow(
+            "SELECT * FROM import_jobs WHERE ($1::int IS NULL OR id = $1) ORDER BY id DESC LIMIT 1",
+            job_id,
+        )
+        if job is None:
+            return None
+        items = await conn.fetchrow("""
+            SELECT
+                COUNT(*) AS total,
+                COUNT(*) FILTER (WHERE estado NOT IN ('pendiente', 'en_curso')) AS progress,
+                COUNT(*) FILTER (WHERE estado = 'en_curso') AS en_curso,
+                COUNT(*) FILTER (WHERE estado = 'ok') AS ok,
+                COUNT(*) FILTER (WHERE estado = ANY($2::text[])) AS errors,
+                COALESCE(SUM(registros) FILTER (WHERE estado = 'ok'), 0) AS registros,
+                MIN(tomado) AS started_at,
+                ARRAY_AGG(DISTINCT worker) FILTER (WHERE estado = 'en_curso') AS workers
+            FROM import_job_items WHERE job_id = $1
+        """, job["id"], list(ESTADOS_ITEM_ERROR))
+        actual = await conn.fetchval("""
+            SELECT fecha FROM import_job_items
+            WHERE job_id = $1 AND terminado IS NOT NULL
+            ORDER BY terminado DESC LIMIT 1
+        """, job["id"])
+        return {
+            "job_id": job["id"],
+            "estado": job["estado"],
+            "fecha_inicio": str(job["fecha_inicio"]),
+            "fecha_fin": str(job["fecha_fin"]),
+            "forzar": job["forzar"],
+            "reparsear": job["reparsear"],
+            "running": job["estado"] != "terminado",
+            "total": items["total"],
+            "progress": items["progress"],
+            "en_curso": items["en_curso"],
+            "ok": items["ok"],
+            "registros": items["registros"],
+            "errors": items["errors"],
+            "current_date": str(actual) if actual else None,
+            "workers": items["workers"] or [],
+            "created_at": job["creado"].isoformat() if job["creado"] else None,
+            "started_at": items["started_at"].isoformat() if items["started_at"] else None,
+            "finished_at": job["terminado"].isoformat() if job["terminado"] else None,
+        }
+
+
 # ============== QUERIES PARA EL DASHBOARD ==============
 
 async def get_mercados() -> list[dict]:
@@ -275,11 +1110,10 @@ async def get_subcategorias(producto: str) -> dict:
     """Obtener variedades, calidades y unidades disponibles para un producto"""
     async with pool.acquire() as conn:
         rows = await conn.fetch("""
-            SELECT DISTINCT p.variedad, p.calidad, p.unidad
-            FROM precios p
-            JOIN productos pr ON p.producto_id = pr.id
-            WHERE pr.nombre = $1
-            ORDER BY p.variedad, p.calidad, p.unidad
+            SELECT DISTINCT s.variedad, s.calidad, s.unidad
+            FROM series s
+            JOIN productos pr ON s.producto_id = pr.id
+            WHERE pr.nombre = $1 AND s.observaciones > 0
         """, producto)
         variedades = sorted(set(r["variedad"] for r in rows if r["variedad"]))
         calidades = sorted(set(r["calidad"] for r in rows if r["calidad"]))
@@ -361,45 +1195,17 @@ async def get_variaciones(dias: int = 7, mercados: list[str] = None,
         params.append(categorias)
         idx += 1
 
+    # Hoy sale de precios_ultimos; la referencia y el precio anterior se buscan por serie
+    # en el índice (serie_id, fecha), sin recorrer el histórico
     query = f"""
-        WITH fecha_actual AS (
-            SELECT MAX(fecha) as fecha FROM precios
-        ),
-        precios_hoy AS (
-            SELECT p.producto_id, p.mercado_id, p.variedad, p.calidad, p.unidad,
-                   p.precio_promedio, p.volumen, p.fecha
-            FROM precios p, fecha_actual fa
-            WHERE p.fecha = fa.fecha
-        ),
-        -- Promedio de últimos 5 registros para detectar anomalías
-        precio_referencia AS (
-            SELECT producto_id, mercado_id,
-                   COALESCE(variedad,'') as var_key, COALESCE(calidad,'') as cal_key, COALESCE(unidad,'') as uni_key,
-                   AVG(precio_promedio) as precio_ref
-            FROM (
-                SELECT p.producto_id, p.mercado_id, p.variedad, p.calidad, p.unidad, p.precio_promedio,
-                       ROW_NUMBER() OVER (
-                           PARTITION BY p.producto_id, p.mercado_id, COALESCE(p.variedad,''), COALESCE(p.calidad,''), COALESCE(p.unidad,'')
-                           ORDER BY p.fecha DESC
-                       ) as rn
-                FROM precios p, fecha_actual fa
-                WHERE p.fecha < fa.fecha AND p.precio_promedio IS NOT NULL
-            ) ranked
-            WHERE rn <= 5
-            GROUP BY producto_id, mercado_id, var_key, cal_key, uni_key
-        ),
-        precios_anterior AS (
-            SELECT DISTINCT ON (p.producto_id, p.mercado_id, COALESCE(p.variedad,''), COALESCE(p.calidad,''), COALESCE(p.unidad,''))
-                p.producto_id, p.mercado_id, p.variedad, p.calidad, p.unidad,
-                p.precio_promedio, p.volumen, p.fecha
-            FROM precios p, fecha_actual fa
-            WHERE p.fecha <= fa.fecha - $1 * INTERVAL '1 day'
-              AND p.precio_promedio IS NOT NULL
-            ORDER BY p.producto_id, p.mercado_id, COALESCE(p.variedad,''), COALESCE(p.calidad,''), COALESCE(p.unidad,''), p.fecha DESC
+        WITH precios_hoy AS (
+            SELECT u.serie_id, u.precio_promedio, u.volumen, u.fecha
+            FROM precios_ultimos u
+            WHERE u.fecha = {SQL_FECHA_ACTUAL}
         )
         SELECT
             pr.nombre as producto, pr.categoria, m.nombre as mercado,
-            ph.variedad, ph.calidad, ph.unidad,
+            s.variedad, s.calidad, s.unidad,
             ph.precio_promedio as precio_actual,
             pa.precio_promedio as precio_anterior,
             ph.fecha as fecha_actual,
@@ -413,17 +1219,30 @@ async def get_variaciones(dias: int = 7, mercados: list[str] = None,
             END as variacion_pct,
             ph.precio_promedio - pa.precio_promedio as variacion_abs
         FROM precios_hoy ph
-        JOIN precios_anterior pa ON ph.producto_id = pa.producto_id AND ph.mercado_id = pa.mercado_id
-            AND COALESCE(ph.variedad,'') = COALESCE(pa.variedad,'')
-            AND COALESCE(ph.calidad,'') = COALESCE(pa.calidad,'')
-            AND COALESCE(ph.unidad,'') = COALESCE(pa.unidad,'')
-        JOIN productos pr ON ph.producto_id = pr.id
-        JOIN mercados m ON ph.mercado_id = m.id
+        JOIN series s ON s.id = ph.serie_id
+        JOIN productos pr ON s.producto_id = pr.id
+        JOIN mercados m ON s.mercado_id = m.id
+        JOIN LATERAL (
+            SELECT p.precio_promedio, p.volumen, p.fecha
+            FROM precios p
+            WHERE p.serie_id = ph.serie_id
+              AND p.fecha <= ph.fecha - $1 * INTERVAL '1 day'
+              AND p.precio_promedio IS NOT NULL
+            ORDER BY p.fecha DESC
+            LIMIT 1
+        ) pa ON TRUE
+        -- Promedio de últimos 5 registros para detectar anomalías
+        LEFT JOIN LATERAL (
+            SELECT AVG(r.precio_promedio) as precio_ref
+            FROM (
+                SELECT p.precio_promedio
+                FROM precios p
+                WHERE p.serie_id = ph.serie_id AND p.fecha < ph.fecha AND p.precio_promedio IS NOT NULL
+                ORDER BY p.fecha DESC
+                LIMIT 5
+            ) r
+        ) ref ON TRUE
         -- Filtrar anomalías: excluir si precio anterior se desvía >80% del promedio referencia
-        LEFT JOIN precio_referencia ref ON pa.producto_id = ref.producto_id AND pa.mercado_id = ref.mercado_id
-            AND COALESCE(pa.variedad,'') = ref.var_key
-            AND COALESCE(pa.calidad,'') = ref.cal_key
-            AND COALESCE(pa.unidad,'') = ref.uni_key
         WHERE 1=1 {filtros_mercado} {filtros_producto}
           AND (ref.precio_ref IS NULL OR (
               pa.precio_promedio BETWEEN ref.precio_ref * 0.2 AND ref.precio_ref * 5
@@ -442,58 +1261,85 @@ async def get_serie_temporal(producto: str, mercados: list[str] = None,
                              variedad: str = None, calidad: str = None, unidad: str = None,
                              agregacion: str = "diario") -> list[dict]:
     """Serie temporal de un producto en uno o más mercados.
-    agregacion: 'diario', 'semanal' o 'mensual'"""
-
-    # Selección de campo fecha según agregación
-    if agregacion == "semanal":
-        fecha_expr = "DATE_TRUNC('week', p.fecha)::date"
-    elif agregacion == "mensual":
-        fecha_expr = "DATE_TRUNC('month', p.fecha)::date"
-    else:
-        fecha_expr = "p.fecha"
-
-    query = f"""
-        SELECT {fecha_expr} as fecha, m.nombre as mercado,
-               p.variedad, COALESCE(p.calidad, 'Sin calidad') as calidad, p.unidad,
-               ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
-               ROUND(AVG(p.precio_min)::numeric, 0) as precio_min,
-               ROUND(AVG(p.precio_max)::numeric, 0) as precio_max,
-               ROUND(AVG(p.volumen)::numeric, 0) as volumen
-        FROM precios p
-        JOIN mercados m ON p.mercado_id = m.id
-        JOIN productos pr ON p.producto_id = pr.id
-        WHERE pr.nombre = $1
-    """
+    agregacion: 'diario', 'semanal' o 'mensual'. Sólo cuentan los días dentro de
+    [fecha_inicio, fecha_fin]: en semanal y mensual los períodos completos del rango se
+    leen de los agregados por serie, y los de los bordes (parciales) se calculan desde precios."""
     params = [producto]
-    idx = 2
-
+    condiciones = []  # {f}: alias de la tabla con variedad/calidad/unidad
     if mercados:
-        query += f" AND m.nombre = ANY(${idx})"
         params.append(mercados)
-        idx += 1
+        condiciones.append(f"m.nombre = ANY(${len(params)})")
+    for columna, valor in (("variedad", variedad), ("calidad", calidad), ("unidad", unidad)):
+        if valor:
+            params.append(valor)
+            condiciones.append(f"{{f}}.{columna} = ${len(params)}")
+
+    def filtros(formato: str, extra: list[str]) -> str:
+        return "".join(f" AND {c}" for c in [c.format(f=formato) for c in condiciones] + extra)
+
+    rango = []
     if fecha_inicio:
-        query += f" AND p.fecha >= ${idx}"
         params.append(fecha_inicio)
-        idx += 1
+        rango.append(f"p.fecha >= ${len(params)}")
     if fecha_fin:
-        query += f" AND p.fecha <= ${idx}"
         params.append(fecha_fin)
-        idx += 1
-    if variedad:
-        query += f" AND p.variedad = ${idx}"
-        params.append(variedad)
-        idx += 1
-    if calidad:
-        query += f" AND p.calidad = ${idx}"
-        params.append(calidad)
-        idx += 1
-    if unidad:
-        query += f" AND p.unidad = ${idx}"
-        params.append(unidad)
-        idx += 1
+        rango.append(f"p.fecha <= ${len(params)}")
 
-    query += f" GROUP BY {fecha_expr}, m.nombre, p.variedad, p.calidad, p.unidad"
-    query += f" ORDER BY {fecha_expr}, m.nombre, p.calidad"
+    def desde_precios(fecha_expr: str, extra: list[str]) -> str:
+        return f"""
+            SELECT {fecha_expr} as fecha, m.nombre as mercado,
+                   p.variedad, COALESCE(p.calidad, 'Sin calidad') as calidad, p.unidad,
+                   ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
+                   ROUND(AVG(p.precio_min)::numeric, 0) as precio_min,
+                   ROUND(AVG(p.precio_max)::numeric, 0) as precio_max,
+                   ROUND(AVG(p.volumen)::numeric, 0) as volumen,
+                   p.calidad as orden_calidad
+            FROM precios p
+            JOIN mercados m ON p.mercado_id = m.id
+            JOIN productos pr ON p.producto_id = pr.id
+            WHERE pr.nombre = $1{filtros("p", extra)}
+            GROUP BY {fecha_expr}, m.nombre, p.variedad, p.calidad, p.unidad
+        """
+
+    if agregacion in ("semanal", "mensual"):
+        # Períodos completos dentro del rango: [completos_desde, completos_hasta)
+        completos, bordes = [], []
+        if fecha_inicio:
+            inicio, fin = _rango_periodos(agregacion, fecha_inicio, fecha_inicio)
+            params.append(fecha_inicio if inicio == fecha_inicio else fin)
+            completos.append(f"a.periodo >= ${len(params)}")
+            bordes.append(f"p.fecha < ${len(params)}")
+        if fecha_fin:
+            params.append(_rango_periodos(agregacion, fecha_fin + timedelta(days=1), fecha_fin)[0])
+            completos.append(f"a.periodo < ${len(params)}")
+            bordes.append(f"p.fecha >= ${len(params)}")
+        periodo = AGREGADOS[agregacion][2]
+        query = f"""
+            SELECT a.periodo as fecha, m.nombre as mercado,
+                   s.variedad, COALESCE(s.calidad, 'Sin calidad') as calidad, s.unidad,
+                   {promedio_agregado("promedio")} as precio_promedio,
+                   {promedio_agregado("min")} as precio_min,
+                   {promedio_agregado("max")} as precio_max,
+                   {promedio_agregado("volumen")} as volumen,
+                   s.calidad as orden_calidad
+            FROM {AGREGADOS[agregacion][0]} a
+            JOIN series s ON a.serie_id = s.id
+            JOIN mercados m ON s.mercado_id = m.id
+            JOIN productos pr ON s.producto_id = pr.id
+            WHERE pr.nombre = $1{filtros("s", completos)}
+            GROUP BY a.periodo, m.nombre, s.variedad, s.calidad, s.unidad
+        """
+        if bordes:
+            query += f" UNION ALL {desde_precios(periodo, rango + ['(' + ' OR '.join(bordes) + ')'])}"
+    else:
+        # Diario: una fila por serie y fecha, directo de precios
+        query = desde_precios("p.fecha", rango)
+
+    query = f"""
+        SELECT fecha, mercado, variedad, calidad, unidad, precio_promedio, precio_min, precio_max, volumen
+        FROM ({query}) t
+        ORDER BY fecha, mercado, orden_calidad
+    """
 
     async with pool.acquire() as conn:
         rows = await conn.fetch(query, *params)
@@ -501,38 +1347,31 @@ async def get_serie_temporal(producto: str, mercados: list[str] = None,
 
 
 async def get_spread_mercados(fecha: date = None) -> list[dict]:
-    """Spread de precios entre mercados para cada producto (mismo formato)"""
-    query = """
+    """Spread de precios entre mercados para cada producto (mismo formato).
+    Sin fecha usa la fecha actual, leída de precios_ultimos."""
+    query = f"""
         WITH datos AS (
-            SELECT pr.nombre as producto, pr.categoria, m.nombre as mercado,
-                   p.variedad, p.calidad, p.unidad, p.precio_promedio, p.fecha
-            FROM precios p
-            JOIN mercados m ON p.mercado_id = m.id
-            JOIN productos pr ON p.producto_id = pr.id
-            WHERE p.fecha = COALESCE($1, (SELECT MAX(fecha) FROM precios))
+            SELECT s.producto_id, s.variedad, s.calidad, s.unidad, m.nombre as mercado, p.precio_promedio
+            FROM {"precios" if fecha else "precios_ultimos"} p
+            JOIN series s ON s.id = p.serie_id
+            JOIN mercados m ON s.mercado_id = m.id
+            WHERE p.fecha = COALESCE($1, {SQL_FECHA_ACTUAL})
             AND p.precio_promedio IS NOT NULL
         )
-        SELECT producto, categoria, variedad, calidad, unidad,
-               MIN(precio_promedio) as precio_min_mercado,
-               MAX(precio_promedio) as precio_max_mercado,
-               MAX(precio_promedio) - MIN(precio_promedio) as spread,
-               CASE WHEN MIN(precio_promedio) > 0
-                    THEN ROUND(((MAX(precio_promedio) - MIN(precio_promedio)) / MIN(precio_promedio) * 100)::numeric, 2)
+        SELECT pr.nombre as producto, pr.categoria, d.variedad, d.calidad, d.unidad,
+               MIN(d.precio_promedio) as precio_min_mercado,
+               MAX(d.precio_promedio) as precio_max_mercado,
+               MAX(d.precio_promedio) - MIN(d.precio_promedio) as spread,
+               CASE WHEN MIN(d.precio_promedio) > 0
+                    THEN ROUND(((MAX(d.precio_promedio) - MIN(d.precio_promedio)) / MIN(d.precio_promedio) * 100)::numeric, 2)
                     ELSE NULL END as spread_pct,
-               (SELECT mercado FROM datos d2 WHERE d2.producto = datos.producto
-                AND COALESCE(d2.variedad,'') = COALESCE(datos.variedad,'')
-                AND COALESCE(d2.calidad,'') = COALESCE(datos.calidad,'')
-                AND COALESCE(d2.unidad,'') = COALESCE(datos.unidad,'')
-                AND d2.precio_promedio = MIN(datos.precio_promedio) LIMIT 1) as mercado_barato,
-               (SELECT mercado FROM datos d3 WHERE d3.producto = datos.producto
-                AND COALESCE(d3.variedad,'') = COALESCE(datos.variedad,'')
-                AND COALESCE(d3.calidad,'') = COALESCE(datos.calidad,'')
-                AND COALESCE(d3.unidad,'') = COALESCE(datos.unidad,'')
-                AND d3.precio_promedio = MAX(datos.precio_promedio) LIMIT 1) as mercado_caro,
-               COUNT(DISTINCT mercado) as num_mercados
-        FROM datos
-        GROUP BY producto, categoria, variedad, calidad, unidad
-        HAVING COUNT(DISTINCT mercado) > 1
+               (ARRAY_AGG(d.mercado ORDER BY d.precio_promedio, d.mercado))[1] as mercado_barato,
+               (ARRAY_AGG(d.mercado ORDER BY d.precio_promedio DESC, d.mercado))[1] as mercado_caro,
+               COUNT(DISTINCT d.mercado) as num_mercados
+        FROM datos d
+        JOIN productos pr ON pr.id = d.producto_id
+        GROUP BY pr.id, d.variedad, d.calidad, d.unidad
+        HAVING COUNT(DISTINCT d.mercado) > 1
         ORDER BY spread_pct DESC NULLS LAST
     """
 
@@ -551,7 +1390,7 @@ async def get_volatilidad(dias: int = 30, limit: int = 50, mercados: list[str] =
 
     query = f"""
         SELECT pr.nombre as producto, pr.categoria, m.nombre as mercado,
-               p.variedad, p.calidad, p.unidad,
+               s.variedad, s.calidad, s.unidad,
                ROUND(STDDEV(p.precio_promedio)::numeric, 2) as desviacion,
                ROUND(AVG(p.precio_promedio)::numeric, 2) as precio_medio,
                CASE WHEN AVG(p.precio_promedio) > 0
@@ -561,12 +1400,13 @@ async def get_volatilidad(dias: int = 30, limit: int = 50, mercados: list[str] =
                MAX(p.precio_promedio) as precio_max_periodo,
                COUNT(*) as observaciones
         FROM precios p
-        JOIN productos pr ON p.producto_id = pr.id
-        JOIN mercados m ON p.mercado_id = m.id
+        JOIN series s ON s.id = p.serie_id
+        JOIN productos pr ON s.producto_id = pr.id
+        JOIN mercados m ON s.mercado_id = m.id
         WHERE p.fecha >= CURRENT_DATE - $1 * INTERVAL '1 day'
         AND p.precio_promedio IS NOT NULL
         {filtro_mercado}
-        GROUP BY pr.nombre, pr.categoria, m.nombre, p.variedad, p.calidad, p.unidad
+        GROUP BY p.serie_id, pr.nombre, pr.categoria, m.nombre, s.variedad, s.calidad, s.unidad
         HAVING COUNT(*) >= 5
         ORDER BY coef_variacion DESC NULLS LAST
         LIMIT $2
@@ -580,14 +1420,15 @@ async def get_volatilidad(dias: int = 30, limit: int = 50, mercados: list[str] =
 async def get_estacionalidad(producto: str, mercado: str = None,
                               variedad: str = None, calidad: str = None, unidad: str = None) -> list[dict]:
     """Precio promedio por mes para análisis estacional"""
-    query = """
-        SELECT EXTRACT(MONTH FROM p.fecha)::int as mes,
-               EXTRACT(YEAR FROM p.fecha)::int as anio,
-               ROUND(AVG(p.precio_promedio)::numeric, 2) as precio_promedio,
-               ROUND(AVG(p.volumen)::numeric, 2) as volumen_promedio
-        FROM precios p
-        JOIN productos pr ON p.producto_id = pr.id
-        JOIN mercados m ON p.mercado_id = m.id
+    query = f"""
+        SELECT EXTRACT(MONTH FROM a.periodo)::int as mes,
+               EXTRACT(YEAR FROM a.periodo)::int as anio,
+               {promedio_agregado("promedio", 2)} as precio_promedio,
+               {promedio_agregado("volumen", 2)} as volumen_promedio
+        FROM precios_mensuales a
+        JOIN series s ON a.serie_id = s.id
+        JOIN productos pr ON s.producto_id = pr.id
+        JOIN mercados m ON s.mercado_id = m.id
         WHERE pr.nombre = $1
     """
     params = [producto]
@@ -598,15 +1439,15 @@ async def get_estacionalidad(producto: str, mercado: str = None,
         params.append(mercado)
         idx += 1
     if variedad:
-        query += f" AND p.variedad = ${idx}"
+        query += f" AND s.variedad = ${idx}"
         params.append(variedad)
         idx += 1
     if calidad:
-        query += f" AND p.calidad = ${idx}"
+        query += f" AND s.calidad = ${idx}"
         params.append(calidad)
         idx += 1
     if unidad:
-        query += f" AND p.unidad = ${idx}"
+        query += f" AND s.unidad = ${idx}"
         params.append(unidad)
         idx += 1
 
@@ -669,17 +1510,18 @@ async def get_correlaciones(producto: str, mercado: str, top_n: int = 10,
 
 async def get_heatmap(fecha: date = None, dias: int = None) -> list[dict]:
     """Datos para heatmap: precio promedio por producto x mercado.
-    Si dias > 0, promedia los últimos N días en vez de solo una fecha."""
+    Si dias > 0, promedia los últimos N días (agregado diario) en vez de solo una fecha;
+    sin fecha usa la fecha actual, leída de precios_ultimos."""
     if dias and dias > 1:
-        query = """
+        query = f"""
             SELECT pr.nombre as producto, pr.categoria, m.nombre as mercado,
-                   ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
-                   COUNT(*) as num_registros
-            FROM precios p
-            JOIN productos pr ON p.producto_id = pr.id
-            JOIN mercados m ON p.mercado_id = m.id
-            WHERE p.fecha >= (SELECT MAX(fecha) FROM precios) - $1 * INTERVAL '1 day'
-            AND p.precio_promedio IS NOT NULL
+                   {promedio_agregado("promedio")} as precio_promedio,
+                   SUM(a.n_promedio) as num_registros
+            FROM precios_diarios a
+            JOIN productos pr ON a.producto_id = pr.id
+            JOIN mercados m ON a.mercado_id = m.id
+            WHERE a.periodo >= {SQL_FECHA_ACTUAL} - $1 * INTERVAL '1 day'
+            AND a.n_promedio > 0
             GROUP BY pr.nombre, pr.categoria, m.nombre
             ORDER BY pr.categoria, pr.nombre, m.nombre
         """
@@ -687,14 +1529,14 @@ async def get_heatmap(fecha: date = None, dias: int = None) -> list[dict]:
             rows = await conn.fetch(query, dias)
             return [dict(r) for r in rows]
     else:
-        query = """
+        query = f"""
             SELECT pr.nombre as producto, pr.categoria, m.nombre as mercado,
                    ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
                    COUNT(*) as num_registros
-            FROM precios p
+            FROM {"precios" if fecha else "precios_ultimos"} p
             JOIN productos pr ON p.producto_id = pr.id
             JOIN mercados m ON p.mercado_id = m.id
-            WHERE p.fecha = COALESCE($1, (SELECT MAX(fecha) FROM precios))
+            WHERE p.fecha = COALESCE($1, {SQL_FECHA_ACTUAL})
             AND p.precio_promedio IS NOT NULL
             GROUP BY pr.nombre, pr.categoria, m.nombre
             ORDER BY pr.categoria, pr.nombre, m.nombre
@@ -705,32 +1547,33 @@ async def get_heatmap(fecha: date = None, dias: int = None) -> list[dict]:
 
 
 async def get_resumen_diario(fecha: date = None, mercado: str = None) -> dict:
-    """Resumen del día: totales + top subidas/bajadas, opcionalmente filtrado por mercado"""
+    """Resumen del día: totales + top subidas/bajadas, opcionalmente filtrado por mercado.
+    Sin fecha resume la fecha actual desde precios_ultimos."""
+    origen = "precios" if fecha else "precios_ultimos"
     async with pool.acquire() as conn:
         if not fecha:
-            row = await conn.fetchrow("SELECT MAX(fecha) as fecha FROM precios")
-            fecha = row["fecha"]
+            fecha = await conn.fetchval(f"SELECT {SQL_FECHA_ACTUAL}")
 
         if not fecha:
             return {"fecha": None, "total_productos": 0, "total_mercados": 0,
                     "top_subidas": [], "top_bajadas": [], "precio_promedio_general": None}
 
         if mercado:
-            stats = await conn.fetchrow("""
+            stats = await conn.fetchrow(f"""
                 SELECT COUNT(DISTINCT pr.nombre) as total_productos,
                        1 as total_mercados,
                        ROUND(AVG(p.precio_promedio)::numeric, 2) as precio_promedio_general
-                FROM precios p
+                FROM {origen} p
                 JOIN productos pr ON p.producto_id = pr.id
                 JOIN mercados m ON p.mercado_id = m.id
                 WHERE p.fecha = $1 AND m.nombre = $2
             """, fecha, mercado)
         else:
-            stats = await conn.fetchrow("""
+            stats = await conn.fetchrow(f"""
                 SELECT COUNT(DISTINCT pr.nombre) as total_productos,
                        COUNT(DISTINCT m.nombre) as total_mercados,
                        ROUND(AVG(p.precio_promedio)::numeric, 2) as precio_promedio_general
-                FROM precios p
+                FROM {origen} p
                 JOIN productos pr ON p.producto_id = pr.id
                 JOIN mercados m ON p.mercado_id = m.id
                 WHERE p.fecha = $1
@@ -770,8 +1613,64 @@ async def get_importaciones() -> list[dict]:
         return [dict(r) for r in rows]
 
 
+async def get_metricas_importacion(dias: int = 30) -> list[dict]:
+    """Métricas de importación agregadas por día de importación y estado (ok, error,
+    sin_datos, no_disponible...), y por etapa: boletines, bytes, filas y segundos
+    (promedio, p95, total) de descarga, parseo, resolución de dimensiones e inserción,
+    más los patrones de URL usados."""
+    etapas = ["t_descarga", "t_parseo", "t_dimensiones", "t_insercion"]
+    agregados = ",\n                ".join(
+        f"AVG({e}) AS {e}_prom, "
+        f"percentile_cont(0.95) WITHIN GROUP (ORDER BY {e}) AS {e}_p95, "
+        f"SUM({e}) AS {e}_total"
+        for e in etapas
+    )
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT
+                fecha_importacion::date AS dia,
+                estado,
+                COUNT(*) AS boletines,
+                SUM(bytes) AS bytes,
+                SUM(filas_parseadas) AS filas_parseadas,
+                SUM(insertados) AS insertados,
+                SUM(actualizados) AS actualizados,
+                jsonb_object_agg(COALESCE(patron_url, 'desconocido'), n_patron) AS patrones,
+                {agregados}
+            FROM (
+                SELECT *, COUNT(*) OVER (PARTITION BY fecha_importacion::date, estado, patron_url) AS n_patron
+                FROM importaciones
+                WHERE fecha_importacion >= CURRENT_DATE - $1::int
+            ) i
+            GROUP BY dia, estado
+            ORDER BY dia DESC, estado
+        """, dias)
+
+    resultado = []
+    for r in rows:
+        resultado.append({
+            "dia": str(r["dia"]),
+            "estado": r["estado"],
+            "boletines": r["boletines"],
+            "bytes": r["bytes"],
+            "filas_parseadas": r["filas_parseadas"],
+            "insertados": r["insertados"],
+            "actualizados": r["actualizados"],
+            "patrones": json.loads(r["patrones"]) if r["patrones"] else {},
+            "etapas": {
+                e[2:]: {
+                    "promedio_s": round(r[f"{e}_prom"], 3) if r[f"{e}_prom"] is not None else None,
+                    "p95_s": round(r[f"{e}_p95"], 3) if r[f"{e}_p95"] is not None else None,
+                    "total_s": round(r[f"{e}_total"], 2) if r[f"{e}_total"] is not None else None,
+                }
+                for e in etapas
+            },
+        })
+    return resultado
+
+
 async def get_fechas_disponibles() -> list[str]:
     """Listar fechas con datos disponibles"""
     async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT DISTINCT fecha FROM precios ORDER BY fecha DESC")
+        rows = await conn.fetch("SELECT fecha FROM fechas_precios WHERE registros > 0 ORDER BY fecha DESC")
         return [str(r["fecha"]) for r in rows]
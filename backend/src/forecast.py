@@ -149,28 +149,46 @@ def _optimize_exp(y):
 # ═══════════════════════════════════════════════════════════════
 
 async def _obtener_datos(producto, mercados, variedad, calidad, unidad, granularidad):
-    """Obtener datos históricos según granularidad (diario/semanal/mensual)."""
-    if granularidad == "semanal":
-        fecha_expr = "DATE_TRUNC('week', p.fecha)::date"
-    elif granularidad == "diario":
-        fecha_expr = "p.fecha"
+    """Obtener datos históricos según granularidad (diario/semanal/mensual).
+    Se leen de los agregados de precios; sólo el diario filtrado por formato va a precios.
+    Como en precios, sólo cuentan las filas con precio promedio (medidas "_valido")."""
+    por_formato = variedad or calidad or unidad
+
+    if granularidad == "diario" and por_formato:
+        query = """
+            SELECT p.fecha as periodo,
+                   ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
+                   ROUND(AVG(p.precio_min)::numeric, 0) as precio_min,
+                   ROUND(AVG(p.precio_max)::numeric, 0) as precio_max,
+                   ROUND(AVG(p.volumen)::numeric, 0) as volumen,
+                   COUNT(*) as registros
+            FROM precios p
+            JOIN mercados m ON p.mercado_id = m.id
+            JOIN productos pr ON p.producto_id = pr.id
+            WHERE pr.nombre = $1
+              AND p.precio_promedio IS NOT NULL
+              AND p.precio_promedio > 0
+        """
+        formato, agrupar = "p", " GROUP BY p.fecha"
     else:
-        fecha_expr = "DATE_TRUNC('month', p.fecha)::date"
-
-    query = f"""
-        SELECT {fecha_expr} as periodo,
-               ROUND(AVG(p.precio_promedio)::numeric, 0) as precio_promedio,
-               ROUND(AVG(p.precio_min)::numeric, 0) as precio_min,
-               ROUND(AVG(p.precio_max)::numeric, 0) as precio_max,
-               ROUND(AVG(p.volumen)::numeric, 0) as volumen,
-               COUNT(*) as registros
-        FROM precios p
-        JOIN mercados m ON p.mercado_id = m.id
-        JOIN productos pr ON p.producto_id = pr.id
-        WHERE pr.nombre = $1
-          AND p.precio_promedio IS NOT NULL
-          AND p.precio_promedio > 0
-    """
+        if granularidad == "diario":
+            # Diario de todos los formatos: agregado por producto y mercado
+            origen = "precios_diarios a JOIN mercados m ON a.mercado_id = m.id JOIN productos pr ON a.producto_id = pr.id"
+        else:
+            tabla = _db.AGREGADOS["semanal" if granularidad == "semanal" else "mensual"][0]
+            origen = (f"{tabla} a JOIN series s ON a.serie_id = s.id "
+                      "JOIN mercados m ON s.mercado_id = m.id JOIN productos pr ON s.producto_id = pr.id")
+        query = f"""
+            SELECT a.periodo,
+                   {_db.promedio_agregado("promedio")} as precio_promedio,
+                   {_db.promedio_agregado("min_valido")} as precio_min,
+                   {_db.promedio_agregado("max_valido")} as precio_max,
+                   {_db.promedio_agregado("volumen_valido")} as volumen,
+                   SUM(a.n_promedio) as registros
+            FROM {origen}
+            WHERE pr.nombre = $1
+        """
+        formato, agrupar = "s", " GROUP BY a.periodo HAVING SUM(a.n_promedio) > 0"
     params = [producto]
     idx = 2
 
@@ -179,19 +197,19 @@ async def _obtener_datos(producto, mercados, variedad, calidad, unidad, granular
         params.append(mercados)
         idx += 1
     if variedad:
-        query += f" AND p.variedad = ${idx}"
+        query += f" AND {formato}.variedad = ${idx}"
         params.append(variedad)
         idx += 1
     if calidad:
-        query += f" AND p.calidad = ${idx}"
+        query += f" AND {formato}.calidad = ${idx}"
         params.append(calidad)
         idx += 1
     if unidad:
-        query += f" AND p.unidad = ${idx}"
+        query += f" AND {formato}.unidad = ${idx}"
         params.append(unidad)
         idx += 1
 
-    query += f" GROUP BY {fecha_expr} ORDER BY periodo"
+    query += f"{agrupar} ORDER BY periodo"
 
     pool = _get_pool()
     async with pool.acquire() as conn:
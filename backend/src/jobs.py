@@ -0,0 +1,112 @@
+"""
+Worker de la cola durable de importaciones (tablas import_jobs / import_job_items).
+Cada proceso de la API corre un worker que reclama lotes de fechas con
+FOR UPDATE SKIP LOCKED y los pasa por el pipeline descarga → parseo → carga.
+El progreso vive en la base de datos: sobrevive a reinicios y es el mismo
+para todos los procesos.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import date
+from typing import Optional
+
+from src.config import (
+    IMPORT_JOBS_LOTE, IMPORT_JOBS_POLL_SEG, IMPORT_JOBS_LEASE_SEG, IMPORT_JOBS_MAX_INTENTOS,
+)
+from src.database import (
+    crear_import_job, tomar_items_import_job, completar_item_import_job, liberar_items_import_job,
+)
+from src.scraper import crear_pipeline_importacion, importar_fechas
+from src.pipeline import Pipeline
+from src.calendario import dias_habiles
+from src import raw_store
+
+logger = logging.getLogger("agroprice.jobs")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_worker_task: Optional[asyncio.Task] = None
+_despertar = asyncio.Event()
+# Pipeline del lote en curso en este proceso (para estadísticas por etapa)
+pipeline_actual: Optional[Pipeline] = None
+
+
+async def encolar_importacion(fecha_inicio: date, fecha_fin: date,
+                              forzar: bool = False, reparsear: bool = False) -> int:
+    """Crear un job con una fecha por ítem. Con reparsear, sólo las fechas del almacén local."""
+    if reparsear:
+        fechas = await asyncio.to_thread(raw_store.fechas_almacenadas, fecha_inicio, fecha_fin)
+    else:
+        fechas = dias_habiles(fecha_inicio, fecha_fin)
+    job_id = await crear_import_job(fecha_inicio, fecha_fin, fechas, forzar, reparsear)
+    logger.info(f"Job de importación {job_id}: {len(fechas)} fechas ({fecha_inicio} → {fecha_fin})")
+    _despertar.set()
+    return job_id
+
+
+async def _procesar_lote(lote: dict):
+    global pipeline_actual
+    job_id = lote["job_id"]
+
+    async def completar(resultado: dict):
+        await completar_item_import_job(job_id, date.fromisoformat(resultado["fecha"]),
+                                        resultado["estado"], resultado["registros"])
+
+    pipeline_actual = crear_pipeline_importacion(al_terminar=completar)
+    await importar_fechas(lote["fechas"], forzar=lote["forzar"] or lote["reparsear"],
+                          pipeline=pipeline_actual, desde_store=lote["reparsear"])
+
+
+async def _loop_worker():
+    logger.info(f"Worker de importaciones {WORKER_ID} iniciado")
+    while True:
+        try:
+            lote = await tomar_items_import_job(WORKER_ID, IMPORT_JOBS_LOTE,
+                                                IMPORT_JOBS_LEASE_SEG, IMPORT_JOBS_MAX_INTENTOS)
+        except Exception as e:
+            logger.error(f"Worker de importaciones: error tomando trabajo: {e}")
+            lote = None
+
+        if lote is None:
+            # Sin trabajo: esperar un job nuevo de este proceso o el próximo sondeo
+            _despertar.clear()
+            try:
+                await asyncio.wait_for(_despertar.wait(), timeout=IMPORT_JOBS_POLL_SEG)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        logger.info(f"Worker {WORKER_ID}: job {lote['job_id']}, {len(lote['fechas'])} fechas "
+                    f"({lote['fechas'][0]} → {lote['fechas'][-1]})")
+        try:
+            await _procesar_lote(lote)
+        except Exception as e:
+            # Los ítems quedan en_curso y se re-toman al vencer el lease
+            logger.error(f"Worker de importaciones: lote del job {lote['job_id']} falló: {e}")
+
+
+def iniciar_worker():
+    """Lanzar el worker de la cola de importaciones de este proceso"""
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(_loop_worker())
+
+
+async def detener_worker():
+    """Detener el worker y devolver a la cola las fechas que tenía tomadas"""
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+        try:
+            liberados = await liberar_items_import_job(WORKER_ID)
+        except Exception as e:
+            logger.warning(f"No se pudieron liberar los ítems del worker {WORKER_ID}: {e}")
+            liberados = 0
+        logger.info(f"Worker de importaciones {WORKER_ID} detenido ({liberados} fechas devueltas a la cola)")
@@ -0,0 +1,114 @@
+"""
+Lote columnar de registros de precios de un boletín: contrato entre parser, pipeline
+y carga. En vez de un dict por fila, cada columna es un arreglo: las dimensiones de
+texto (mercado, producto, variedad, calidad, unidad) se guardan como códigos a un
+diccionario interno del lote y los valores numéricos en array('d') con NaN como nulo.
+Así el lote ocupa poco, se serializa rápido entre procesos y la carga lo pasa
+directo a COPY.
+"""
+import math
+from array import array
+from datetime import date
+from typing import Hashable, Iterator, Optional
+
+NULO = math.nan
+
+
+class Diccionario:
+    """Valores distintos de una columna de texto, con su código (posición) en el lote"""
+
+    def __init__(self):
+        self.valores: list = []
+        self._codigos: dict = {}
+
+    def codigo(self, valor: Hashable) -> int:
+        cod = self._codigos.get(valor)
+        if cod is None:
+            cod = self._codigos[valor] = len(self.valores)
+            self.valores.append(valor)
+        return cod
+
+    def __len__(self) -> int:
+        return len(self.valores)
+
+    def __getstate__(self):
+        return self.valores
+
+    def __setstate__(self, valores):
+        self.valores = valores
+        self._codigos = {v: i for i, v in enumerate(valores)}
+
+
+class LoteRegistros:
+    """Registros de precios de una fecha en columnas paralelas"""
+
+    def __init__(self, fecha: date):
+        self.fecha = fecha
+        self.mercados = Diccionario()
+        self.productos = Diccionario()  # (nombre, categoria)
+        self.textos = Diccionario()     # variedad, calidad y unidad comparten diccionario
+        self.mercado = array("i")
+        self.producto = array("i")
+        self.variedad = array("i")
+        self.calidad = array("i")
+        self.unidad = array("i")
+        self.precio_min = array("d")
+        self.precio_max = array("d")
+        self.precio_promedio = array("d")
+        self.volumen = array("d")
+        self.textos.codigo(None)  # código 0 = NULL
+
+    def __len__(self) -> int:
+        return len(self.mercado)
+
+    def agregar(self, mercado: str, producto: str, categoria: str,
+                variedad: Optional[str], calidad: Optional[str], unidad: Optional[str],
+                precio_min: Optional[float], precio_max: Optional[float],
+                precio_promedio: Optional[float], volumen: Optional[float]):
+        self.mercado.append(self.mercados.codigo(mercado))
+        self.producto.append(self.productos.codigo((producto, categoria)))
+        self.variedad.append(self.textos.codigo(variedad))
+        self.calidad.append(self.textos.codigo(calidad))
+        self.unidad.append(self.textos.codigo(unidad))
+        self.precio_min.append(NULO if precio_min is None else precio_min)
+        self.precio_max.append(NULO if precio_max is None else precio_max)
+        self.precio_promedio.append(NULO if precio_promedio is None else precio_promedio)
+        self.volumen.append(NULO if volumen is None else volumen)
+
+    def filas(self, ids_mercado: list[int], ids_producto: list[int]) -> Iterator[tuple]:
+        """Filas para COPY: (orden, fecha, mercado_id, producto_id, variedad, calidad, unidad,
+        precio_min, precio_max, precio_promedio, volumen). `ids_*` traducen los códigos
+        del lote a ids de la base de datos."""
+        textos = self.textos.valores
+        fecha = self.fecha
+        for i in range(len(self)):
+            yield (
+                i, fecha, ids_mercado[self.mercado[i]], ids_producto[self.producto[i]],
+                textos[self.variedad[i]], textos[self.calidad[i]], textos[self.unidad[i]],
+                _valor(self.precio_min[i]), _valor(self.precio_max[i]),
+                _valor(self.precio_promedio[i]), _valor(self.volumen[i]),
+            )
+
+    def registros(self) -> list[dict]:
+        """El lote como lista de dicts, un registro por fila (para inspección y depuración)"""
+        mercados, productos, textos = self.mercados.valores, self.productos.valores, self.textos.valores
+        return [
+            {
+                "fecha": self.fecha,
+                "mercado": mercados[self.mercado[i]],
+                "producto": productos[self.producto[i]][0],
+                "categoria": productos[self.producto[i]][1],
+                "variedad": textos[self.variedad[i]],
+                "calidad": textos[self.calidad[i]],
+                "unidad": textos[self.unidad[i]],
+                "precio_min": _valor(self.precio_min[i]),
+                "precio_max": _valor(self.precio_max[i]),
+                "precio_promedio": _valor(self.precio_promedio[i]),
+                "volumen": _valor(self.volumen[i]),
+            }
+            for i in range(len(self))
+        ]
+
+
+def _valor(x: float) -> Optional[float]:
+    return None if x != x else x
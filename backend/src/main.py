@@ -8,22 +8,27 @@ from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 
-from src.config import PORT
+from src.config import PORT, IMPORT_JOBS_WORKER, HTTP_TRANSPORT_MODE, HTTP_CASSETTE_DIR
 from src.database import (
     init_db, close_db, get_mercados, get_productos, get_subcategorias, get_precios,
     get_variaciones, get_serie_temporal, get_spread_mercados,
     get_volatilidad, get_estacionalidad, get_correlaciones,
     get_heatmap, get_resumen_diario, get_importaciones,
-    get_fechas_disponibles
+    get_fechas_disponibles, get_import_job_status, get_metricas_importacion
 )
-from src.scraper import importar_boletin, importar_historico
-from src.scheduler import iniciar_scheduler, detener_scheduler, catch_up_importaciones
+from src.scraper import (
+    importar_boletin, importar_historico, reparsear_desde_store,
+    cerrar_pool_parseo, cerrar_http_client
+)
+from src.scheduler import iniciar_scheduler, detener_scheduler, es_lider
 from src.climate import (
     seed_zonas, importar_clima_todas_zonas, importar_clima_historico,
     get_zonas, get_clima_serie, get_clima_precio_serie,
-    get_alertas_clima, get_clima_correlacion
+    get_alertas_clima, get_clima_correlacion, cerrar_http_client as cerrar_http_client_clima
 )
 from src.forecast import predecir_precios
+from src import jobs
+from src.jobs import encolar_importacion
 # Models (usados internamente por scraper/database)
 
 # Logging
@@ -34,15 +39,6 @@ logging.basicConfig(
 logger = logging.getLogger("agroprice")
 
 
-async def _catch_up_on_startup():
-    """Background task: importar boletines perdidos desde la última importación exitosa."""
-    try:
-        await asyncio.sleep(3)
-        await catch_up_importaciones()
-    except Exception as e:
-        logger.error(f"Catch-up on startup falló: {e}")
-
-
 async def _auto_setup_clima():
     """Background task: seed zonas y mapeos producto→zona.
     Los datos climáticos se descargan on-demand cuando el usuario consulta."""
@@ -62,20 +58,28 @@ async def _auto_setup_clima():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup y shutdown"""
+    if HTTP_TRANSPORT_MODE != "live":
+        logger.warning(f"Transporte HTTP en modo {HTTP_TRANSPORT_MODE} (cassettes en {HTTP_CASSETTE_DIR})")
     await init_db()
+    # Scheduler en pausa; el proceso que gana la elección de líder lo reanuda y hace el catch-up
     iniciar_scheduler()
     # Seed zonas de producción (idempotente)
     try:
         await seed_zonas()
     except Exception as e:
         logger.warning(f"Seed zonas fallido (productos aún no importados?): {e}")
-    # Catch-up: importar boletines perdidos desde la última importación exitosa
-    asyncio.create_task(_catch_up_on_startup())
     # Lanzar auto-setup de clima como tarea en background (no bloquea el startup)
     asyncio.create_task(_auto_setup_clima())
-    logger.info("AgroPrice iniciado (catch-up + clima importándose en background)")
+    # Worker de la cola durable de importaciones (retoma jobs interrumpidos)
+    if IMPORT_JOBS_WORKER:
+        jobs.iniciar_worker()
+    logger.info("AgroPrice iniciado (clima importándose en background)")
     yield
-    detener_scheduler()
+    await detener_scheduler()
+    await jobs.detener_worker()
+    cerrar_pool_parseo()
+    await cerrar_http_client()
+    await cerrar_http_client_clima()
     await close_db()
     logger.info("AgroPrice detenido")
 
@@ -100,7 +104,7 @@ app.add_middleware(
 
 @app.get("/api/health")
 async def health():
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {"status": "ok", "timestamp": datetime.now().isoformat(), "lider": es_lider()}
 
 
 @app.get("/api/mercados")
@@ -337,87 +341,31 @@ async def importar_fecha(fecha: date, forzar: bool = False):
     return resultado
 
 
-# ============== BACKGROUND IMPORT TRACKING ==============
-
-_import_status = {
-    "running": False,
-    "progress": 0,
-    "total": 0,
-    "ok": 0,
-    "registros": 0,
-    "errors": 0,
-    "current_date": None,
-    "started_at": None,
-    "finished_at": None,
-}
-
-
-async def _run_background_import(fecha_inicio: date, fecha_fin: date, forzar: bool):
-    """Ejecutar importación en background con tracking"""
-    global _import_status
-    try:
-        from datetime import timedelta
-        # Generar lista de fechas hábiles
-        fechas = []
-        f = fecha_inicio
-        while f <= fecha_fin:
-            if f.weekday() < 5:
-                fechas.append(f)
-            f += timedelta(days=1)
-
-        _import_status.update({
-            "running": True, "progress": 0, "total": len(fechas),
-            "ok": 0, "registros": 0, "errors": 0,
-            "current_date": None, "started_at": datetime.now().isoformat(),
-            "finished_at": None
-        })
-
-        logger.info(f"Background import: {len(fechas)} fechas ({fecha_inicio} → {fecha_fin})")
-
-        semaforo = asyncio.Semaphore(5)
-
-        async def importar_con_tracking(fecha):
-            async with semaforo:
-                _import_status["current_date"] = str(fecha)
-                resultado = await importar_boletin(fecha, forzar=forzar)
-                _import_status["progress"] += 1
-                if resultado["estado"] == "ok":
-                    _import_status["ok"] += 1
-                    _import_status["registros"] += resultado["registros"]
-                elif resultado["estado"] not in ("ya_importado", "no_disponible"):
-                    _import_status["errors"] += 1
-                return resultado
-
-        await asyncio.gather(*[importar_con_tracking(f) for f in fechas])
-
-        _import_status["finished_at"] = datetime.now().isoformat()
-        _import_status["running"] = False
-        logger.info(f"Background import done: {_import_status['ok']} ok, {_import_status['registros']} reg")
-
-    except Exception as e:
-        logger.error(f"Background import error: {e}")
-        _import_status["running"] = False
-        _import_status["finished_at"] = datetime.now().isoformat()
-
-
 @app.post("/api/importar/historico")
 async def importar_hist(
     fecha_inicio: date,
     fecha_fin: Optional[date] = None,
     forzar: bool = False,
-    background: bool = True
+    background: bool = True,
+    reparsear: bool = False
 ):
-    """Importar boletines históricos. Con background=true retorna inmediatamente."""
+    """Importar boletines históricos. Con background=true retorna inmediatamente.
+    Con reparsear=true reconstruye precios desde el almacén local de boletines, sin red."""
     if fecha_fin is None:
         fecha_fin = date.today()
 
     if background:
-        if _import_status["running"]:
-            raise HTTPException(status_code=409, detail="Ya hay una importación en curso")
-        asyncio.create_task(_run_background_import(fecha_inicio, fecha_fin, forzar))
-        return {"status": "started", "mensaje": f"Importación iniciada en background ({fecha_inicio} → {fecha_fin})"}
+        job_id = await encolar_importacion(fecha_inicio, fecha_fin, forzar, reparsear)
+        return {
+            "status": "started",
+            "job_id": job_id,
+            "mensaje": f"Importación encolada ({fecha_inicio} → {fecha_fin}), ver /api/importar/status?job_id={job_id}",
+        }
     else:
-        resultados = await importar_historico(fecha_inicio, fecha_fin, forzar=forzar)
+        if reparsear:
+            resultados = await reparsear_desde_store(fecha_inicio, fecha_fin)
+        else:
+            resultados = await importar_historico(fecha_inicio, fecha_fin, forzar=forzar)
         total_ok = sum(1 for r in resultados if r["estado"] == "ok")
         total_registros = sum(r["registros"] for r in resultados)
         return {
@@ -429,12 +377,19 @@ async def importar_hist(
 
 
 @app.get("/api/importar/status")
-async def import_status():
-    """Ver progreso de la importación en curso"""
-    pct = round(_import_status["progress"] / _import_status["total"] * 100, 1) if _import_status["total"] > 0 else 0
+async def import_status(job_id: Optional[int] = None):
+    """Ver progreso de un job de importación (por defecto el último).
+    El progreso sale de la base de datos; `etapas` son las del lote en curso en este proceso."""
+    status = await get_import_job_status(job_id)
+    if status is None:
+        if job_id is not None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} no existe")
+        return {"running": False, "total": 0, "progress": 0, "porcentaje": 0, "etapas": None}
+    pct = round(status["progress"] / status["total"] * 100, 1) if status["total"] > 0 else 0
     return {
-        **_import_status,
-        "porcentaje": pct
+        **status,
+        "porcentaje": pct,
+        "etapas": jobs.pipeline_actual.estadisticas() if jobs.pipeline_actual else None,
     }
 
 
@@ -444,6 +399,12 @@ async def listar_importaciones():
     return await get_importaciones()
 
 
+@app.get("/api/importaciones/metricas")
+async def metricas_importaciones(dias: int = Query(30, ge=1, le=365)):
+    """Tiempos, bytes y filas por etapa de importación, agregados por día"""
+    return await get_metricas_importacion(dias)
+
+
 # ============== EXPORT CSV ==============
 
 @app.get("/api/export/csv")
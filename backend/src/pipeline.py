@@ -0,0 +1,119 @@
+"""
+Pipeline por etapas para importaciones masivas: descarga → parseo → carga.
+Cada etapa tiene su propia concurrencia y una cola acotada de entrada, así una
+etapa lenta frena a las anteriores (backpressure) sin bloquear a las demás.
+"""
+import asyncio
+import inspect
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger("agroprice.pipeline")
+
+
+class Etapa:
+    """Etapa del pipeline: una función async que recibe un trabajo (dict) y lo completa.
+    Si la función deja `estado` en el trabajo, éste termina ahí y no pasa a la etapa siguiente."""
+
+    def __init__(self, nombre: str, funcion: Callable[[dict], Awaitable[None]], concurrencia: int):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.concurrencia = max(1, concurrencia)
+        self.cola: Optional[asyncio.Queue] = None
+        self.procesados = 0
+        self.errores = 0
+        self.segundos = 0.0
+
+    def estadisticas(self, transcurrido: float) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "procesados": self.procesados,
+            "errores": self.errores,
+            "en_cola": self.cola.qsize() if self.cola else 0,
+            "segundos_ocupado": round(self.segundos, 2),
+            "por_segundo": round(self.procesados / transcurrido, 2) if transcurrido > 0 else 0.0,
+        }
+
+
+class Pipeline:
+    """Ejecuta trabajos a través de una secuencia de etapas conectadas por colas acotadas.
+    `al_terminar` (función o corrutina) se llama con cada trabajo apenas termina."""
+
+    def __init__(self, etapas: list[Etapa], tamano_cola: int = 16,
+                 al_terminar: Callable[[dict], Optional[Awaitable[None]]] = None):
+        self.etapas = etapas
+        self.tamano_cola = max(1, tamano_cola)
+        self.al_terminar = al_terminar
+        self.inicio: Optional[float] = None
+        self.fin: Optional[float] = None
+
+    def estadisticas(self) -> dict:
+        """Contadores por etapa (procesados, errores, cola, throughput)"""
+        if self.inicio is None:
+            transcurrido = 0.0
+        else:
+            transcurrido = (self.fin or time.monotonic()) - self.inicio
+        return {e.nombre: e.estadisticas(transcurrido) for e in self.etapas}
+
+    async def _terminar(self, trabajo: dict, resultados: list[dict]):
+        resultados.append(trabajo)
+        if self.al_terminar:
+            try:
+                resultado = self.al_terminar(trabajo)
+                if inspect.isawaitable(resultado):
+                    await resultado
+            except Exception as e:
+                logger.warning(f"Callback al_terminar falló: {e}")
+
+    async def _worker(self, idx: int, resultados: list[dict]):
+        etapa = self.etapas[idx]
+        siguiente = self.etapas[idx + 1].cola if idx + 1 < len(self.etapas) else None
+        while True:
+            trabajo = await etapa.cola.get()
+            t0 = time.monotonic()
+            try:
+                await etapa.funcion(trabajo)
+            except Exception as e:
+                etapa.errores += 1
+                logger.error(f"Pipeline [{etapa.nombre}] {trabajo.get('fecha')}: {e}")
+                trabajo["estado"] = "error"
+                trabajo["detalle"] = str(e)
+            etapa.segundos += time.monotonic() - t0
+            etapa.procesados += 1
+
+            if "estado" in trabajo or siguiente is None:
+                await self._terminar(trabajo, resultados)
+            else:
+                # Bloquea si la etapa siguiente está saturada (backpressure)
+                await siguiente.put(trabajo)
+            etapa.cola.task_done()
+
+    async def ejecutar(self, trabajos: list[dict]) -> list[dict]:
+        """Procesar todos los trabajos y retornarlos completados (en orden de término)"""
+        resultados: list[dict] = []
+        for etapa in self.etapas:
+            etapa.cola = asyncio.Queue(maxsize=self.tamano_cola)
+
+        self.inicio = time.monotonic()
+        self.fin = None
+        workers = [
+            [asyncio.create_task(self._worker(i, resultados)) for _ in range(etapa.concurrencia)]
+            for i, etapa in enumerate(self.etapas)
+        ]
+        try:
+            for trabajo in trabajos:
+                await self.etapas[0].cola.put(trabajo)
+            # Los trabajos sólo avanzan: al vaciarse una etapa, sus workers ya no reciben nada
+            for etapa, tareas in zip(self.etapas, workers):
+                await etapa.cola.join()
+                for t in tareas:
+                    t.cancel()
+        finally:
+            for tareas in workers:
+                for t in tareas:
+                    t.cancel()
+            self.fin = time.monotonic()
+
+        logger.info(f"Pipeline completado en {self.fin - self.inicio:.1f}s: {self.estadisticas()}")
+        return resultados
@@ -0,0 +1,110 @@
+"""
+Almacén local de boletines descargados (archivos Excel originales de ODEPA).
+Cada versión se guarda por fecha y hash de contenido, junto con la URL y los
+headers ETag/Last-Modified para re-chequear con GET condicional. Permite
+re-parsear boletines sin volver a la red.
+
+Estructura: {RAW_STORE_DIR}/{YYYY}/{MM}/{YYYY-MM-DD}/{sha256}.xlsx + meta.json
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from src.config import RAW_STORE_DIR
+
+logger = logging.getLogger("agroprice.raw_store")
+
+
+def habilitado() -> bool:
+    """El almacén se desactiva con RAW_STORE_DIR vacío"""
+    return bool(RAW_STORE_DIR)
+
+
+def _dir_fecha(fecha: date) -> str:
+    return os.path.join(RAW_STORE_DIR, f"{fecha.year:04d}", f"{fecha.month:02d}", fecha.isoformat())
+
+
+def leer_meta(fecha: date) -> Optional[dict]:
+    """Metadata de la última versión guardada del boletín (url, etag, last_modified, sha256…)"""
+    if not habilitado():
+        return None
+    path = os.path.join(_dir_fecha(fecha), "meta.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Metadata inválida en {path}: {e}")
+        return None
+
+
+def leer_boletin(fecha: date) -> Optional[bytes]:
+    """Contenido de la última versión guardada del boletín, o None si no hay"""
+    meta = leer_meta(fecha)
+    if meta is None:
+        return None
+    path = os.path.join(_dir_fecha(fecha), f"{meta['sha256']}.xlsx")
+    try:
+        with open(path, "rb") as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        logger.warning(f"Almacén: falta el archivo {path} referenciado en meta.json")
+        return None
+    if hashlib.sha256(contenido).hexdigest() != meta["sha256"]:
+        logger.warning(f"Almacén: hash no coincide para {path}, ignorando")
+        return None
+    return contenido
+
+
+def guardar_boletin(fecha: date, contenido: bytes, url: str,
+                    etag: str = None, last_modified: str = None) -> Optional[str]:
+    """Guardar una versión del boletín y marcarla como la actual. Retorna el sha256.
+    Versiones anteriores con otro hash se conservan en el mismo directorio."""
+    if not habilitado():
+        return None
+    sha256 = hashlib.sha256(contenido).hexdigest()
+    directorio = _dir_fecha(fecha)
+    try:
+        os.makedirs(directorio, exist_ok=True)
+        path = os.path.join(directorio, f"{sha256}.xlsx")
+        if not os.path.exists(path):
+            _escribir_atomico(path, contenido)
+        meta = {
+            "fecha": fecha.isoformat(),
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": sha256,
+            "bytes": len(contenido),
+            "descargado": datetime.now().isoformat(timespec="seconds"),
+        }
+        _escribir_atomico(os.path.join(directorio, "meta.json"),
+                          json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+    except OSError as e:
+        logger.warning(f"Almacén: no se pudo guardar boletín {fecha}: {e}")
+        return None
+    return sha256
+
+
+def _escribir_atomico(path: str, contenido: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(contenido)
+    os.replace(tmp, path)
+
+
+def fechas_almacenadas(fecha_inicio: date, fecha_fin: date) -> list[date]:
+    """Fechas del rango que tienen un boletín guardado"""
+    if not habilitado():
+        return []
+    fechas = []
+    f = fecha_inicio
+    while f <= fecha_fin:
+        if os.path.exists(os.path.join(_dir_fecha(f), "meta.json")):
+            fechas.append(f)
+        f += timedelta(days=1)
+    return fechas
@@ -1,11 +1,22 @@
+import asyncio
 import logging
+import random
 from datetime import date, timedelta
+from typing import Optional
+
+import asyncpg
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from src.scraper import importar_hoy, importar_boletin
+from src.config import (
+    DATABASE_URL, LIDER_INTERVALO_SEG, CATCH_UP_CONCURRENCIA, CATCH_UP_PRESUPUESTO_SEG,
+    SONDEO_HORA_INICIO, SONDEO_HORA_FIN, SONDEO_BACKOFF_BASE_SEG, SONDEO_BACKOFF_MAX_SEG,
+    NO_DISPONIBLE_DIAS_RECIENTES,
+)
+from src.scraper import importar_boletin, importar_fechas, crear_pipeline_importacion, sondear_boletin
 from src.climate import importar_clima_diario
-from src.database import get_ultima_fecha_importada
+from src.database import get_ultima_fecha_importada, get_estado_importacion, crear_import_job
+from src.calendario import dias_habiles, es_dia_habil, ahora_chile
 
 logger = logging.getLogger("agroprice.scheduler")
 
@@ -14,22 +25,24 @@ scheduler = AsyncIOScheduler()
 
 def iniciar_scheduler():
     """Iniciar el scheduler para descarga diaria automática"""
-    # Ejecutar todos los días hábiles a las 14:00 (hora Chile)
-    # ODEPA actualiza el boletín durante la mañana
+    # Sondear desde media mañana la publicación del boletín del día e importarlo
+    # apenas aparezca (ODEPA no tiene hora fija de publicación)
     scheduler.add_job(
-        _tarea_diaria,
-        CronTrigger(day_of_week="mon-fri", hour=14, minute=0, timezone="America/Santiago"),
-        id="importar_boletin_diario",
-        name="Importar boletín diario ODEPA",
+        _tarea_sondeo,
+        CronTrigger(day_of_week="mon-fri", hour=SONDEO_HORA_INICIO, minute=0, timezone="America/Santiago"),
+        id="sondeo_boletin_diario",
+        name="Sondeo e importación del boletín diario ODEPA",
         replace_existing=True,
     )
 
-    # Reintento a las 17:00 por si falló el primero
+    # Al cerrar la ventana de sondeo, recuperar el boletín de hoy si no apareció a tiempo
+    # y cualquier día hábil anterior que haya quedado sin importar (con margen para que
+    # termine una importación del sondeo que haya partido justo antes del cierre)
     scheduler.add_job(
-        _tarea_reintento,
-        CronTrigger(day_of_week="mon-fri", hour=17, minute=0, timezone="America/Santiago"),
-        id="reintento_boletin_diario",
-        name="Reintento boletín diario ODEPA",
+        _tarea_catch_up,
+        CronTrigger(day_of_week="mon-fri", hour=SONDEO_HORA_FIN, minute=15, timezone="America/Santiago"),
+        id="catch_up_boletines",
+        name="Catch-up de boletines faltantes",
         replace_existing=True,
     )
 
@@ -42,29 +55,140 @@ def iniciar_scheduler():
         replace_existing=True,
     )
 
-    scheduler.start()
-    logger.info("Scheduler iniciado: ODEPA 14:00, clima 15:00, reintento 17:00 (hora Chile)")
+    # Todos los procesos arrancan el scheduler en pausa; sólo el líder lo reanuda
+    scheduler.start(paused=True)
+    logger.info(f"Scheduler iniciado en pausa: sondeo ODEPA {SONDEO_HORA_INICIO}:00-{SONDEO_HORA_FIN}:00, "
+                f"catch-up {SONDEO_HORA_FIN}:15, clima 15:00 (hora Chile)")
+    _iniciar_eleccion_lider()
 
 
-async def _tarea_diaria():
-    """Tarea programada: importar boletín del día"""
-    try:
-        resultado = await importar_hoy()
-        logger.info(f"Importación diaria: {resultado}")
-    except Exception as e:
-        logger.error(f"Error en importación diaria: {e}")
+# ============== ELECCIÓN DE LÍDER ==============
+# Con varios workers de la API, sólo uno (el que tiene el advisory lock de Postgres)
+# corre las tareas programadas y el catch-up. El lock es de sesión, en una conexión
+# propia fuera del pool: si el proceso líder muere, Postgres lo libera y otro
+# proceso lo toma en su siguiente intento.
+
+LIDER_LOCK_KEY = 0x41475250  # "AGRP"
+
+_lider_conn: Optional[asyncpg.Connection] = None
+_lider_task: Optional[asyncio.Task] = None
+_catch_up_task: Optional[asyncio.Task] = None
+
 
+def es_lider() -> bool:
+    return _lider_conn is not None
 
-async def _tarea_reintento():
-    """Reintento si la primera importación falló"""
+
+async def _tomar_liderazgo() -> bool:
+    """Intentar tomar el advisory lock en una conexión dedicada"""
+    global _lider_conn, _catch_up_task
+    conn = await asyncpg.connect(DATABASE_URL)
     try:
-        resultado = await importar_hoy()
-        if resultado["estado"] == "ya_importado":
-            logger.info("Reintento: boletín ya importado, no se necesita acción")
-        else:
-            logger.info(f"Reintento importación: {resultado}")
-    except Exception as e:
-        logger.error(f"Error en reintento: {e}")
+        tomado = await conn.fetchval("SELECT pg_try_advisory_lock($1)", LIDER_LOCK_KEY)
+    except Exception:
+        await conn.close()
+        raise
+    if not tomado:
+        await conn.close()
+        return False
+
+    _lider_conn = conn
+    scheduler.resume()
+    logger.info("Liderazgo tomado: este proceso corre las tareas programadas")
+    # El nuevo líder recupera lo que se perdió mientras no había (o cambiaba) líder
+    _catch_up_task = asyncio.create_task(catch_up_importaciones())
+    # Si el cambio de líder ocurre durante la ventana de sondeo, retomarlo ahora
+    if SONDEO_HORA_INICIO <= ahora_chile().hour < SONDEO_HORA_FIN:
+        scheduler.add_job(_tarea_sondeo, id="sondeo_boletin_hoy", replace_existing=True)
+    return True
+
+
+async def _soltar_liderazgo():
+    global _lider_conn
+    if scheduler.running:
+        scheduler.pause()
+    if _catch_up_task is not None:
+        _catch_up_task.cancel()
+    conn, _lider_conn = _lider_conn, None
+    if conn is not None:
+        try:
+            await conn.close(timeout=5)
+        except Exception:
+            conn.terminate()
+
+
+async def _loop_eleccion_lider():
+    while True:
+        try:
+            if _lider_conn is None:
+                await _tomar_liderazgo()
+            else:
+                # Verificar que la sesión (y con ella el lock) sigue viva
+                await _lider_conn.fetchval("SELECT 1", timeout=LIDER_INTERVALO_SEG)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _lider_conn is not None:
+                logger.warning(f"Liderazgo perdido (conexión del lock caída: {e}), pausando scheduler")
+                await _soltar_liderazgo()
+            else:
+                logger.warning(f"Elección de líder: no se pudo intentar el lock: {e}")
+        await asyncio.sleep(LIDER_INTERVALO_SEG)
+
+
+def _iniciar_eleccion_lider():
+    global _lider_task
+    if _lider_task is None:
+        _lider_task = asyncio.create_task(_loop_eleccion_lider())
+
+
+def _espera_backoff(intento: int) -> float:
+    """Backoff exponencial con jitter: entre la mitad y el total del tope del intento"""
+    tope = min(SONDEO_BACKOFF_MAX_SEG, SONDEO_BACKOFF_BASE_SEG * 2 ** intento)
+    return tope / 2 + random.uniform(0, tope / 2)
+
+
+async def _tarea_sondeo():
+    """Tarea programada: sondear con HEAD la publicación del boletín de hoy e importarlo
+    apenas aparezca. Termina cuando queda importado OK, al cerrar la ventana o si
+    este proceso deja de ser líder."""
+    ahora = ahora_chile()
+    hoy = ahora.date()
+    fin = ahora.replace(hour=SONDEO_HORA_FIN, minute=0, second=0, microsecond=0)
+    if not es_dia_habil(hoy):
+        logger.info(f"Sondeo: {hoy} no es día hábil, no hay boletín")
+        return
+
+    intento = 0
+    while es_lider():
+        try:
+            if await get_estado_importacion(hoy, NO_DISPONIBLE_DIAS_RECIENTES) == "ok":
+                logger.info(f"Sondeo: boletín {hoy} ya importado")
+                return
+            url = await sondear_boletin(hoy)
+            if url:
+                logger.info(f"Sondeo: boletín {hoy} publicado en {url} (intento {intento + 1}), importando")
+                # forzar: ignorar el caché negativo que pudo dejar un intento anterior del día
+                resultado = await importar_boletin(hoy, forzar=True)
+                logger.info(f"Importación diaria: {resultado}")
+                if resultado["estado"] in ("ok", "sin_cambios"):
+                    return
+        except Exception as e:
+            logger.error(f"Error en sondeo del boletín diario: {e}")
+
+        espera = _espera_backoff(intento)
+        intento += 1
+        if ahora_chile() + timedelta(seconds=espera) >= fin:
+            logger.warning(f"Sondeo: boletín {hoy} no publicado antes de las {SONDEO_HORA_FIN}:00, "
+                           f"queda para el catch-up de las {SONDEO_HORA_FIN}:15")
+            return
+        await asyncio.sleep(espera)
+
+
+async def _tarea_catch_up():
+    """Tarea programada: catch-up de boletines al cerrar la ventana de sondeo
+    (el clima ya lo importa su propia tarea)"""
+    await catch_up_importaciones(clima=False)
 
 
 async def _tarea_clima():
@@ -76,60 +200,80 @@ async def _tarea_clima():
         logger.error(f"Error en importación clima diario: {e}")
 
 
-async def catch_up_importaciones():
+async def _catch_up_boletines(faltantes: list[date]):
+    """Importar los días faltantes con el pipeline concurrente, dentro del presupuesto de tiempo.
+    Lo que no alcanza a terminar se encola en la cola durable de importaciones."""
+    terminadas: list[dict] = []
+    pipeline = crear_pipeline_importacion(descargas=CATCH_UP_CONCURRENCIA, al_terminar=terminadas.append)
+    try:
+        await asyncio.wait_for(importar_fechas(faltantes, pipeline=pipeline),
+                               timeout=CATCH_UP_PRESUPUESTO_SEG)
+    except asyncio.TimeoutError:
+        hechas = {r["fecha"] for r in terminadas}
+        pendientes = [f for f in faltantes if str(f) not in hechas]
+        if pendientes:
+            job_id = await crear_import_job(pendientes[0], pendientes[-1], pendientes)
+            logger.warning(f"Catch-up: presupuesto de {CATCH_UP_PRESUPUESTO_SEG:.0f}s agotado, "
+                           f"{len(pendientes)} días encolados en el job {job_id}")
+
+    ok = [r for r in terminadas if r["estado"] == "ok"]
+    logger.info(f"Catch-up completado: {len(ok)}/{len(faltantes)} boletines, "
+                f"{sum(r['registros'] for r in ok)} registros")
+
+
+async def _catch_up_clima():
+    try:
+        resultado_clima = await importar_clima_diario()
+        logger.info(f"Catch-up clima: {resultado_clima}")
+    except Exception as e:
+        logger.error(f"Catch-up clima falló: {e}")
+
+
+async def catch_up_importaciones(clima: bool = True):
     """Importar boletines faltantes desde la última importación exitosa.
-    Se ejecuta al startup para recuperar días perdidos por reinicios."""
+    Se ejecuta al tomar el liderazgo para recuperar días perdidos por reinicios, y cada
+    día hábil al cerrar la ventana de sondeo.
+    Boletines (concurrentes, con presupuesto de tiempo) y clima corren en paralelo."""
     try:
         ultima = await get_ultima_fecha_importada()
         if ultima is None:
             logger.info("Catch-up: no hay importaciones previas, nada que recuperar")
             return
 
-        hoy = date.today()
+        ahora = ahora_chile()
+        hoy = ahora.date()
         if ultima >= hoy:
             logger.info(f"Catch-up: datos al día (última={ultima})")
             return
 
-        # Generar lista de días hábiles faltantes
-        faltantes = []
-        dia = ultima + timedelta(days=1)
-        while dia <= hoy:
-            if dia.weekday() < 5:  # Solo lunes a viernes
-                faltantes.append(dia)
-            dia += timedelta(days=1)
+        # Días hábiles faltantes (sin fines de semana ni feriados). Hoy lo importa el
+        # sondeo hasta que cierra su ventana; incluirlo aquí lo importaría dos veces a la vez
+        faltantes = dias_habiles(ultima + timedelta(days=1), hoy)
+        if ahora.hour < SONDEO_HORA_FIN and faltantes and faltantes[-1] == hoy:
+            faltantes.pop()
 
         if not faltantes:
             logger.info(f"Catch-up: no hay días hábiles faltantes (última={ultima})")
             return
 
-        logger.info(f"Catch-up: importando {len(faltantes)} días faltantes ({faltantes[0]} → {faltantes[-1]})")
-        ok = 0
-        registros_total = 0
-        for fecha in faltantes:
-            try:
-                resultado = await importar_boletin(fecha)
-                if resultado["estado"] == "ok":
-                    ok += 1
-                    registros_total += resultado["registros"]
-                logger.info(f"  Catch-up {fecha}: {resultado['estado']} ({resultado['registros']} reg)")
-            except Exception as e:
-                logger.error(f"  Catch-up {fecha}: error {e}")
-
-        logger.info(f"Catch-up completado: {ok}/{len(faltantes)} boletines, {registros_total} registros")
-
-        # También importar clima de los días faltantes
-        try:
-            resultado_clima = await importar_clima_diario()
-            logger.info(f"Catch-up clima: {resultado_clima}")
-        except Exception as e:
-            logger.error(f"Catch-up clima falló: {e}")
+        logger.info(f"Catch-up: importando {len(faltantes)} días faltantes ({faltantes[0]} → {faltantes[-1]}), "
+                    f"concurrencia={CATCH_UP_CONCURRENCIA}")
+        if clima:
+            await asyncio.gather(_catch_up_boletines(faltantes), _catch_up_clima())
+        else:
+            await _catch_up_boletines(faltantes)
 
     except Exception as e:
         logger.error(f"Catch-up error general: {e}")
 
 
-def detener_scheduler():
-    """Detener el scheduler"""
+async def detener_scheduler():
+    """Detener el scheduler y soltar el liderazgo para que otro proceso lo tome"""
+    global _lider_task
+    if _lider_task is not None:
+        _lider_task.cancel()
+        _lider_task = None
+    await _soltar_liderazgo()
     if scheduler.running:
         scheduler.shutdown()
         logger.info("Scheduler detenido")
@@ -1,14 +1,29 @@
 import asyncio
+import hashlib
 import httpx
 import openpyxl
 import logging
 import io
+import multiprocessing
+import os
 import re
-from datetime import date, timedelta, datetime
-from typing import Optional
-
-from src.config import ODEPA_BASE_URL
-from src.database import insertar_precios, registrar_importacion, boletin_ya_importado
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import chain, islice
+from typing import Awaitable, Callable, Iterator, Optional
+from urllib.parse import urljoin
+
+from src.config import (
+    ODEPA_BASE_URL, ODEPA_INDICE_TTL_SEG, HTTP2, HTTP_MAX_CONEXIONES, PARSE_WORKERS, PARSE_QUEUE_SIZE,
+    IMPORT_DESCARGAS, IMPORT_CARGAS, IMPORT_COLA, NO_DISPONIBLE_DIAS_RECIENTES, NO_DISPONIBLE_REINTENTO_MIN,
+)
+from src.calendario import dias_habiles
+from src.database import insertar_precios, registrar_importacion, get_estado_importacion, get_content_hash
+from src.pipeline import Etapa, Pipeline
+from src.lote import LoteRegistros
+from src import raw_store
+from src.transporte import crear_transporte
 
 logger = logging.getLogger("agroprice.scraper")
 
@@ -17,6 +32,18 @@ logger = logging.getLogger("agroprice.scraper")
 ODEPA_BOLETIN_PAGE = "https://www.odepa.gob.cl/contenidos-rubro/boletines/boletin-diario-de-precios-y-volumenes-de-frutas-en-mercados-mayoristas"
 
 
+# Formatos de nombre del archivo del boletín (más reciente primero), ver generar_urls_boletin
+PATRONES_BOLETIN = [
+    "BoletinDiarioFrutasHortalizas_{ddmmyyyy}.xlsx",
+    "BoletinDiarioFrutas-y-Hortalizas_{ddmmyyyy}.xlsx",
+    "BoletinDiarioFrutas_y_Hortalizas_{ddmmyyyy}.xlsx",
+    "Boletin_Diario_de_Frutas_y_Hortalizas_{yyyymmdd}.xlsx",
+]
+
+# Patrón que funcionó por (año, mes): se prueba primero para fechas vecinas
+_patron_por_mes: dict[tuple[int, int], int] = {}
+
+
 def generar_urls_boletin(fecha: date) -> list[str]:
     """Generar URLs posibles del boletín Excel para una fecha dada.
     ODEPA ha cambiado el formato varias veces:
@@ -30,120 +57,374 @@ def generar_urls_boletin(fecha: date) -> list[str]:
     base = f"{ODEPA_BASE_URL}/{anio}/{mes}"
     fecha_viejo = fecha.strftime("%Y%m%d")  # YYYYMMDD
     fecha_nuevo = fecha.strftime("%d%m%Y")  # DDMMYYYY
-    return [
-        f"{base}/BoletinDiarioFrutasHortalizas_{fecha_nuevo}.xlsx",
-        f"{base}/BoletinDiarioFrutas-y-Hortalizas_{fecha_nuevo}.xlsx",
-        f"{base}/BoletinDiarioFrutas_y_Hortalizas_{fecha_nuevo}.xlsx",
-        f"{base}/Boletin_Diario_de_Frutas_y_Hortalizas_{fecha_viejo}.xlsx",
-    ]
+    return [f"{base}/{p.format(ddmmyyyy=fecha_nuevo, yyyymmdd=fecha_viejo)}" for p in PATRONES_BOLETIN]
+
+
+def _orden_patrones(fecha: date) -> list[int]:
+    """Índices de PATRONES_BOLETIN en el orden a probar para una fecha.
+    Primero el patrón aprendido para ese mes o, si no hay, el del mes aprendido más cercano."""
+    orden = list(range(len(PATRONES_BOLETIN)))
+    if not _patron_por_mes:
+        return orden
+
+    mes = fecha.year * 12 + fecha.month
+    clave = (fecha.year, fecha.month)
+    if clave in _patron_por_mes:
+        preferido = _patron_por_mes[clave]
+    else:
+        cercano = min(_patron_por_mes, key=lambda k: abs(k[0] * 12 + k[1] - mes))
+        preferido = _patron_por_mes[cercano]
+
+    orden.remove(preferido)
+    return [preferido] + orden
+
+
+def _registrar_patron(fecha: date, idx: int):
+    """Recordar qué patrón de URL funcionó para el mes de la fecha"""
+    clave = (fecha.year, fecha.month)
+    if _patron_por_mes.get(clave) != idx:
+        _patron_por_mes[clave] = idx
+        logger.info(f"Patrón de URL para {fecha.year}-{fecha.month:02d}: {PATRONES_BOLETIN[idx]}")
+
+
+# ============== CLIENTE HTTP ==============
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_habilitado() -> bool:
+    """HTTP/2 es opcional: requiere HTTP2=true y el paquete 'h2' instalado"""
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HTTP2 activado pero el paquete 'h2' no está instalado, usando HTTP/1.1")
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente HTTP compartido por todo el scraper (pool de conexiones con keep-alive)"""
+    global _http_client
+    if _http_client is None:
+        http2 = _http2_habilitado()
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONEXIONES,
+            max_keepalive_connections=HTTP_MAX_CONEXIONES,
+            keepalive_expiry=60.0,
+        )
+        _http_client = httpx.AsyncClient(
+            timeout=30.0,
+            follow_redirects=True,
+            http2=http2,
+            limits=limits,
+            transport=crear_transporte(http2=http2, limits=limits),
+        )
+    return _http_client
+
+
+async def cerrar_http_client():
+    """Cerrar el cliente HTTP compartido"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Índice fecha → URL de los .xlsx enlazados en la página de ODEPA. Se descarga una
+# sola vez por ODEPA_INDICE_TTL_SEG y lo comparten todas las importaciones concurrentes.
+_indice_odepa: dict[date, str] = {}
+_indice_odepa_vence: float = 0.0
+_indice_odepa_lock = asyncio.Lock()
+
+
+def _fechas_en_url(url: str) -> Iterator[date]:
+    """Fechas que aparecen en el nombre del archivo (DDMMYYYY o YYYYMMDD)"""
+    for digitos in re.findall(r"(?<!\d)\d{8}(?!\d)", url):
+        for formato in ("%d%m%Y", "%Y%m%d"):
+            try:
+                yield datetime.strptime(digitos, formato).date()
+            except ValueError:
+                pass
+
+
+def fecha_de_archivo(nombre: str) -> Optional[date]:
+    """Fecha del boletín según el nombre de su archivo (DDMMYYYY o YYYYMMDD)"""
+    for f in _fechas_en_url(os.path.basename(nombre)):
+        if 2000 <= f.year <= 2100:
+            return f
+    return None
+
+
+def _indexar_pagina(html: str) -> dict[date, str]:
+    """Parsear los enlaces .xlsx de la página en un índice fecha → URL (primer enlace gana)"""
+    indice: dict[date, str] = {}
+    for href in re.findall(r'href="([^"]*\.xlsx[^"]*)"', html, re.IGNORECASE):
+        url = urljoin(ODEPA_BOLETIN_PAGE, href)
+        for f in _fechas_en_url(url):
+            indice.setdefault(f, url)
+    return indice
+
+
+async def _get_indice_odepa() -> dict[date, str]:
+    """Índice de boletines publicados en la página de ODEPA, cacheado con TTL.
+    Si varias importaciones lo piden a la vez, sólo una descarga la página."""
+    global _indice_odepa, _indice_odepa_vence
+    if time.monotonic() < _indice_odepa_vence:
+        return _indice_odepa
+    async with _indice_odepa_lock:
+        if time.monotonic() < _indice_odepa_vence:
+            return _indice_odepa
+        try:
+            resp = await get_http_client().get(ODEPA_BOLETIN_PAGE, timeout=15.0)
+            resp.raise_for_status()
+            _indice_odepa = _indexar_pagina(resp.text)
+            _indice_odepa_vence = time.monotonic() + ODEPA_INDICE_TTL_SEG
+            logger.info(f"Índice ODEPA: {len(_indice_odepa)} boletines enlazados en la página")
+        except Exception as e:
+            # Un error también se cachea (por menos tiempo) para no golpear la página en cada fecha
+            logger.warning(f"Error descargando índice de boletines ODEPA: {e}")
+            _indice_odepa = {}
+            _indice_odepa_vence = time.monotonic() + min(ODEPA_INDICE_TTL_SEG, 60)
+    return _indice_odepa
 
 
 async def descubrir_url_boletin(fecha: date) -> Optional[str]:
-    """Descubrir la URL del boletín scrapeando la página de ODEPA.
+    """Descubrir la URL del boletín en la página de ODEPA.
     Fallback cuando los patrones estáticos no funcionan."""
-    fecha_str = fecha.strftime("%d%m%Y")
+    url = (await _get_indice_odepa()).get(fecha)
+    if url:
+        logger.info(f"Descubrimiento dinámico: encontrada URL para {fecha}: {url}")
+    return url
+
+
+def _es_excel(response: httpx.Response) -> bool:
+    """Respuesta 200 que no es una página HTML (ODEPA responde HTML en algunas URLs inexistentes)"""
+    return response.status_code == 200 and "html" not in response.headers.get("content-type", "").lower()
+
+
+def _es_ausente(response: httpx.Response) -> bool:
+    """Respuesta definitiva de que la URL no tiene el boletín: 404/410 o una página HTML.
+    Un 5xx, 403, 429, etc. no lo es: puede ser una caída temporal de ODEPA."""
+    return response.status_code in (404, 410) or (response.status_code == 200 and not _es_excel(response))
+
+
+async def _probar_candidatos(fecha: date) -> tuple[Optional[int], Optional[str]]:
+    """Sondear las URLs candidatas sin bajar los archivos. Primero sólo el patrón aprendido
+    para el mes (una solicitud por fecha en régimen); si no está, el resto en paralelo.
+    Retorna (índice, None) con el patrón que responde con un Excel (si responden varios,
+    el primero según _orden_patrones). Sin Excel retorna (None, None) si todas las
+    candidatas respondieron que no existe, o (None, error) si alguna falló por red o servidor."""
+    client = get_http_client()
+    urls = generar_urls_boletin(fecha)
+
+    async def sondear(idx: int) -> httpx.Response:
+        response = await client.head(urls[idx], timeout=10.0)
+        if response.status_code in (405, 501):
+            # Sin soporte de HEAD: GET en streaming, cerrando apenas llegan los headers
+            async with client.stream("GET", urls[idx], timeout=10.0) as response:
+                pass
+        return response
+
+    orden = _orden_patrones(fecha)
+    grupos = [orden[:1], orden[1:]] if _patron_por_mes else [orden]
+    errores = []
+    for grupo in grupos:
+        respuestas = await asyncio.gather(*(sondear(idx) for idx in grupo), return_exceptions=True)
+        for idx, response in zip(grupo, respuestas):
+            if isinstance(response, BaseException):
+                logger.warning(f"Boletín {fecha}: error sondeando {urls[idx]}: {response}")
+                errores.append(f"{urls[idx]}: {response!r}")
+            elif _es_excel(response):
+                return idx, None
+            elif not _es_ausente(response):
+                errores.append(f"HTTP {response.status_code} en {urls[idx]}")
+    return None, "; ".join(errores) or None
+
+
+async def _descargar_url(fecha: date, url: str) -> tuple[Optional[bytes], Optional[str]]:
+    """GET de una URL candidata. Retorna (contenido, None) si es un Excel (y lo guarda en
+    el almacén), (None, None) si la URL no tiene el boletín o (None, error) si falló."""
     try:
-        async with httpx.AsyncClient(timeout=15.0, follow_redirects=True) as client:
-            resp = await client.get(ODEPA_BOLETIN_PAGE)
-            if resp.status_code != 200:
-                return None
-            # Buscar enlaces .xlsx que contengan la fecha
-            urls = re.findall(r'href="([^"]*\.xlsx[^"]*)"', resp.text, re.IGNORECASE)
-            for url in urls:
-                if fecha_str in url:
-                    logger.info(f"Descubrimiento dinámico: encontrada URL para {fecha}: {url}")
-                    return url
+        logger.info(f"Intentando boletín {fecha}: {url}")
+        response = await get_http_client().get(url)
     except Exception as e:
-        logger.warning(f"Error en descubrimiento dinámico para {fecha}: {e}")
-    return None
+        logger.warning(f"Error descargando {url}: {e}")
+        return None, f"{url}: {e!r}"
+    if _es_excel(response):
+        logger.info(f"Boletín {fecha}: descargado OK desde {url} ({len(response.content)} bytes)")
+        await _guardar_descarga(fecha, url, response)
+        return response.content, None
+    if response.status_code == 200:
+        logger.info(f"Boletín {fecha}: respuesta HTML en {url} (no es Excel)")
+    else:
+        logger.info(f"Boletín {fecha}: HTTP {response.status_code} en {url}")
+    return None, None if _es_ausente(response) else f"HTTP {response.status_code} en {url}"
 
 
 async def descargar_boletin(fecha: date) -> Optional[bytes]:
     """Descargar el archivo Excel del boletín, probando múltiples formatos de URL.
+    Sondea con HEAD el patrón aprendido y, si no está, las demás URLs candidatas en
+    paralelo; baja sólo la que existe.
     Si los patrones estáticos fallan, intenta descubrir la URL dinámicamente."""
-    urls = generar_urls_boletin(fecha)
-
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-        for url in urls:
-            try:
-                logger.info(f"Intentando boletín {fecha}: {url}")
-                response = await client.get(url)
-                if response.status_code == 200:
-                    content_type = response.headers.get("content-type", "")
-                    if "html" in content_type.lower():
-                        logger.info(f"Boletín {fecha}: respuesta HTML en {url} (no es Excel, probando siguiente)")
-                        continue
-                    logger.info(f"Boletín {fecha}: descargado OK desde {url} ({len(response.content)} bytes)")
-                    return response.content
-                elif response.status_code == 404:
-                    logger.info(f"Boletín {fecha}: 404 en {url}, probando siguiente")
-                    continue
-                else:
-                    logger.info(f"Boletín {fecha}: HTTP {response.status_code} en {url}, probando siguiente")
-                    continue
-            except Exception as e:
-                logger.warning(f"Error descargando {url}: {e}")
-                continue
-
-    # Fallback: descubrimiento dinámico scrapeando la página de ODEPA
+    contenido, _, _ = await _descargar_boletin(fecha)
+    return contenido
+
+
+async def _descargar_boletin(fecha: date) -> tuple[Optional[bytes], Optional[str], Optional[str]]:
+    """Como descargar_boletin, pero retorna (contenido, URL de origen, error).
+    Sin boletín, error es None sólo si todas las URLs respondieron que no existe (404 o
+    HTML); si hubo errores de red o del servidor trae el detalle, y no es un no_disponible."""
+    # Si ya tenemos el archivo guardado, re-chequear con GET condicional
+    meta = await asyncio.to_thread(raw_store.leer_meta, fecha)
+    if meta and meta.get("url"):
+        contenido = await _revalidar_almacenado(fecha, meta)
+        if contenido is not None:
+            return contenido, meta["url"], None
+
+    idx, error = await _probar_candidatos(fecha)
+    if idx is not None:
+        url = generar_urls_boletin(fecha)[idx]
+        contenido, error = await _descargar_url(fecha, url)
+        if contenido is not None:
+            _registrar_patron(fecha, idx)
+            return contenido, url, None
+
+    # Fallback: descubrimiento dinámico en la página de ODEPA
     logger.info(f"Boletín {fecha}: patrones estáticos fallaron, intentando descubrimiento dinámico")
     url_descubierta = await descubrir_url_boletin(fecha)
     if url_descubierta:
-        try:
-            async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-                response = await client.get(url_descubierta)
-                if response.status_code == 200:
-                    content_type = response.headers.get("content-type", "")
-                    if "html" not in content_type.lower():
-                        logger.info(f"Boletín {fecha}: descargado OK vía descubrimiento dinámico ({len(response.content)} bytes)")
-                        return response.content
-        except Exception as e:
-            logger.warning(f"Error descargando URL descubierta {url_descubierta}: {e}")
+        contenido, error_descubierta = await _descargar_url(fecha, url_descubierta)
+        if contenido is not None:
+            return contenido, url_descubierta, None
+        error = error or error_descubierta
+
+    if error:
+        logger.warning(f"Boletín {fecha}: no se pudo descargar por errores: {error}")
+    else:
+        logger.warning(f"Boletín {fecha}: no disponible en ningún formato")
+    return None, None, error
+
 
-    logger.warning(f"Boletín {fecha}: no disponible en ningún formato")
+def _patron_de_url(fecha: date, url: Optional[str]) -> Optional[str]:
+    """Patrón de PATRONES_BOLETIN que generó la URL, o 'descubrimiento' si no es ninguno"""
+    if not url:
+        return None
+    urls = generar_urls_boletin(fecha)
+    return PATRONES_BOLETIN[urls.index(url)] if url in urls else "descubrimiento"
+
+
+async def _guardar_descarga(fecha: date, url: str, response: httpx.Response):
+    """Guardar el archivo descargado en el almacén local con sus headers de validación"""
+    await asyncio.to_thread(
+        raw_store.guardar_boletin, fecha, response.content, url,
+        response.headers.get("etag"), response.headers.get("last-modified"),
+    )
+
+
+async def _revalidar_almacenado(fecha: date, meta: dict) -> Optional[bytes]:
+    """GET condicional (If-None-Match / If-Modified-Since) sobre la URL guardada.
+    Retorna el contenido vigente, o None si hay que volver a buscar el boletín."""
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    url = meta["url"]
+    try:
+        response = await get_http_client().get(url, headers=headers)
+    except Exception as e:
+        logger.warning(f"Boletín {fecha}: error re-chequeando {url}: {e}")
+        return None
+
+    if response.status_code == 304:
+        contenido = await asyncio.to_thread(raw_store.leer_boletin, fecha)
+        if contenido is not None:
+            logger.info(f"Boletín {fecha}: sin cambios (304), usando copia local ({len(contenido)} bytes)")
+        return contenido
+    if response.status_code == 200 and "html" not in response.headers.get("content-type", "").lower():
+        logger.info(f"Boletín {fecha}: descargado OK desde {url} ({len(response.content)} bytes)")
+        await _guardar_descarga(fecha, url, response)
+        return response.content
     return None
 
 
+async def sondear_boletin(fecha: date) -> Optional[str]:
+    """Verificar con HEAD (sin bajar el archivo) si el boletín ya está publicado.
+    Si ningún patrón estático responde (ODEPA renombró el archivo), buscarlo en el
+    índice de la página, que está cacheado. Retorna la URL o None."""
+    idx, _ = await _probar_candidatos(fecha)
+    if idx is not None:
+        return generar_urls_boletin(fecha)[idx]
+    return await descubrir_url_boletin(fecha)
+
+
+# Filas iniciales de cada hoja donde vienen título, mercado y encabezados
+FILAS_CABECERA = 15
+
+# Hojas que no corresponden a mercados
+HOJAS_IGNORADAS = ("resumen", "notas", "info", "hoja1", "sheet1")
+
+
 def parsear_excel(contenido: bytes, fecha: date) -> list[dict]:
     """
-    Parsear el Excel de ODEPA y extraer registros de precios.
+    Parsear el Excel de ODEPA y extraer registros de precios (como dicts, ver parsear_lote).
 
     El formato típico del Excel de ODEPA tiene:
     - Múltiples hojas, una por mercado (ej: "Lo Valledor", "Vega Central", etc.)
     - Cada hoja tiene columnas: Producto, Variedad, Unidad, Volumen, Precio Mín, Precio Máx, Precio Prom
     - O puede tener una estructura con encabezados de sección para Frutas y Hortalizas
     """
-    registros = []
+    return parsear_lote(contenido, fecha).registros()
 
+
+def parsear_lote(contenido: bytes, fecha: date) -> LoteRegistros:
+    """Leer el Excel en modo streaming y acumular los registros en un lote columnar.
+    Cada hoja se recorre una sola vez: las primeras filas se guardan para detectar
+    mercado, categoría y columnas, y el resto se procesa fila a fila sin cargar el
+    workbook completo en memoria."""
+    lote = LoteRegistros(fecha)
     try:
-        wb = openpyxl.load_workbook(io.BytesIO(contenido), data_only=True)
+        wb = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True, data_only=True)
     except Exception as e:
         logger.error(f"Error abriendo Excel {fecha}: {e}")
-        return []
+        return lote
 
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        raw_name = sheet_name.strip()
+    try:
+        for sheet_name in wb.sheetnames:
+            raw_name = sheet_name.strip()
 
-        # Ignorar hojas que no son mercados
-        if raw_name.lower() in ["resumen", "notas", "info", "hoja1", "sheet1"]:
-            continue
+            # Ignorar hojas que no son mercados
+            if raw_name.lower() in HOJAS_IGNORADAS:
+                continue
+
+            for fila in _parsear_hoja(_filas_hoja(wb[sheet_name]), raw_name):
+                lote.agregar(*fila)
+
+        # Si no encontramos datos en hojas separadas, intentar formato de hoja única
+        if len(lote) == 0 and len(wb.sheetnames) > 0:
+            for fila in _parsear_hoja_unica(_filas_hoja(wb[wb.sheetnames[0]])):
+                lote.agregar(*fila)
+
+        logger.info(f"Boletín {fecha}: {len(lote)} registros extraídos de {len(wb.sheetnames)} hojas")
+    finally:
+        wb.close()
+    return lote
 
-        nombre_mercado = _extraer_nombre_mercado(ws, raw_name)
-        categoria = _extraer_categoria(ws, raw_name)
 
-        registros_hoja = _parsear_hoja(ws, nombre_mercado, fecha, categoria)
-        registros.extend(registros_hoja)
-        logger.debug(f"  Hoja '{raw_name}' → mercado='{nombre_mercado}', cat='{categoria}': {len(registros_hoja)} registros")
+def _filas_hoja(ws) -> Iterator[tuple]:
+    """Iterar los valores de una hoja read-only, fila a fila.
+    Se ignora la dimensión declarada en el XML: algunos boletines la traen mal
+    y openpyxl cortaría las filas."""
+    ws.reset_dimensions()
+    return ws.iter_rows(values_only=True)
 
-    # Si no encontramos datos en hojas separadas, intentar formato de hoja única
-    if not registros and len(wb.sheetnames) > 0:
-        ws = wb[wb.sheetnames[0]]
-        registros = _parsear_hoja_unica(ws, fecha)
 
-    wb.close()
-    logger.info(f"Boletín {fecha}: {len(registros)} registros extraídos de {len(wb.sheetnames)} hojas")
-    return registros
+def _celda(valores: tuple, idx: int):
+    """Valor de una celda por índice (las filas en streaming pueden venir más cortas)"""
+    return valores[idx] if idx < len(valores) else None
 
 
 def _limpiar_texto(valor) -> str:
@@ -172,7 +453,7 @@ def _limpiar_numero(valor, permitir_cero: bool = False) -> Optional[float]:
         return None
 
 
-def _detectar_columnas(ws) -> dict:
+def _detectar_columnas(filas: list[tuple]) -> dict:
     """
     Detectar las columnas del Excel buscando encabezados conocidos.
     Retorna un dict con mapping de campo -> índice de columna.
@@ -189,15 +470,14 @@ def _detectar_columnas(ws) -> dict:
         "precio_promedio": ["promedio", "prom", "precio prom", "p. prom", "ponderado"],
     }
 
-    for row in ws.iter_rows(min_row=1, max_row=15, values_only=False):
+    for row in filas[:FILAS_CABECERA]:
         row_mapping = {}
         used_columns = set()
 
-        for cell in row:
-            if cell.value is None:
+        for col_idx, valor in enumerate(row):  # 0-indexed
+            if valor is None:
                 continue
-            texto = str(cell.value).strip().lower()
-            col_idx = cell.column - 1  # 0-indexed
+            texto = str(valor).strip().lower()
 
             for campo, keywords in patrones.items():
                 if campo not in row_mapping and col_idx not in used_columns:
@@ -214,9 +494,9 @@ def _detectar_columnas(ws) -> dict:
     return {}
 
 
-def _extraer_nombre_mercado(ws, sheet_name: str) -> str:
+def _extraer_nombre_mercado(filas: list[tuple], sheet_name: str) -> str:
     """Extraer nombre limpio del mercado desde Row 7 o del nombre de la hoja"""
-    for row in ws.iter_rows(min_row=1, max_row=10, values_only=True):
+    for row in filas[:10]:
         if row and row[0]:
             texto = str(row[0]).strip()
             if texto.lower().startswith("mercado:"):
@@ -226,7 +506,7 @@ def _extraer_nombre_mercado(ws, sheet_name: str) -> str:
     return clean.strip()
 
 
-def _extraer_categoria(ws, sheet_name: str) -> str:
+def _extraer_categoria(filas: list[tuple], sheet_name: str) -> str:
     """Extraer categoría desde la hoja o nombre de hoja"""
     # Primero intentar desde nombre de hoja
     if sheet_name.lower().startswith("fruta"):
@@ -234,7 +514,7 @@ def _extraer_categoria(ws, sheet_name: str) -> str:
     if sheet_name.lower().startswith("hortaliza"):
         return "hortaliza"
     # Fallback: buscar en las primeras filas
-    for row in ws.iter_rows(min_row=1, max_row=5, values_only=True):
+    for row in filas[:5]:
         if row and row[0]:
             texto = str(row[0]).strip().lower()
             if any(kw in texto for kw in ["fruta", "frutas"]):
@@ -244,19 +524,19 @@ def _extraer_categoria(ws, sheet_name: str) -> str:
     return "hortaliza"
 
 
-def _parsear_hoja(ws, mercado: str, fecha: date, categoria: str = None) -> list[dict]:
-    """Parsear una hoja que representa un mercado"""
-    registros = []
-    mapping = _detectar_columnas(ws)
+def _parsear_hoja(filas: Iterator[tuple], sheet_name: str) -> Iterator[tuple]:
+    """Parsear una hoja que representa un mercado, en una sola pasada (ver _extraer_registro)"""
+    cabecera = list(islice(filas, FILAS_CABECERA))
+    mercado = _extraer_nombre_mercado(cabecera, sheet_name)
+    categoria_actual = _extraer_categoria(cabecera, sheet_name)
+    mapping = _detectar_columnas(cabecera)
 
     if "producto" not in mapping:
-        return registros
+        return
 
-    categoria_actual = categoria or "hortaliza"
-
-    for row in ws.iter_rows(values_only=True):
-        valores = list(row)
+    logger.debug(f"  Hoja '{sheet_name}' → mercado='{mercado}', cat='{categoria_actual}'")
 
+    for valores in chain(cabecera, filas):
         if not valores or all(v is None for v in valores):
             continue
 
@@ -278,7 +558,7 @@ def _parsear_hoja(ws, mercado: str, fecha: date, categoria: str = None) -> list[
             continue
 
         # Extraer datos
-        producto = _limpiar_texto(valores[mapping.get("producto", 0)])
+        producto = _limpiar_texto(_celda(valores, mapping.get("producto", 0)))
         if not producto or len(producto) < 2:
             continue
 
@@ -286,57 +566,32 @@ def _parsear_hoja(ws, mercado: str, fecha: date, categoria: str = None) -> list[
         if any(kw in producto.lower() for kw in ["total", "subtotal", "suma", "promedio general", "fuente"]):
             continue
 
-        variedad = _limpiar_texto(valores[mapping["variedad"]]) if "variedad" in mapping else None
-        calidad = _limpiar_texto(valores[mapping["calidad"]]) if "calidad" in mapping else None
-        unidad = _limpiar_texto(valores[mapping["unidad"]]) if "unidad" in mapping else None
-
-        precio_min = _limpiar_numero(valores[mapping["precio_min"]]) if "precio_min" in mapping else None
-        precio_max = _limpiar_numero(valores[mapping["precio_max"]]) if "precio_max" in mapping else None
-        precio_prom = _limpiar_numero(valores[mapping["precio_promedio"]]) if "precio_promedio" in mapping else None
-
-        volumen = _limpiar_numero(valores[mapping["volumen"]], permitir_cero=True) if "volumen" in mapping else None
+        registro = _extraer_registro(valores, mapping, mercado, producto, categoria_actual)
+        if registro:
+            yield registro
 
-        # Solo agregar si hay al menos un precio
-        if precio_min is not None or precio_max is not None or precio_prom is not None:
-            registros.append({
-                "fecha": fecha,
-                "mercado": mercado,
-                "producto": producto.title(),
-                "categoria": categoria_actual,
-                "variedad": variedad if variedad else None,
-                "calidad": calidad if calidad else None,
-                "unidad": unidad if unidad else None,
-                "precio_min": precio_min,
-                "precio_max": precio_max,
-                "precio_promedio": precio_prom,
-                "volumen": volumen,
-            })
 
-    return registros
-
-
-def _parsear_hoja_unica(ws, fecha: date) -> list[dict]:
+def _parsear_hoja_unica(filas: Iterator[tuple]) -> Iterator[tuple]:
     """Parsear formato de hoja única con columna de mercado"""
-    registros = []
-    mapping = _detectar_columnas(ws)
+    cabecera = list(islice(filas, FILAS_CABECERA))
+    mapping = _detectar_columnas(cabecera)
 
     # Buscar columna de mercado
     mercado_col = None
-    for row in ws.iter_rows(min_row=1, max_row=10, values_only=False):
-        for cell in row:
-            if cell.value and "mercado" in str(cell.value).strip().lower():
-                mercado_col = cell.column - 1
+    for row in cabecera[:10]:
+        for col_idx, valor in enumerate(row):
+            if valor and "mercado" in str(valor).strip().lower():
+                mercado_col = col_idx
                 break
         if mercado_col is not None:
             break
 
     if "producto" not in mapping:
-        return registros
+        return
 
     categoria_actual = "hortaliza"
 
-    for row in ws.iter_rows(values_only=True):
-        valores = list(row)
+    for valores in chain(cabecera, filas):
         if not valores or all(v is None for v in valores):
             continue
 
@@ -350,89 +605,271 @@ def _parsear_hoja_unica(ws, fecha: date) -> list[dict]:
         if any(kw in primer_valor for kw in ["producto", "especie", "mercado"]):
             continue
 
-        producto = _limpiar_texto(valores[mapping.get("producto", 0)])
+        producto = _limpiar_texto(_celda(valores, mapping.get("producto", 0)))
         if not producto or len(producto) < 2:
             continue
 
-        mercado = _limpiar_texto(valores[mercado_col]) if mercado_col is not None else "Desconocido"
+        mercado = _limpiar_texto(_celda(valores, mercado_col)) if mercado_col is not None else "Desconocido"
 
-        precio_min = _limpiar_numero(valores[mapping["precio_min"]]) if "precio_min" in mapping else None
-        precio_max = _limpiar_numero(valores[mapping["precio_max"]]) if "precio_max" in mapping else None
-        precio_prom = _limpiar_numero(valores[mapping["precio_promedio"]]) if "precio_promedio" in mapping else None
-        volumen = _limpiar_numero(valores[mapping["volumen"]], permitir_cero=True) if "volumen" in mapping else None
+        registro = _extraer_registro(valores, mapping, mercado, producto, categoria_actual)
+        if registro:
+            yield registro
 
-        variedad = _limpiar_texto(valores[mapping["variedad"]]) if "variedad" in mapping else None
-        calidad = _limpiar_texto(valores[mapping["calidad"]]) if "calidad" in mapping else None
-        unidad = _limpiar_texto(valores[mapping["unidad"]]) if "unidad" in mapping else None
 
-        if precio_min is not None or precio_max is not None or precio_prom is not None:
-            registros.append({
-                "fecha": fecha,
-                "mercado": mercado,
-                "producto": producto.title(),
-                "categoria": categoria_actual,
-                "variedad": variedad if variedad else None,
-                "calidad": calidad if calidad else None,
-                "unidad": unidad if unidad else None,
-                "precio_min": precio_min,
-                "precio_max": precio_max,
-                "precio_promedio": precio_prom,
-                "volumen": volumen,
-            })
+def _extraer_registro(valores: tuple, mapping: dict, mercado: str,
+                      producto: str, categoria: str) -> Optional[tuple]:
+    """Armar el registro de una fila de datos, con los campos en el orden de
+    LoteRegistros.agregar. Retorna None si no trae ningún precio."""
+    variedad = _limpiar_texto(_celda(valores, mapping["variedad"])) if "variedad" in mapping else None
+    calidad = _limpiar_texto(_celda(valores, mapping["calidad"])) if "calidad" in mapping else None
+    unidad = _limpiar_texto(_celda(valores, mapping["unidad"])) if "unidad" in mapping else None
 
-    return registros
+    precio_min = _limpiar_numero(_celda(valores, mapping["precio_min"])) if "precio_min" in mapping else None
+    precio_max = _limpiar_numero(_celda(valores, mapping["precio_max"])) if "precio_max" in mapping else None
+    precio_prom = _limpiar_numero(_celda(valores, mapping["precio_promedio"])) if "precio_promedio" in mapping else None
 
+    volumen = _limpiar_numero(_celda(valores, mapping["volumen"]), permitir_cero=True) if "volumen" in mapping else None
 
-async def importar_boletin(fecha: date, forzar: bool = False) -> dict:
-    """Descargar e importar un boletín completo"""
-    if not forzar and await boletin_ya_importado(fecha):
-        return {"fecha": str(fecha), "estado": "ya_importado", "registros": 0}
-
-    contenido = await descargar_boletin(fecha)
-    if contenido is None:
-        await registrar_importacion(fecha, 0, "no_disponible")
-        return {"fecha": str(fecha), "estado": "no_disponible", "registros": 0}
+    # Solo agregar si hay al menos un precio
+    if precio_min is None and precio_max is None and precio_prom is None:
+        return None
 
-    registros = parsear_excel(contenido, fecha)
-    if not registros:
-        await registrar_importacion(fecha, 0, "sin_datos", "Excel descargado pero sin datos parseables")
-        return {"fecha": str(fecha), "estado": "sin_datos", "registros": 0}
+    return (
+        mercado, producto.title(), categoria,
+        variedad if variedad else None, calidad if calidad else None, unidad if unidad else None,
+        precio_min, precio_max, precio_prom, volumen,
+    )
+
+
+# ============== POOL DE PARSEO ==============
+
+_parse_executor: Optional[ProcessPoolExecutor] = None
+_parse_slots: Optional[asyncio.Semaphore] = None
+
+
+def _get_parse_executor() -> ProcessPoolExecutor:
+    """Pool de procesos para parsear boletines (se crea en el primer uso).
+    Usa 'spawn' para no heredar el event loop ni las conexiones del proceso principal."""
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Pool de parseo iniciado: {PARSE_WORKERS} procesos, cola máx {PARSE_QUEUE_SIZE}")
+    return _parse_executor
+
+
+async def parsear_lote_async(contenido: bytes, fecha: date) -> LoteRegistros:
+    """Parsear el boletín fuera del event loop (el lote columnar viaja barato entre procesos).
+    La cola es acotada: con PARSE_QUEUE_SIZE boletines pendientes, quien encola
+    espera a que se libere un cupo (backpressure hacia las descargas)."""
+    global _parse_slots
+    if _parse_slots is None:
+        _parse_slots = asyncio.Semaphore(PARSE_QUEUE_SIZE)
+
+    async with _parse_slots:
+        if PARSE_WORKERS <= 0:
+            return await asyncio.to_thread(parsear_lote, contenido, fecha)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_parse_executor(), parsear_lote, contenido, fecha)
+
+
+def cerrar_pool_parseo():
+    """Detener el pool de procesos de parseo"""
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+        logger.info("Pool de parseo detenido")
+
+
+# ============== IMPORTACIÓN ==============
+# Un boletín se importa en tres etapas (descarga → parseo → carga) que operan
+# sobre un dict de trabajo. Si una etapa deja `estado` en el trabajo, éste termina.
+
+def _nuevo_trabajo(fecha: date, forzar: bool = False, desde_store: bool = False,
+                   archivo: Callable[[], bytes] = None) -> dict:
+    return {"fecha": fecha, "forzar": forzar, "desde_store": desde_store, "archivo": archivo, "metricas": {}}
+
+
+def _resultado(trabajo: dict) -> dict:
+    return {"fecha": str(trabajo["fecha"]), "estado": trabajo["estado"], "registros": trabajo.get("registros", 0)}
+
+
+async def _etapa_descarga(trabajo: dict):
+    """Etapa 1: verificar si ya está importado y descargar el Excel
+    (o leerlo del almacén local en modo re-parseo, o de un archivo en backfill offline)"""
+    fecha = trabajo["fecha"]
+    metricas = trabajo["metricas"]
+    if trabajo["desde_store"]:
+        t0 = time.monotonic()
+        contenido = await asyncio.to_thread(raw_store.leer_boletin, fecha)
+        if contenido is None:
+            trabajo["estado"] = "no_almacenado"
+            return
+        meta = await asyncio.to_thread(raw_store.leer_meta, fecha)
+        metricas.update(t_descarga=time.monotonic() - t0, bytes=len(contenido),
+                        patron_url=_patron_de_url(fecha, (meta or {}).get("url")))
+        trabajo["content_hash"] = hashlib.sha256(contenido).hexdigest()
+        trabajo["contenido"] = contenido
+        return
+
+    if not trabajo["forzar"]:
+        previo = await get_estado_importacion(fecha, NO_DISPONIBLE_DIAS_RECIENTES)
+        if previo == "ok":
+            trabajo["estado"] = "ya_importado"
+            return
+        if previo == "no_disponible" and trabajo["archivo"] is None:
+            # Caché negativo: se sabe que no hay boletín, no volver a probar las URLs
+            trabajo["estado"] = "no_disponible"
+            return
+
+    t0 = time.monotonic()
+    if trabajo["archivo"] is not None:
+        contenido = await asyncio.to_thread(trabajo["archivo"])
+        patron = "archivo"
+    else:
+        contenido, url, error = await _descargar_boletin(fecha)
+        if contenido is None:
+            metricas["t_descarga"] = time.monotonic() - t0
+            if error:
+                # Falla de red o de ODEPA: no es un caché negativo, se vuelve a intentar
+                await registrar_importacion(fecha, 0, "error", f"Error de descarga: {error}", metricas=metricas)
+                trabajo["estado"] = "error"
+                return
+            reciente = (date.today() - fecha).days < NO_DISPONIBLE_DIAS_RECIENTES
+            await registrar_importacion(fecha, 0, "no_disponible", metricas=metricas,
+                                        reintentar_en_min=NO_DISPONIBLE_REINTENTO_MIN if reciente else None)
+            trabajo["estado"] = "no_disponible"
+            return
+        patron = _patron_de_url(fecha, url)
+    metricas.update(t_descarga=time.monotonic() - t0, bytes=len(contenido), patron_url=patron)
+
+    # Re-importación de un archivo idéntico al ya importado: no hay nada que hacer
+    trabajo["content_hash"] = hashlib.sha256(contenido).hexdigest()
+    if trabajo["forzar"] and await get_content_hash(fecha) == trabajo["content_hash"]:
+        logger.info(f"Boletín {fecha}: sin cambios respecto a la importación anterior")
+        trabajo["estado"] = "sin_cambios"
+        return
+    trabajo["contenido"] = contenido
+
+
+async def _etapa_parseo(trabajo: dict):
+    """Etapa 2: parsear el Excel en el pool de procesos"""
+    fecha = trabajo["fecha"]
+    t0 = time.monotonic()
+    try:
+        lote = await parsear_lote_async(trabajo.pop("contenido"), fecha)
+    except Exception as e:
+        logger.error(f"Boletín {fecha}: error parseando Excel: {e}")
+        await registrar_importacion(fecha, 0, "error", f"Error de parseo: {e}", metricas=trabajo["metricas"])
+        trabajo["estado"] = "error"
+        return
+    trabajo["metricas"].update(t_parseo=time.monotonic() - t0, filas_parseadas=len(lote))
+
+    if len(lote) == 0:
+        await registrar_importacion(fecha, 0, "sin_datos", "Excel descargado pero sin datos parseables",
+                                    metricas=trabajo["metricas"])
+        trabajo["estado"] = "sin_datos"
+        return
+    trabajo["lote"] = lote
+
+
+async def _etapa_carga(trabajo: dict):
+    """Etapa 3: cargar el lote en la base de datos"""
+    fecha = trabajo["fecha"]
+    try:
+        carga = await insertar_precios(trabajo.pop("lote"), reemplazar=trabajo["desde_store"])
+    except Exception as e:
+        logger.error(f"Boletín {fecha}: error cargando precios: {e}")
+        await registrar_importacion(fecha, 0, "error", str(e), metricas=trabajo["metricas"])
+        trabajo["estado"] = "error"
+        return
+    await registrar_importacion(fecha, carga["registros"], "ok", metricas={
+        **trabajo["metricas"],
+        "content_hash": trabajo.get("content_hash"),
+        "insertados": carga["insertados"],
+        "actualizados": carga["actualizados"],
+        "sin_cambios": carga["sin_cambios"],
+        "t_dimensiones": carga["t_dimensiones"],
+        "t_insercion": carga["t_insercion"],
+    })
+    logger.info(f"Boletín {fecha}: {carga['insertados']} insertados, {carga['actualizados']} actualizados, "
+                f"{carga['sin_cambios']} sin cambios")
+    trabajo["estado"] = "ok"
+    trabajo["registros"] = carga["registros"]
+
+
+ETAPAS_IMPORTACION = (_etapa_descarga, _etapa_parseo, _etapa_carga)
 
-    count = await insertar_precios(registros)
-    await registrar_importacion(fecha, count, "ok")
 
-    return {"fecha": str(fecha), "estado": "ok", "registros": count}
+async def importar_boletin(fecha: date, forzar: bool = False) -> dict:
+    """Descargar e importar un boletín completo"""
+    trabajo = _nuevo_trabajo(fecha, forzar)
+    for etapa in ETAPAS_IMPORTACION:
+        await etapa(trabajo)
+        if "estado" in trabajo:
+            break
+    return _resultado(trabajo)
+
+
+def crear_pipeline_importacion(descargas: int = IMPORT_DESCARGAS,
+                               al_terminar: Callable[[dict], Optional[Awaitable[None]]] = None) -> Pipeline:
+    """Pipeline descarga → parseo → carga con concurrencia y colas propias por etapa.
+    `al_terminar` recibe el resultado de cada boletín a medida que termina."""
+    callback = (lambda trabajo: al_terminar(_resultado(trabajo))) if al_terminar else None
+    return Pipeline(
+        [
+            Etapa("descarga", _etapa_descarga, descargas),
+            Etapa("parseo", _etapa_parseo, max(1, PARSE_WORKERS)),
+            Etapa("carga", _etapa_carga, IMPORT_CARGAS),
+        ],
+        tamano_cola=IMPORT_COLA,
+        al_terminar=callback,
+    )
+
+
+async def importar_fechas(fechas: list[date], forzar: bool = False,
+                          pipeline: Pipeline = None, desde_store: bool = False) -> list[dict]:
+    """Importar una lista de fechas a través del pipeline por etapas.
+    Con desde_store=True los boletines se leen del almacén local (sin red).
+    Retorna los resultados ordenados por fecha."""
+    if pipeline is None:
+        pipeline = crear_pipeline_importacion()
+    trabajos = await pipeline.ejecutar([_nuevo_trabajo(f, forzar, desde_store) for f in fechas])
+    resultados = sorted((_resultado(t) for t in trabajos), key=lambda r: r["fecha"])
+    for r in resultados:
+        logger.info(f"  {r['fecha']}: {r['estado']} ({r['registros']} reg)")
+    return resultados
+
+
+async def importar_archivos(archivos: dict[date, Callable[[], bytes]], forzar: bool = False,
+                            pipeline: Pipeline = None) -> list[dict]:
+    """Importar boletines desde archivos locales (backfill offline, sin ODEPA).
+    `archivos` mapea cada fecha a una función que lee el contenido del Excel.
+    Retorna los resultados ordenados por fecha."""
+    if pipeline is None:
+        pipeline = crear_pipeline_importacion()
+    trabajos = await pipeline.ejecutar([_nuevo_trabajo(f, forzar, archivo=leer) for f, leer in archivos.items()])
+    return sorted((_resultado(t) for t in trabajos), key=lambda r: r["fecha"])
 
 
 async def importar_historico(fecha_inicio: date, fecha_fin: date = None,
-                             forzar: bool = False, concurrencia: int = 8) -> list[dict]:
-    """Importar boletines históricos en paralelo con semáforo"""
+                             forzar: bool = False, concurrencia: int = IMPORT_DESCARGAS) -> list[dict]:
+    """Importar boletines históricos con el pipeline descarga → parseo → carga.
+    `concurrencia` limita las descargas simultáneas; parseo y carga tienen sus propios límites."""
     if fecha_fin is None:
         fecha_fin = date.today()
 
-    # Generar lista de fechas hábiles
-    fechas = []
-    fecha_actual = fecha_inicio
-    while fecha_actual <= fecha_fin:
-        if fecha_actual.weekday() < 5:  # Solo lunes a viernes
-            fechas.append(fecha_actual)
-        fecha_actual += timedelta(days=1)
-
+    fechas = dias_habiles(fecha_inicio, fecha_fin)
     if not fechas:
         return []
 
-    logger.info(f"Importación paralela: {len(fechas)} fechas con concurrencia={concurrencia}")
-
-    semaforo = asyncio.Semaphore(concurrencia)
-
-    async def importar_con_semaforo(f: date) -> dict:
-        async with semaforo:
-            resultado = await importar_boletin(f, forzar=forzar)
-            logger.info(f"  {f}: {resultado['estado']} ({resultado['registros']} reg)")
-            return resultado
+    logger.info(f"Importación paralela: {len(fechas)} fechas con concurrencia de descarga={concurrencia}")
 
-    # Ejecutar todas en paralelo (limitadas por semáforo)
-    resultados = await asyncio.gather(*[importar_con_semaforo(f) for f in fechas])
+    resultados = await importar_fechas(fechas, forzar=forzar,
+                                       pipeline=crear_pipeline_importacion(descargas=concurrencia))
 
     # Resumen
     total_ok = sum(1 for r in resultados if r["estado"] == "ok")
@@ -444,9 +881,15 @@ async def importar_historico(fecha_inicio: date, fecha_fin: date = None,
                 f"{total_registros} registros, {total_no_disp} no disponibles, "
                 f"{total_ya_imp} ya importados")
 
-    return list(resultados)
+    return resultados
 
 
-async def importar_hoy() -> dict:
-    """Importar el boletín de hoy"""
-    return await importar_boletin(date.today())
+async def reparsear_desde_store(fecha_inicio: date, fecha_fin: date = None,
+                                pipeline: Pipeline = None) -> list[dict]:
+    """Reconstruir precios desde los boletines guardados en el almacén local, sin red.
+    Útil después de un cambio en el parser: los precios de cada fecha se reemplazan."""
+    if fecha_fin is None:
+        fecha_fin = date.today()
+    fechas = await asyncio.to_thread(raw_store.fechas_almacenadas, fecha_inicio, fecha_fin)
+    logger.info(f"Re-parseo desde almacén: {len(fechas)} boletines ({fecha_inicio} → {fecha_fin})")
+    return await importar_fechas(fechas, forzar=True, pipeline=pipeline, desde_store=True)
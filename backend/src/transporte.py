@@ -0,0 +1,179 @@
+"""
+Transporte HTTP intercambiable para los clientes de ODEPA y Open-Meteo.
+
+- live: red real (transporte por defecto de httpx)
+- record: red real, y cada respuesta se graba en el directorio de cassettes
+- replay: responde desde los cassettes sin tocar la red, simulando latencia, ancho de
+  banda, errores de conexión, 5xx y URLs inexistentes (404) según la configuración
+
+Así se puede medir el pipeline de importación, la concurrencia y los reintentos en una
+máquina sin conexión y con condiciones de red reproducibles.
+
+Estructura: {HTTP_CASSETTE_DIR}/{host}/{sha1(método + URL)}.json + .bin (cuerpo tal
+como llegó, con su Content-Encoding)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+from typing import Optional
+
+import httpx
+
+from src.config import (
+    HTTP_TRANSPORT_MODE, HTTP_CASSETTE_DIR, HTTP_REPLAY_LATENCIA_MS, HTTP_REPLAY_JITTER_MS,
+    HTTP_REPLAY_BYTES_SEG, HTTP_REPLAY_TASA_ERROR, HTTP_REPLAY_TASA_5XX, HTTP_REPLAY_404,
+    HTTP_REPLAY_SEMILLA,
+)
+
+logger = logging.getLogger("agroprice.transporte")
+
+MODOS = ("live", "record", "replay")
+
+# Contadores del modo replay (compartidos por todos los clientes del proceso)
+estadisticas = {"solicitudes": 0, "faltantes": 0, "errores": 0, "404": 0, "5xx": 0}
+
+
+# ============== CASSETTES ==============
+
+def _ruta(directorio: str, metodo: str, url: httpx.URL) -> str:
+    clave = hashlib.sha1(f"{metodo} {url}".encode()).hexdigest()[:24]
+    return os.path.join(directorio, url.host or "_", clave)
+
+
+def guardar_cassette(directorio: str, request: httpx.Request, status: int, headers: list, cuerpo: bytes):
+    """Grabar una respuesta (también sirve para armar cassettes sintéticos)"""
+    base = _ruta(directorio, request.method, request.url)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    meta = {"metodo": request.method, "url": str(request.url), "status": status, "headers": headers}
+    for sufijo, datos in ((".bin", cuerpo), (".json", json.dumps(meta, ensure_ascii=False, indent=1).encode())):
+        tmp = f"{base}{sufijo}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, base + sufijo)
+
+
+def _leer(directorio: str, metodo: str, url: httpx.URL) -> Optional[tuple[dict, bytes]]:
+    base = _ruta(directorio, metodo, url)
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(base + ".bin", "rb") as f:
+            return meta, f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _leer_respuesta(directorio: str, request: httpx.Request) -> Optional[tuple[dict, bytes]]:
+    """Respuesta grabada para el request. Un HEAD sin grabar se responde con los headers del GET."""
+    grabada = _leer(directorio, request.method, request.url)
+    if grabada is None and request.method == "HEAD":
+        grabada = _leer(directorio, "GET", request.url)
+    return grabada
+
+
+# ============== TRANSPORTES ==============
+
+class TransporteGrabador(httpx.AsyncBaseTransport):
+    """Pasa cada request al transporte real y graba la respuesta"""
+
+    def __init__(self, interno: httpx.AsyncBaseTransport, directorio: str):
+        self._interno = interno
+        self._directorio = directorio
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._interno.handle_async_request(request)
+        # Leer el stream crudo (sin decodificar Content-Encoding) para grabarlo tal cual
+        try:
+            cuerpo = b"".join([parte async for parte in response.stream])
+        finally:
+            await response.stream.aclose()
+        # Un 304 de un GET condicional no reemplaza la respuesta completa ya grabada
+        if response.status_code != 304:
+            await asyncio.to_thread(guardar_cassette, self._directorio, request, response.status_code,
+                                    response.headers.multi_items(), cuerpo)
+        return httpx.Response(response.status_code, headers=response.headers, content=cuerpo, request=request)
+
+    async def aclose(self):
+        await self._interno.aclose()
+
+
+class TransporteReplay(httpx.AsyncBaseTransport):
+    """Responde desde los cassettes, con condiciones de red simuladas.
+    Una URL sin grabar responde 404, como un boletín que ODEPA no publicó."""
+
+    def __init__(self, directorio: str, max_conexiones: Optional[int] = None,
+                 latencia_ms: float = 0, jitter_ms: float = 0, bytes_seg: float = 0,
+                 tasa_error: float = 0, tasa_5xx: float = 0, patrones_404: list[str] = (),
+                 semilla: Optional[str] = None):
+        self._directorio = directorio
+        # Con un transporte propio httpx no aplica sus Limits: emular el tope de conexiones
+        self._conexiones = asyncio.Semaphore(max_conexiones) if max_conexiones else None
+        self._latencia = latencia_ms / 1000
+        self._jitter = jitter_ms / 1000
+        self._bytes_seg = bytes_seg
+        self._tasa_error = tasa_error
+        self._tasa_5xx = tasa_5xx
+        self._patrones_404 = [re.compile(p.strip()) for p in patrones_404]
+        self._rng = random.Random(semilla)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._conexiones is None:
+            return await self._responder(request)
+        async with self._conexiones:
+            return await self._responder(request)
+
+    async def _responder(self, request: httpx.Request) -> httpx.Response:
+        estadisticas["solicitudes"] += 1
+        if self._latencia or self._jitter:
+            await asyncio.sleep(max(0.0, self._latencia + self._rng.uniform(-self._jitter, self._jitter)))
+
+        if self._rng.random() < self._tasa_error:
+            estadisticas["errores"] += 1
+            raise httpx.ConnectError("replay: error de conexión simulado", request=request)
+        url = str(request.url)
+        if any(p.search(url) for p in self._patrones_404):
+            estadisticas["404"] += 1
+            return httpx.Response(404, request=request)
+        if self._rng.random() < self._tasa_5xx:
+            estadisticas["5xx"] += 1
+            return httpx.Response(503, request=request)
+
+        grabada = await asyncio.to_thread(_leer_respuesta, self._directorio, request)
+        if grabada is None:
+            estadisticas["faltantes"] += 1
+            logger.debug(f"Replay: sin cassette para {request.method} {url}")
+            return httpx.Response(404, headers={"x-cassette": "faltante"}, request=request)
+
+        meta, cuerpo = grabada
+        headers = httpx.Headers(meta["headers"])
+        etag = headers.get("etag")
+        if etag and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"etag": etag}, request=request)
+        if request.method == "HEAD":
+            return httpx.Response(meta["status"], headers=headers, request=request)
+        if self._bytes_seg:
+            await asyncio.sleep(len(cuerpo) / self._bytes_seg)
+        return httpx.Response(meta["status"], headers=headers, content=cuerpo, request=request)
+
+
+def crear_transporte(http2: bool = False, limits: Optional[httpx.Limits] = None) -> Optional[httpx.AsyncBaseTransport]:
+    """Transporte según HTTP_TRANSPORT_MODE; None en modo live (el de httpx por defecto).
+    `http2` y `limits` son los del cliente: con un transporte explícito httpx no los aplica."""
+    if HTTP_TRANSPORT_MODE == "live":
+        return None
+    if HTTP_TRANSPORT_MODE == "record":
+        interno = httpx.AsyncHTTPTransport(http2=http2, limits=limits or httpx.Limits())
+        return TransporteGrabador(interno, HTTP_CASSETTE_DIR)
+    if HTTP_TRANSPORT_MODE == "replay":
+        return TransporteReplay(
+            HTTP_CASSETTE_DIR,
+            max_conexiones=limits.max_connections if limits else None,
+            latencia_ms=HTTP_REPLAY_LATENCIA_MS, jitter_ms=HTTP_REPLAY_JITTER_MS,
+            bytes_seg=HTTP_REPLAY_BYTES_SEG, tasa_error=HTTP_REPLAY_TASA_ERROR,
+            tasa_5xx=HTTP_REPLAY_TASA_5XX, patrones_404=HTTP_REPLAY_404, semilla=HTTP_REPLAY_SEMILLA,
+        )
+    raise ValueError(f"HTTP_TRANSPORT_MODE inválido: {HTTP_TRANSPORT_MODE!r} (opciones: {', '.join(MODOS)})")